@@ -15,6 +15,7 @@
 #              this will generate a file called "webex-space-archive-ALL.sh" and display the content.
 #       3. (optional) Edit the generated .sh script to remove spaces you don't want archived.
 #       3. Execute the generated script: sh webex-space-archive-ALL.sh
+#          _OR_ archive the spaces in parallel: python3 webex-space-archive.py webex-space-archive-ALL.sh
 # NOTE: that when the .sh file is executed it will use the standard .ini file for the configuration. (what to download, max files, etc)
 # Tested on Macos 14.6.1 and Python 3.12. 
 # 2025 -  DJ Uittenbogaard
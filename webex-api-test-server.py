@@ -0,0 +1,263 @@
+# GOAL: a local stand-in for the Webex API (https://webexapis.com/v1) to test the Webex Space Archive
+#       script without a Webex account and without rate limits: one space with generated messages,
+#       threads, mentions, attachments and avatars, plus a list of other spaces.
+#       Used to compare the speed of .ini settings (httpengine, downloadthreads, messagewindows).
+# version: 0.1
+# Space archive script:     https://github.com/DJF3/Webex-Message-space-archiver/
+# How to run it?
+#       1. In a terminal window:         python3 webex-api-test-server.py
+#          (optional) environment variables to change the test data and the server:
+#              TEST_PORT       port (default 8765)
+#              TEST_MESSAGES   number of messages in the space (default 500)
+#              TEST_STEP       max. minutes between 2 messages (default 600)
+#              TEST_ROOMS      number of other spaces (default 30)
+#              TEST_LATENCY    seconds of delay for every API call (default 0), like a real network
+#              TEST_429        part of the API calls that get a '429 Too Many Requests' (default 0, 0.1 = 10%)
+#              TEST_LAZYFILES  (any value) attachment content is created when it is downloaded (less memory)
+#              TEST_GZIP       'no': JSON responses are never compressed (default: gzip when the client asks)
+#              TEST_BACKLOG    listen backlog (default 5), increase for many connections at the same time
+#       2. In a second terminal window, let the archive script use this server:
+#              export WEBEX_API_URL='http://127.0.0.1:8765/v1'
+#              export WEBEX_ARCHIVE_TOKEN='any-token-of-more-than-50-characters-.......................'
+#          .ini 'myspaceid' of the test space:
+#              Y2lzY29zcGFyazovL3VzL1JPT00vMTIzNDU2Nzg5MC1hYmNkLWVmZ2gtaWprbC1tbm9wcXJzdHV2d3h5ejAx
+#          and run:                      python3 webex-space-archive.py
+# Extra URLs (not Webex):  /stats  requests per API path and number of connections,  /reset  clear the stats,
+#                          /hide?n=10  hide the 10 newest messages (test 'incremental': /hide?n=0 shows them again),
+#                          /join  add the space "Project Latecomer" (old activity) you joined just now.
+# The test data is the same every time (fixed random seed).
+# 2026 -  DJ Uittenbogaard
+#
+
+import datetime
+import gzip
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PORT = int(os.environ.get("TEST_PORT", "8765"))
+MESSAGES_COUNT = int(os.environ.get("TEST_MESSAGES", "500"))
+STEP = int(os.environ.get("TEST_STEP", "600"))
+ROOMS_COUNT = int(os.environ.get("TEST_ROOMS", "30"))
+LATENCY = float(os.environ.get("TEST_LATENCY", "0"))
+RATE429 = float(os.environ.get("TEST_429", "0"))
+LAZYFILES = os.environ.get("TEST_LAZYFILES", "") != ""
+GZIP = os.environ.get("TEST_GZIP", "").lower() != "no"
+BACKLOG = int(os.environ.get("TEST_BACKLOG", "5"))
+#_____ below: no changes needed
+
+BASE = f"http://127.0.0.1:{PORT}"
+ROOM = "Y2lzY29zcGFyazovL3VzL1JPT00vMTIzNDU2Nzg5MC1hYmNkLWVmZ2gtaWprbC1tbm9wcXJzdHV2d3h5ejAx"
+rnd = random.Random(42)
+
+#----- PEOPLE: 25 people, 'me' is the second one
+PEOPLE = []
+for i in range(25):
+    pid = "Y2lzY29zcGFyazovL3VzL1BFT1BMRS9wZXJzb24t%04d-aaaa-bbbb-cccc-ddddeeeeffff" % i
+    domain = "example.com" if i % 5 else "other.org"
+    PEOPLE.append({"id": pid, "emails": [f"user{i}@{domain}"], "displayName": f"User{i} Last{i}",
+                   "avatar": f"{BASE}/avatars/{i}~1600"})
+ME = PEOPLE[1]
+
+#----- MESSAGES (newest first, like the API) and FILES (id --> (filename, content))
+FILES = dict()
+start = datetime.datetime(2021, 1, 1, 8, 0, 0)
+created = list()
+t = start
+for i in range(MESSAGES_COUNT):
+    t = t + datetime.timedelta(minutes=rnd.randint(1, STEP))
+    created.append(t)
+messages = list()
+parents = list()
+for i in range(MESSAGES_COUNT):
+    person = rnd.choice(PEOPLE)
+    mid = "Y2lzY29zcGFyazovL3VzL01FU1NBR0UvbXNnLSUwNmQ" + "%06d" % i
+    m = {"id": mid, "roomId": ROOM, "roomType": "group",
+         "text": f"message {i} hello world lorem ipsum {rnd.choice(['alpha', 'beta', 'gamma', 'delta'])} https://cisco.com/x{i}",
+         "personId": person["id"], "personEmail": person["emails"][0],
+         "created": created[i].strftime("%Y-%m-%dT%H:%M:%S.") + "%03dZ" % rnd.randint(0, 999)}
+    if rnd.random() < 0.3:
+        m["html"] = f"<p>message <b>{i}</b> html</p>"
+    if parents and rnd.random() < 0.25:  # reply in a thread
+        m["parentId"] = rnd.choice(parents[-10:])
+    else:
+        parents.append(mid)
+    if rnd.random() < 0.15:  # 1-3 attachments, some of them the same file posted again
+        urls = list()
+        for k in range(rnd.randint(1, 3)):
+            fid = len(FILES)
+            ext = rnd.choice(["png", "jpg", "pdf", "docx", "txt"])
+            name = rnd.choice(["report", "image", "deck", "notes"]) + "." + ext
+            if rnd.random() < 0.7:
+                content = None if LAZYFILES else os.urandom(rnd.randint(100, 5000))
+            else:
+                content = b"same-content-" + name.encode()
+            FILES[str(fid)] = (name, content)
+            urls.append(f"{BASE}/v1/contents/{fid}")
+        m["files"] = urls
+    if rnd.random() < 0.05:
+        m["mentionedPeople"] = [PEOPLE[0]["id"]]
+        m["html"] = f'<p><spark-mention data-object-type="person" data-object-id="{PEOPLE[0]["id"]}">User0</spark-mention> hi</p>'
+    if rnd.random() < 0.05:
+        m["updated"] = (created[i] + datetime.timedelta(minutes=3)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    messages.append(m)
+MESSAGES = list(reversed(messages))
+POSITION = {m["id"]: i for i, m in enumerate(MESSAGES)}
+
+#----- ROOMS: the test space + other spaces
+ROOMS = [{"id": ROOM, "title": "Mock Space", "type": "group", "created": "2020-12-31T10:00:00.000Z",
+          "lastActivity": MESSAGES[0]["created"] if MESSAGES else "2021-01-01T00:00:00.000Z"}]
+for i in range(ROOMS_COUNT):
+    ROOMS.append({"id": "Y2lzY29zcGFyazovL3VzL1JPT00vcm9vbS0%04d" % i + "x" * 40,
+                  "title": f"Project {rnd.choice(['Apollo', 'Gemini', 'Mercury'])} {i}",
+                  "type": "group" if i % 3 else "direct",
+                  "lastActivity": (start + datetime.timedelta(days=i)).strftime("%Y-%m-%dT%H:%M:%S.000Z")})
+LATECOMER = {"id": "Y2lzY29zcGFyazovL3VzL1JPT00vbGF0ZWNvbWVy" + "z" * 40, "title": "Project Latecomer", "type": "group",
+             "created": "2019-05-01T10:00:00.000Z", "lastActivity": "2019-06-01T10:00:00.000Z"}
+JOINED = dict()  # room id --> membership created (joined) date
+
+STATS = dict()
+hidden = 0  # the newest messages that are not returned (/hide)
+statsLock = threading.Lock()
+
+
+class TestServer(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, code, body=b"", headers=None, head=False):
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def send_json(self, data, headers=None):
+        headers = dict(headers or {}, **{"Content-Type": "application/json"})
+        body = json.dumps(data).encode()
+        if GZIP and "gzip" in self.headers.get("Accept-Encoding", "") and len(body) > 1000:
+            body = gzip.compress(body, 5)
+            headers["Content-Encoding"] = "gzip"
+        self.send(200, body, headers)
+
+    def send_page(self, items, url, headers=None):  # 'max' + 'cursor' paging with a 'Link' header
+        query = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+        size = int(query.get("max", 100))
+        cursor = int(query.get("cursor", 0))
+        if cursor + size < len(items):
+            headers = dict(headers or {}, Link=f'<{url}max={size}&cursor={cursor + size}>; rel="next"')
+        self.send_json({"items": items[cursor:cursor + size]}, headers)
+
+    def do_HEAD(self):
+        self.handle_request(head=True)
+
+    def do_GET(self):
+        self.handle_request()
+
+    def handle_request(self, head=False):
+        global hidden
+        parts = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(parts.query))
+        path = parts.path
+        with statsLock:
+            key = ("HEAD " if head else "GET ") + "/".join(path.split("/")[:3])
+            STATS[key] = STATS.get(key, 0) + 1
+            STATS["conn:" + str(self.client_address[1])] = 1
+        #----- test URLs
+        if path == "/stats":
+            connections = sum(1 for key in STATS if key.startswith("conn:"))
+            return self.send_json({"requests": {k: v for k, v in STATS.items() if not k.startswith("conn:")}, "connections": connections})
+        if path == "/reset":
+            STATS.clear()
+            return self.send_json({})
+        if path == "/hide":
+            hidden = int(query.get("n", 0))
+            return self.send_json({})
+        if path == "/join":
+            if LATECOMER not in ROOMS:
+                ROOMS.append(LATECOMER)
+            JOINED[LATECOMER["id"]] = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            return self.send_json({})
+        #----- Webex API
+        if LATENCY:
+            time.sleep(LATENCY)
+        if RATE429 and path.startswith("/v1/") and rnd.random() < RATE429:
+            with statsLock:
+                STATS["429"] = STATS.get("429", 0) + 1
+            return self.send(429, b'{"message":"Too Many Requests"}', {"Retry-After": "1"}, head)
+        if path.startswith("/v1/") and not path.startswith("/v1/contents") and "Bearer" not in self.headers.get("Authorization", ""):
+            return self.send(401, b"no authorization")
+        if path.startswith("/avatars/") and self.headers.get("Authorization"):  # the token must not go to other hosts
+            with statsLock:
+                STATS["avatar-auth-leak"] = STATS.get("avatar-auth-leak", 0) + 1
+        if path == "/v1/people/me":
+            return self.send_json(ME)
+        if path == "/v1/people":
+            ids = query.get("id", "").split(",")
+            return self.send_json({"items": [p for p in PEOPLE if p["id"] in ids]})
+        if path.startswith("/v1/rooms/"):
+            room = next((r for r in ROOMS if r["id"] == path.split("/")[-1]), None)
+            return self.send_json(room) if room else self.send(404, b"not found")
+        if path == "/v1/rooms":
+            rooms = ROOMS
+            if query.get("sortBy") == "lastactivity":
+                rooms = sorted(ROOMS, key=lambda r: r["lastActivity"], reverse=True)
+            return self.send_page(rooms, f"{BASE}/v1/rooms?")
+        if path == "/v1/memberships" and "roomId" not in query:  # your memberships
+            items = [{"roomId": r["id"], "personId": ME["id"], "personEmail": ME["emails"][0],
+                      "created": JOINED.get(r["id"], "2020-01-01T00:00:00.000Z")} for r in ROOMS]
+            return self.send_page(items, f"{BASE}/v1/memberships?")
+        if path == "/v1/memberships":  # members of the test space
+            items = [{"personId": p["id"], "personEmail": p["emails"][0], "personDisplayName": p["displayName"]} for p in PEOPLE[:20]]
+            return self.send_page(items, f"{BASE}/v1/memberships?roomId={ROOM}&")
+        if path == "/v1/messages":
+            size = int(query.get("max", 50))
+            first = hidden
+            if "beforeMessage" in query:
+                first = POSITION.get(query["beforeMessage"], len(MESSAGES)) + 1
+            if "before" in query:  # first message older than 'before'
+                low, high = first, len(MESSAGES)
+                while low < high:
+                    middle = (low + high) // 2
+                    if MESSAGES[middle]["created"] < query["before"]:
+                        high = middle
+                    else:
+                        low = middle + 1
+                first = low
+            page = MESSAGES[first:first + size]
+            headers = dict()
+            if first + size < len(MESSAGES):
+                headers["Link"] = f'<{BASE}/v1/messages?roomId={ROOM}&max={size}&beforeMessage={page[-1]["id"]}>; rel="next"'
+            return self.send_json({"items": page}, headers)
+        if path.startswith("/v1/contents/"):
+            fid = path.split("/")[-1]
+            if fid not in FILES:
+                return self.send(404)
+            name, content = FILES[fid]
+            if content is None:
+                content = random.Random(fid).randbytes(1000)
+            contenttype = "image/png" if name.endswith(("png", "jpg")) else "application/octet-stream"
+            return self.send(200, content, {"Content-Disposition": f'attachment; filename="{name}"', "Content-Type": contenttype}, head)
+        if path.startswith("/avatars/"):
+            etag = '"av-' + path.split("/")[-1] + '"'
+            if self.headers.get("If-None-Match") == etag:
+                return self.send(304, b"", {"ETag": etag})
+            return self.send(200, b"\xff\xd8\xff" + path.encode() * 20,
+                             {"Content-Type": "image/jpeg", "ETag": etag, "Last-Modified": "Wed, 21 Oct 2020 07:28:00 GMT"})
+        return self.send(404, b"unknown")
+
+
+if __name__ == "__main__":
+    ThreadingHTTPServer.request_queue_size = BACKLOG
+    server = ThreadingHTTPServer(("127.0.0.1", PORT), TestServer)
+    server.daemon_threads = True
+    print(f"Webex API test server: {BASE}/v1   messages: {len(MESSAGES)}   attachments: {len(FILES)}", flush=True)
+    server.serve_forever()
@@ -22,10 +22,23 @@ import time
 import sys
 import os
 import shutil  # for file-download with requests
+import tempfile  # for the generated message HTML (streamed to disk)
 import math    # for converting bytes to KB/MB/GB
 import string
 from pathlib import Path
 import configparser
+import threading
+import concurrent.futures  # for parallel file downloads
+import email.utils  # for 'Retry-After' dates
+import hashlib  # file store: content hash of attachments
+import filecmp  # file store: is the stored file in the archive folder already
+import itertools  # file store: the download after its first chunk
+import sqlite3  # attachment info cache
+import urllib.parse  # htmlpages: links to page files
+import difflib  # space search: similar words (typo's)
+import asyncio  # httpengine = asyncio: all HTTP requests on one event loop
+import queue  # message windows: pages of the windows, in order
+import unicodedata  # space search: ignore accents
 try:
     assert sys.version_info[0:2] >= (3, 9)
 except:
@@ -36,6 +49,10 @@ try:
 except ImportError:
     print("\n\n **ERROR** Missing library 'requests'. Please visit the following site to\n           install 'requests': http://docs.python-requests.org/en/master/user/install/ \n\n")
     exit()
+try:
+    import aiohttp  # optional: HTTP client for 'httpengine = asyncio'
+except ImportError:
+    aiohttp = None
 
 
 #--------- DO NOT CHANGE ANYTHING BELOW ---------
@@ -44,19 +61,33 @@ __email__ = "dirkjanu@gmail.com"
 __version__ = "0.34"
 __copyright__ = "Copyright (c) 2026 DJ Uittenbogaard."
 __license__ = "Cisco Sample Code License, Version 1.1"
-sleepTime = 3
+sleepTime = 3                # seconds: wait after a 429 (rate limited) response without 'Retry-After' header
+httpMaxRetries = 8           # number of times an API call is retried after a 429 response
+webexApiUrl = os.environ.get("WEBEX_API_URL", "https://webexapis.com/v1").rstrip("/") + "/"  # env: test with a local server
+httpPoolSize = 10            # connections kept open to the Webex API (raised to 'downloadthreads'/'messagewindows' if needed)
+httpTimeout = (10, 60)       # seconds: (connect, read) for Webex API calls
 version = __version__
 printPerformanceReport = False
 printErrorList = True
 max_messages = 400
 currentDate = datetime.datetime.now().strftime("%x %X")
 configFile = "webexspacearchive-config.ini"
-myMemberList = dict()
 myErrorList = list()
-downloadAvatarCount = 1
+fileNameLock = threading.Lock()   # used by parallel file downloads to get a unique filename
+reservedFileNames = set()         # filenames claimed by running downloads (not on disk yet)
 originalConfigFile = configFile
+archiveStateFile = "webexspacearchive-state.json"  # incremental archive: state file in the archive folder
+fileCacheFile = "webexspacearchive-cache.db"        # attachment info cache (url --> filename, size, type)
+avatarCacheFolder = "webexspacearchive-avatars"     # avatar cache: default folder
+htmlStyleFile = "webexspacearchive.css"             # htmlpages: styling of all pages (in the archive folder)
+htmlScriptFile = "webexspacearchive.js"             # htmlpages: javascript of all pages
+searchIndexFile = "webexspacearchive-search.js"     # searchindex: search data of the archive (in the archive folder)
 myRoom = ""
 mySearch = ""
+renderArchive = ""    # render-only: path of a saved archive state file (.json), no API calls
+batchFile = ""        # batch mode: file with space ID's (.sh/.txt, see generate_space_batch.py)
+batchRooms = list()
+folderLock = threading.Lock()     # batch mode: used when a space gets its archive folder
 # below --> ini maxtotalmessages dateformat. Use %d,%m, %y and %Y, change the order / add slashes
 #           DON'T use dashes in the date format, only between 2 dates: WRONG: %d-%m-%Y
 #              correct examples: %Y/%m/%d, %y%m%d, %d%m%Y
@@ -80,6 +111,14 @@ if cl_count == 1 and "Y2lzY" in cl_args:
 elif cl_count == 1 and ".ini" in cl_args:
     configFile = cl_args
     print(f"    Alternate config file: {configFile}")
+#___ parameter: archive state file (render-only)
+elif cl_count == 1 and cl_args.endswith(".json"):
+    renderArchive = cl_args
+    print(f"    Render saved archive : {renderArchive}")
+#___ parameter: batch file with space ID's (archive all spaces in parallel)
+elif cl_count == 1 and cl_args.endswith((".sh", ".txt")):
+    batchFile = cl_args
+    print(f"    Batch file           : {batchFile}")
 #___ parameter: space name search argument
 elif cl_count == 1:
     mySearch = cl_args
@@ -94,7 +133,14 @@ if cl_count > 1 and ".ini" in cl_args:
         configFile = sys.argv[2].strip()
         myRoom = sys.argv[1].strip()
     print(f"    Alternate config file: {configFile}")
-    print(f"    Alternate Space ID   : {myRoom}")
+    if myRoom.endswith(".json"):
+        renderArchive, myRoom = myRoom, ""
+        print(f"    Render saved archive : {renderArchive}")
+    elif myRoom.endswith((".sh", ".txt")):
+        batchFile, myRoom = myRoom, ""
+        print(f"    Batch file           : {batchFile}")
+    else:
+        print(f"    Alternate Space ID   : {myRoom}")
 elif cl_count > 1:
     mySearch = cl_args
     print(f"    Searching for space containing '{cl_args}'")
@@ -176,6 +222,70 @@ if os.path.isfile("./" + configFile):
         else:
             print(f" ** config entries 'blurring' not in config file, please rename config.ini and run script to generate a new ini with the latest enhancements. Then update the new .ini file with your settings.\nFor now I will turn off blurring.")
             blurring = ""
+        if config.has_option('Archive Settings', 'incremental'):
+            incremental = config['Archive Settings']['incremental'].lower().strip()
+        else:
+            incremental = ""
+        if config.has_option('Archive Settings', 'savestate'):
+            saveState = config['Archive Settings']['savestate'].lower().strip()
+        else:
+            saveState = ""
+        if config.has_option('Archive Settings', 'downloadthreads'):
+            downloadThreads = config['Archive Settings']['downloadthreads'].strip()
+        else:
+            downloadThreads = ""
+        if config.has_option('Archive Settings', 'batchthreads'):
+            batchThreads = config['Archive Settings']['batchthreads'].strip()
+        else:
+            batchThreads = ""
+        if config.has_option('Archive Settings', 'ratelimit'):
+            rateLimit = config['Archive Settings']['ratelimit'].strip()
+        else:
+            rateLimit = ""
+        if config.has_option('Archive Settings', 'messagewindows'):
+            messageWindows = config['Archive Settings']['messagewindows'].strip()
+        else:
+            messageWindows = ""
+        if config.has_option('Archive Settings', 'httpengine'):
+            httpEngine = config['Archive Settings']['httpengine'].lower().strip()
+        else:
+            httpEngine = ""
+        if config.has_option('Archive Settings', 'filecache'):
+            fileCacheMode = config['Archive Settings']['filecache'].lower().strip()
+        else:
+            fileCacheMode = ""
+        if config.has_option('Archive Settings', 'filestore'):
+            fileStoreFolder = config['Archive Settings']['filestore'].strip()
+        else:
+            fileStoreFolder = ""
+        if config.has_option('Archive Settings', 'filestorelink'):
+            fileStoreLink = config['Archive Settings']['filestorelink'].lower().strip()
+        else:
+            fileStoreLink = ""
+        if config.has_option('Archive Settings', 'avatarcache'):
+            avatarCacheMode = config['Archive Settings']['avatarcache'].strip()
+        else:
+            avatarCacheMode = ""
+        if config.has_option('Archive Settings', 'htmlpages'):
+            htmlPages = config['Archive Settings']['htmlpages'].lower().strip()
+        else:
+            htmlPages = ""
+        if config.has_option('Archive Settings', 'searchindex'):
+            searchIndex = config['Archive Settings']['searchindex'].lower().strip()
+        else:
+            searchIndex = ""
+        if config.has_option('Archive Settings', 'archivedb'):
+            archiveDbFile = config['Archive Settings']['archivedb'].strip()
+        else:
+            archiveDbFile = ""
+        if config.has_option('Archive Settings', 'peoplecache'):
+            peopleCacheDays = config['Archive Settings']['peoplecache'].strip()
+        else:
+            peopleCacheDays = ""
+        if config.has_option('Archive Settings', 'roomindex'):
+            roomIndexMinutes = config['Archive Settings']['roomindex'].strip()
+        else:
+            roomIndexMinutes = ""
     except Exception as e:  # Error: keys missing from .ini file
         print(f" **ERROR** reading webexspacearchive-config.ini file settings.\n    ERROR: {e}")
         print("    Check if your .ini file contains the following keys: \n        download, sortoldnew, mytoken, myspaceid, outputfilename, useravatar, maxtotalmessages, outputjson")
@@ -202,7 +312,7 @@ else:
         config.set('Archive Settings', ';         "login, API reference, rooms, list all rooms", set "max" to 900 and run ')
         config.set('Archive Settings', 'myspaceid', '__YOUR_SPACE_ID_HERE__')
         config.set('Archive Settings', '; ')
-        config.set('Archive Settings', '; ')
+        config.set('Archive Settings', ';  ')
         config.set('Archive Settings', '; Download:  "no"      : (default) only show text "attached_file"')
         config.set('Archive Settings', ';            "info"    : file details (name & size = slower)')
         config.set('Archive Settings', ';            "images"  : download images only')
@@ -210,15 +320,15 @@ else:
         config.set('Archive Settings', ';     First try the script with downloadFiles set to "no".')
         config.set('Archive Settings', ';     Downloading many files can take more time')
         config.set('Archive Settings', 'download', 'no')
-        config.set('Archive Settings', ';  ')
-        config.set('Archive Settings', ';  ')
+        config.set('Archive Settings', ';   ')
+        config.set('Archive Settings', ';    ')
         config.set('Archive Settings', '; Download/show user avatar')
         config.set('Archive Settings', ';     no       - (default) show user initials (fast)')
         config.set('Archive Settings', ';     link     - link to avatar image - does need internet connection')
         config.set('Archive Settings', ';     download - download avatar images')
         config.set('Archive Settings', 'useravatar', 'no')
-        config.set('Archive Settings', ';   ')
-        config.set('Archive Settings', ';   ')
+        config.set('Archive Settings', ';     ')
+        config.set('Archive Settings', ';      ')
         config.set('Archive Settings', '; Max Messages: - Maximum number of messages you want to download.')
         config.set('Archive Settings', ';                 important if you want to limit archiving HUGE spaces')
         config.set('Archive Settings', ';               - 30d = 30 days, 365d = all msg from the last year')
@@ -226,26 +336,26 @@ else:
         config.set('Archive Settings', ';                 or 01052021-         = msg after May 1st -> keep the "-"!')
         config.set('Archive Settings', ';               - empty (default): last 1000 messages')
         config.set('Archive Settings', 'maxTotalMessages', '1000')
-        config.set('Archive Settings', ';    ')
-        config.set('Archive Settings', ';    ')
+        config.set('Archive Settings', ';       ')
+        config.set('Archive Settings', ';        ')
         config.set('Archive Settings', '; Output filename: Name of the generated HTML file. EMPTY: use the spacename')
         config.set('Archive Settings', ';      (downloadFiles enabled? Attachment foldername: same as spacename)')
         config.set('Archive Settings', 'outputfilename', '')
-        config.set('Archive Settings', ';     ')
-        config.set('Archive Settings', ';     ')
+        config.set('Archive Settings', ';         ')
+        config.set('Archive Settings', ';          ')
         config.set('Archive Settings', '; Sorting of messages. "yes" (default) means: newest message at the bottom,')
         config.set('Archive Settings', ';      just like in the Webex Message client. "no" = newest message at the top')
         config.set('Archive Settings', 'sortoldnew', 'yes')
-        config.set('Archive Settings', ';      ')
-        config.set('Archive Settings', ';      ')
+        config.set('Archive Settings', ';           ')
+        config.set('Archive Settings', ';            ')
         config.set('Archive Settings', '; Output message data to html _PLUS_ a .json and/or .txt file')
         config.set('Archive Settings', ';      no       (default) only generate .html file')
         config.set('Archive Settings', ';      yes/both output message data as .json and .txt file')
         config.set('Archive Settings', ';      json     output message data as .json file')
         config.set('Archive Settings', ';      txt      output message data as .txt file')
         config.set('Archive Settings', 'outputjson', 'no')
-        config.set('Archive Settings', ';       ')
-        config.set('Archive Settings', ';       ')
+        config.set('Archive Settings', ';             ')
+        config.set('Archive Settings', ';              ')
         config.set('Archive Settings', '; Manually configure Daylight Savings Time (summertime) start/stop dates')
         config.set('Archive Settings', '; __EMPTY:   (default) will use system information')
         config.set('Archive Settings', '; __usa:     dst_start: second week (2) sunday (7) of march (3)   --> 2,7,3')
@@ -258,12 +368,96 @@ else:
         config.set('Archive Settings', ';dst_stop  = L, 7, 10')
         config.set('Archive Settings', 'dst_start', '')
         config.set('Archive Settings', 'dst_stop', '')
-        config.set('Archive Settings', ';       ')
-        config.set('Archive Settings', ';       ')
+        config.set('Archive Settings', ';               ')
+        config.set('Archive Settings', ';                ')
         config.set('Archive Settings', '; Configure if you want the generated HTML file to have names blurred. You can still copy them but they appear blurred.')
         config.set('Archive Settings', ';   no / empty  = (default) no blurring')
         config.set('Archive Settings', ';   yes = blurring enabled')
         config.set('Archive Settings', 'blurring', '')
+        config.set('Archive Settings', ';                 ')
+        config.set('Archive Settings', ';                  ')
+        config.set('Archive Settings', '; Incremental archive: update the archive folder of the previous run instead of creating a new folder.')
+        config.set('Archive Settings', ';      Only messages newer than the previous run and their attachments are retrieved.')
+        config.set('Archive Settings', ';   no / empty  = (default) every run creates a new (complete) archive folder')
+        config.set('Archive Settings', ';   yes = incremental archive (state is saved in the archive folder: ' + archiveStateFile + ')')
+        config.set('Archive Settings', 'incremental', '')
+        config.set('Archive Settings', '; Save the archive state (' + archiveStateFile + ') to generate the HTML again later without API calls')
+        config.set('Archive Settings', ';   no / empty  = (default) only with incremental = yes, yes = save it in every archive folder')
+        config.set('Archive Settings', 'savestate', '')
+        config.set('Archive Settings', ';                   ')
+        config.set('Archive Settings', ';                    ')
+        config.set('Archive Settings', '; Number of attachments that are downloaded (or checked for "info") at the same time')
+        config.set('Archive Settings', ';   empty = (default) 8, maximum 32. Use 1 to download one file at a time')
+        config.set('Archive Settings', 'downloadthreads', '')
+        config.set('Archive Settings', ';                     ')
+        config.set('Archive Settings', ';                      ')
+        config.set('Archive Settings', '; Batch mode (parameter: a file with space IDs): number of spaces that are archived at the same time')
+        config.set('Archive Settings', ';   empty = (default) 4, maximum 16')
+        config.set('Archive Settings', 'batchthreads', '')
+        config.set('Archive Settings', ';                       ')
+        config.set('Archive Settings', ';                        ')
+        config.set('Archive Settings', '; Maximum number of Webex API calls per minute (all threads together)')
+        config.set('Archive Settings', ';   empty = (default) no limit, only wait when Webex asks for it (429 + Retry-After)')
+        config.set('Archive Settings', 'ratelimit', '')
+        config.set('Archive Settings', ';                         ')
+        config.set('Archive Settings', ';                          ')
+        config.set('Archive Settings', '; Message windows: split the time span of the messages in windows that are retrieved at the same time')
+        config.set('Archive Settings', ';   (for very large spaces). empty = (default) 1: one message page after the other, maximum 64')
+        config.set('Archive Settings', 'messagewindows', '')
+        config.set('Archive Settings', ';                           ')
+        config.set('Archive Settings', ';                            ')
+        config.set('Archive Settings', '; HTTP engine: requests = (default) a thread per request, asyncio = all requests on ONE event loop')
+        config.set('Archive Settings', ';      (uses aiohttp when installed, otherwise requests in a thread pool). aiohttp: aiohttp must be installed')
+        config.set('Archive Settings', ';      With asyncio or aiohttp, downloadthreads can be up to 512.')
+        config.set('Archive Settings', 'httpengine', '')
+        config.set('Archive Settings', ';                             ')
+        config.set('Archive Settings', ';                              ')
+        config.set('Archive Settings', '; Attachment info cache (' + fileCacheFile + '): filename, size and type of every attachment.')
+        config.set('Archive Settings', ';      Only attachments that are not in the cache are checked (in parallel, see downloadthreads).')
+        config.set('Archive Settings', ';   empty / yes = (default) use the cache, no = no cache, refresh = check all attachments again')
+        config.set('Archive Settings', 'filecache', '')
+        config.set('Archive Settings', ';                               ')
+        config.set('Archive Settings', ';                                ')
+        config.set('Archive Settings', '; File store: folder where every downloaded attachment is stored ONCE (by content).')
+        config.set('Archive Settings', ';      Archives link to the stored files, the same file in many messages/spaces is downloaded once.')
+        config.set('Archive Settings', ';   empty = (default) no file store, example: webex-file-store')
+        config.set('Archive Settings', 'filestore', '')
+        config.set('Archive Settings', '; How archives link to the file store: hardlink (default), symlink or copy')
+        config.set('Archive Settings', 'filestorelink', '')
+        config.set('Archive Settings', ';                                 ')
+        config.set('Archive Settings', ';                                  ')
+        config.set('Archive Settings', '; Avatar cache (useravatar = download): folder where every avatar image is saved ONCE.')
+        config.set('Archive Settings', ';      Archives link to the cached images (see filestorelink), changed avatars are downloaded again.')
+        config.set('Archive Settings', ';   empty = (default) ' + avatarCacheFolder + ', no = no cache, or a folder')
+        config.set('Archive Settings', 'avatarcache', '')
+        config.set('Archive Settings', ';                                   ')
+        config.set('Archive Settings', ';                                    ')
+        config.set('Archive Settings', '; People cache (' + fileCacheFile + '): name, email and avatar URL of people (avatars and names).')
+        config.set('Archive Settings', ';      Details older than this number of days are requested again.')
+        config.set('Archive Settings', ';   empty = (default) 7 days, 0 = no cache')
+        config.set('Archive Settings', 'peoplecache', '')
+        config.set('Archive Settings', ';                                     ')
+        config.set('Archive Settings', ';                                      ')
+        config.set('Archive Settings', '; Room index (' + fileCacheFile + '): your spaces, for the space search (script parameter).')
+        config.set('Archive Settings', ';      The index is used for this number of minutes, then spaces with new activity are requested.')
+        config.set('Archive Settings', ';   empty = (default) 60 minutes, 0 = no index (get all spaces for every search)')
+        config.set('Archive Settings', 'roomindex', '')
+        config.set('Archive Settings', ';                                       ')
+        config.set('Archive Settings', ';                                        ')
+        config.set('Archive Settings', '; HTML pages (large spaces): one HTML page per month or per number of messages, and an index page.')
+        config.set('Archive Settings', ';   empty / no = (default) one HTML file, month = page per month, 1000 = pages of (about) 1000 messages')
+        config.set('Archive Settings', 'htmlpages', '')
+        config.set('Archive Settings', ';                                         ')
+        config.set('Archive Settings', ';                                          ')
+        config.set('Archive Settings', '; Search box in the archive (' + searchIndexFile + ': index of all words in the messages)')
+        config.set('Archive Settings', ';   empty / no = (default) no search box, yes = search box')
+        config.set('Archive Settings', 'searchindex', '')
+        config.set('Archive Settings', ';                                           ')
+        config.set('Archive Settings', ';                                            ')
+        config.set('Archive Settings', '; Archive database (SQLite): all archived spaces, messages, people and files in one database')
+        config.set('Archive Settings', ';      with a full text index, to search in all your archives with SQL.')
+        config.set('Archive Settings', ';   empty = (default) no database, example: webex-archive.db')
+        config.set('Archive Settings', 'archivedb', '')
         with open('./' + configFile, 'w') as configfile:
             config.write(configfile)
     except Exception as e:  # Error creating config file
@@ -279,9 +473,11 @@ else:
 goExitError = "\n\n ------------------------------------------------------------------"
 if downloadFiles not in ['no', 'info', 'images', 'files', 'image', 'file']:
     goExitError += "\n   **ERROR** the 'download' setting must be: 'no', 'images' or 'files'"
-if not myToken or len(myToken) < 55:
+if renderArchive != "" and not os.path.isfile(renderArchive):
+    goExitError += f"\n   **ERROR** archive state file not found: {renderArchive}"
+if (not myToken or len(myToken) < 55) and renderArchive == "":
     goExitError += "\n   **ERROR** your token is not set or not long enough. You can also\n     create an environment variable \"WEBEX_ARCHIVE_TOKEN\" with your token."
-if len(myRoom) < 70 and mySearch == "":
+if len(myRoom) < 70 and mySearch == "" and renderArchive == "" and batchFile == "":
     goExitError += "\n   **ERROR** your space ID is not set or not long enough\n    RUN this script with a search parameter (space name) to find your space ID"
 if not outputFileName or len(outputFileName) < 2:
     outputFileName = ""
@@ -295,6 +491,86 @@ if outputToJson in ['txt', 'yes', 'both']:
     outputToText = True
 else:
     outputToText = False
+if incremental not in ['', 'no', 'yes']:
+    goExitError += "\n   **ERROR** the 'incremental' setting must be: 'no' or 'yes'"
+incremental = (incremental == "yes")
+if saveState not in ['', 'no', 'yes']:
+    goExitError += "\n   **ERROR** the 'savestate' setting must be: 'no' or 'yes'"
+saveState = (saveState == "yes") or incremental  # incremental archive: the next run needs the state
+if httpEngine in ['', 'requests']:
+    httpEngine = "requests"
+elif httpEngine not in ['asyncio', 'aiohttp']:
+    goExitError += "\n   **ERROR** the 'httpengine' setting must be empty, 'requests', 'asyncio' or 'aiohttp'"
+elif httpEngine == "aiohttp" and aiohttp is None:
+    goExitError += "\n   **ERROR** 'httpengine = aiohttp' needs the aiohttp library: pip install aiohttp"
+elif httpEngine == "asyncio" and aiohttp:
+    httpEngine = "aiohttp"
+maxDownloadThreads = 32 if httpEngine == "requests" else 512  # asyncio: threads only wait for the event loop
+if downloadThreads == "":
+    downloadThreads = 8
+elif not downloadThreads.isdigit() or not 1 <= int(downloadThreads) <= maxDownloadThreads:
+    goExitError += f"\n   **ERROR** the 'downloadthreads' setting must be empty or a number between 1 and {maxDownloadThreads}"
+else:
+    downloadThreads = int(downloadThreads)
+if batchThreads == "":
+    batchThreads = 4
+elif not batchThreads.isdigit() or not 1 <= int(batchThreads) <= 16:
+    goExitError += "\n   **ERROR** the 'batchthreads' setting must be empty or a number between 1 and 16"
+else:
+    batchThreads = int(batchThreads)
+if rateLimit == "":
+    rateLimit = 0
+elif not rateLimit.isdigit() or not 1 <= int(rateLimit) <= 6000:
+    goExitError += "\n   **ERROR** the 'ratelimit' setting must be empty or a number between 1 and 6000 (API calls per minute)"
+else:
+    rateLimit = int(rateLimit)
+if messageWindows == "":
+    messageWindows = 1
+elif not messageWindows.isdigit() or not 1 <= int(messageWindows) <= 64:
+    goExitError += "\n   **ERROR** the 'messagewindows' setting must be empty or a number between 1 and 64"
+else:
+    messageWindows = int(messageWindows)
+if fileCacheMode == "":
+    fileCacheMode = "yes"
+if fileCacheMode not in ['yes', 'no', 'refresh']:
+    goExitError += "\n   **ERROR** the 'filecache' setting must be empty, 'yes', 'no' or 'refresh'"
+if fileStoreLink == "":
+    fileStoreLink = "hardlink"
+if fileStoreLink not in ['hardlink', 'symlink', 'copy']:
+    goExitError += "\n   **ERROR** the 'filestorelink' setting must be empty, 'hardlink', 'symlink' or 'copy'"
+if htmlPages in ['', 'no']:
+    htmlPages = ""
+elif htmlPages != "month" and (not htmlPages.isdigit() or not 10 <= int(htmlPages) <= 1000000):
+    goExitError += "\n   **ERROR** the 'htmlpages' setting must be empty, 'no', 'month' or a number between 10 and 1000000 (messages per page)"
+elif htmlPages != "month":
+    htmlPages = int(htmlPages)
+if searchIndex not in ['', 'no', 'yes']:
+    goExitError += "\n   **ERROR** the 'searchindex' setting must be empty, 'no' or 'yes'"
+searchIndex = searchIndex == "yes"
+if peopleCacheDays == "":
+    peopleCacheDays = 7
+elif not peopleCacheDays.isdigit() or not 0 <= int(peopleCacheDays) <= 365:
+    goExitError += "\n   **ERROR** the 'peoplecache' setting must be empty or a number between 0 and 365 (days)"
+else:
+    peopleCacheDays = int(peopleCacheDays)
+if roomIndexMinutes == "":
+    roomIndexMinutes = 60
+elif not roomIndexMinutes.isdigit() or not 0 <= int(roomIndexMinutes) <= 525600:
+    goExitError += "\n   **ERROR** the 'roomindex' setting must be empty or a number between 0 and 525600 (minutes)"
+else:
+    roomIndexMinutes = int(roomIndexMinutes)
+if avatarCacheMode.lower() not in ['', 'yes']:
+    avatarCacheFolder = "" if avatarCacheMode.lower() == "no" else avatarCacheMode
+if batchFile != "":  # batch mode: get all space ID's from the file (for example: generated by generate_space_batch.py)
+    try:
+        with open(batchFile, encoding='utf-8') as f:
+            for roomId in re.findall(r'Y2lzY[A-Za-z0-9_=-]{60,}', f.read()):
+                if roomId not in batchRooms:
+                    batchRooms.append(roomId)
+        if len(batchRooms) == 0:
+            goExitError += f"\n   **ERROR** no space ID's found in batch file: {batchFile}"
+    except Exception as e:
+        goExitError += f"\n   **ERROR** can't read batch file: {batchFile}\n     {e}"
 if blurring == "yes":
     blurring = "_blur"
 else:
@@ -327,9 +603,8 @@ if len(goExitError) > 76:   # length goExitError = 66. If error: it is > 76 char
 # ----------------------------------------------------------------------------------------
 #   HTML header code containing images, styling info (CSS)
 # ----------------------------------------------------------------------------------------
-htmlheader = """<!DOCTYPE html><html><head><meta charset="utf-8"/>
-<script>
-function show(yearnr)
+#   htmlpages (.ini): the script and styling are in shared files (htmlScriptFile, htmlStyleFile)
+htmlscript = """function show(yearnr)
 {
     var myElement = 'expand year-' + yearnr;
     if (document.getElementById(myElement).style.display == 'none') {
@@ -358,9 +633,8 @@ function show_hideall() {
         }
     }
 }
-</script>
-<style type='text/css'>
-body { font-family: 'HelveticaNeue-Light', 'Helvetica Neue Light', 'Helvetica', 'Arial', 'Lucida Grande', 'sans-serif';}
+"""
+htmlstyle = """body { font-family: 'HelveticaNeue-Light', 'Helvetica Neue Light', 'Helvetica', 'Arial', 'Lucida Grande', 'sans-serif';}
 div[class^="expand"], div[class*=" year-"] {
     display:block;
 }
@@ -681,8 +955,23 @@ blockquote {
     display:inline-block;
     font-size:12px;
 }
-</style>
-</head><body><div id='top'></div><button onclick="topFunction()" id="myBtn" title="Go to top">&uarr;</button>
+"""
+htmlbodystart = """</head><body><div id='top'></div><button onclick="topFunction()" id="myBtn" title="Go to top">&uarr;</button>
+"""
+htmlheader = """<!DOCTYPE html><html><head><meta charset="utf-8"/>\n<script>\n""" + htmlscript + "</script>\n<style type='text/css'>\n" + htmlstyle + "</style>\n" + htmlbodystart
+# htmlpages: page navigation (index, previous & next page) and page list on the index page
+htmlpagestyle = """.css_pagenav {
+    font-size: 14px;
+    padding: 10px 30px;
+}
+.css_pagenav a, .css_pagelist a {
+    text-decoration: none;
+}
+.css_pagelist {
+    font-size: 12px;
+    padding: 0px 30px;
+    line-height: 20px;
+}
 """
 
 # ----------------------------------------------------------------------------------------
@@ -691,47 +980,1081 @@ blockquote {
 
 
 # ----------------------------------------------------------------------------------------
-# FUNCTION convert date to format displayed with each message. Used in HTML generation.
-#          This function checks the timezone difference between you and UTC and updates the
-#          message date/time so the actual times for your timezone are displayed.
-#          It also checks for DST
-def convertDate(inputdate, returnFormat):
-    # ______DST!_______
-    FMT = "%Y-%m-%dT%H:%M:%S.%fZ"  # UTC format stored in Webex cloud
-    inputdate = datetime.datetime.strptime(inputdate, FMT)
-    dstinfo = time.localtime(int(inputdate.timestamp()))
-    date_is_dst = bool(dstinfo.tm_isdst)
-    if date_is_dst:
-        offset = utc_offset['summer']
-    else:
-        offset = utc_offset['winter']
+# CLASS RateLimiter: ONE rate-limit governor for all Webex API calls of all threads.
+#       acquire() is called before every API call:
+#       - after a 429 response ALL threads wait until 'Retry-After' has passed (not only the thread that got it)
+#       - token bucket: max. 'perminute' API calls per minute (0 = no limit), bursts of max. 1 second of calls
+#       Counters (performance report): throttledCount (429 responses), throttledSeconds (waited for
+#       Retry-After), limitedSeconds (waited for the token bucket). Seconds are the sum of all threads.
+class RateLimiter:
+    def __init__(self, perminute):
+        self.rate = perminute / 60
+        self.capacity = max(self.rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.pausedUntil = 0.0
+        self.lock = threading.Lock()
+        self.requestCount = 0
+        self.throttledCount = 0
+        self.throttledSeconds = 0.0
+        self.limitedSeconds = 0.0
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = self.pausedUntil - now
+                if wait > 0:
+                    self.throttledSeconds += wait
+                elif self.rate == 0:
+                    self.requestCount += 1
+                    return
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.requestCount += 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                    self.limitedSeconds += wait
+            time.sleep(wait)
+
+    def throttle(self, retryAfter):
+        with self.lock:
+            self.throttledCount += 1
+            pausedUntil = time.monotonic() + retryAfter
+            if pausedUntil > self.pausedUntil:
+                self.pausedUntil = pausedUntil
+                print(f"          Code 429, all API calls wait {retryAfter:.0f} seconds", flush=True)
+
+    def report(self):
+        return f"{self.requestCount} API calls, {self.throttledCount} rate limited (429): waited {self.throttledSeconds:.1f} sec, ratelimit waited {self.limitedSeconds:.1f} sec"
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION returns the seconds to wait from a 429 response 'Retry-After' header (seconds or a date)
+def get_retry_after(response):
+    retryAfter = response.headers.get('Retry-After', "")
+    try:
+        return max(float(retryAfter), 0)
+    except ValueError:
+        pass
+    try:
+        return max((email.utils.parsedate_to_datetime(retryAfter) - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return sleepTime
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS with ONE shared requests.Session for all Webex API calls, file and avatar downloads.
+#       The session keeps connections open (keep-alive) so every call does not need a new
+#       TCP+TLS handshake. Relative urls ('messages', 'people/me') are prefixed with webexApiUrl.
+#       Webex API calls (auth=True) go through the RateLimiter and are retried after a 429 response.
+#       send() makes the request: AsyncWebexClient sends it with the asyncio engine.
+class WebexClient:
+    def __init__(self, token, poolsize, timeout, ratelimiter):
+        self.token = token
+        self.timeout = timeout
+        self.ratelimiter = ratelimiter
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=poolsize, pool_maxsize=poolsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({'content-type': 'application/json; charset=utf-8'})
+
+    def request(self, method, url, auth=True, **kwargs):
+        if not url.startswith("http"):
+            url = webexApiUrl + url
+        headers = dict(kwargs.pop('headers', {}))
+        if auth:
+            headers['Authorization'] = 'Bearer ' + self.token
+        kwargs.setdefault('timeout', self.timeout)
+        if not auth:  # not a Webex API call (avatars)
+            return self.send(method, url, headers, **kwargs)
+        for attempt in range(httpMaxRetries + 1):
+            self.ratelimiter.acquire()
+            response = self.send(method, url, headers, **kwargs)
+            if response.status_code != 429 or attempt == httpMaxRetries:
+                return response
+            retryafter = get_retry_after(response)
+            response.close()  # free the connection before waiting
+            self.ratelimiter.throttle(retryafter)
+
+    def send(self, method, url, headers, **kwargs):
+        return self.session.request(method, url, headers=headers, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS AsyncTransport: ONE asyncio event loop (in a background thread) for all HTTP requests of the
+#       script ('httpengine' = asyncio or aiohttp). Threads hand their request to the loop and
+#       wait for the response: all requests are in flight at the same time on the loop, max. 'limit'
+#       (ONE semaphore for all API calls, attachment and avatar downloads of all spaces).
+#       The HTTP client is a backend: AiohttpBackend (aiohttp installed) or RequestsBackend.
+#       A backend has open(), close() and request(method, url, headers, timeout) that returns a
+#       response with: status, headers, read(size) (b"" = end of the body) and release(reuse).
+class AsyncTransport:
+    def __init__(self, backend, limit):
+        self.backend = backend
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="webex-http", daemon=True).start()
+        self.semaphore = self.run(self.create_semaphore(limit))
+        self.run(self.backend.open())
+
+    async def create_semaphore(self, limit):  # created in the loop it's used by
+        return asyncio.Semaphore(limit)
+
+    def run(self, coroutine):  # called by any thread (not the loop): wait for the result of the coroutine
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def request(self, method, url, headers, timeout, allow_redirects, stream):
+        await self.semaphore.acquire()  # released by finish(): the body is read or the response is closed
+        try:
+            for redirects in range(11):
+                body = await self.backend.request(method, url, headers, timeout)
+                if not allow_redirects or body.status not in [301, 302, 303, 307, 308] or 'Location' not in body.headers or redirects == 10:
+                    break
+                await body.release(False)
+                location = urllib.parse.urljoin(url, body.headers['Location'])
+                if urllib.parse.urlsplit(location).netloc != urllib.parse.urlsplit(url).netloc:
+                    headers = {key: value for key, value in headers.items() if key.lower() != "authorization"}
+                if body.status == 303:
+                    method = "GET"
+                url = location
+        except BaseException:
+            self.semaphore.release()
+            raise
+        response = AsyncResponse(self, body, url)
+        if not stream and method != "HEAD":
+            response._content = await self.read_all(response)
+        elif method == "HEAD":
+            await self.finish(response, True)
+        return response
+
+    async def read(self, response, size):
+        try:
+            data = await response.body.read(size)
+        except BaseException:
+            await self.finish(response, False)
+            raise
+        if not data:
+            await self.finish(response, True)
+        return data
+
+    async def read_all(self, response):
+        chunks = list()
+        while True:
+            data = await self.read(response, 65536)
+            if not data:
+                return b"".join(chunks)
+            chunks.append(data)
+
+    async def finish(self, response, complete):  # the connection is used again when the body was read completely
+        if not response.finished:
+            response.finished = True
+            await response.body.release(complete)
+            self.semaphore.release()
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS AsyncResponse: a response of the AsyncTransport, used like a requests.Response (status_code,
+#       headers, json(), text, content, iter_content(), raise_for_status(), close(), 'with').
+#       stream=True: the body is read from the loop while it is iterated, like requests.
+class AsyncResponse:
+    def __init__(self, transport, body, url):
+        self.transport = transport
+        self.body = body
+        self.url = url
+        self.status_code = body.status
+        self.headers = body.headers
+        self.finished = False
+        self._content = None
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = b"" if self.finished else self.transport.run(self.transport.read_all(self))
+        return self._content
+
+    @property
+    def text(self):
+        charset = re.search(r'charset=([\w-]+)', self.headers.get('Content-Type', ""))
+        return self.content.decode(charset.group(1) if charset else "utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=65536):
+        if self._content is not None:
+            yield self._content
+            return
+        while True:
+            chunk = self.transport.run(self.transport.read(self, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+    def close(self):
+        if not self.finished:
+            self.transport.run(self.transport.finish(self, False))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS RequestsBackend: 'requests' client for the AsyncTransport when aiohttp is not installed. The
+#       requests (and the reads of their body) run in a thread pool of the event loop: the same limit,
+#       rate limiter and retries as aiohttp, but a thread for every request in flight.
+class RequestsBackend:
+    def __init__(self, poolsize):
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=poolsize, pool_maxsize=poolsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=poolsize, thread_name_prefix="webex-requests")
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        self.session.close()
+        self.executor.shutdown(wait=False)
+
+    async def request(self, method, url, headers, timeout):
+        response = await asyncio.get_running_loop().run_in_executor(
+            self.executor, lambda: self.session.request(method, url, headers=headers, timeout=timeout, allow_redirects=False, stream=True))
+        return RequestsResponse(self, response)
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS RequestsResponse: the body of a RequestsBackend response, read in the thread pool
+class RequestsResponse:
+    def __init__(self, backend, response):
+        self.backend = backend
+        self.response = response
+        self.status = response.status_code
+        self.headers = response.headers
+        self.chunks = None
+
+    async def read(self, size):
+        if self.chunks is None:  # decompressed like requests, errors are requests exceptions
+            self.chunks = self.response.iter_content(chunk_size=size)
+        return await asyncio.get_running_loop().run_in_executor(self.backend.executor, next, self.chunks, b"")
+
+    async def release(self, reuse):  # a completely read body: the connection goes back to the pool
+        await asyncio.get_running_loop().run_in_executor(self.backend.executor, self.response.close)
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS AiohttpBackend: aiohttp client for the AsyncTransport (optional library: pip install aiohttp)
+class AiohttpBackend:
+    def __init__(self, poolsize):
+        self.poolsize = poolsize
+
+    async def open(self):
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.poolsize), trust_env=True)  # proxy: like requests
+
+    async def close(self):
+        await self.session.close()
+
+    async def request(self, method, url, headers, timeout):
+        try:
+            response = await self.session.request(method, url, headers=headers, allow_redirects=False,
+                                                  timeout=aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1]))
+        except asyncio.TimeoutError:
+            raise requests.exceptions.Timeout(f"timeout: {url}")
+        except aiohttp.ClientError as e:
+            raise requests.exceptions.ConnectionError(f"{e}: {url}")
+        return AiohttpResponse(response)
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS AiohttpResponse: the body of an AiohttpBackend response
+class AiohttpResponse:
+    def __init__(self, response):
+        self.response = response
+        self.status = response.status
+        self.headers = requests.structures.CaseInsensitiveDict(response.headers)
+
+    async def read(self, size):
+        try:
+            return await self.response.content.read(size)
+        except asyncio.TimeoutError:
+            raise requests.exceptions.ReadTimeout("read timeout (body)")
+        except aiohttp.ClientError as e:
+            raise requests.exceptions.ChunkedEncodingError(f"body: {e}")
+
+    async def release(self, reuse):
+        if reuse:
+            self.response.release()
+        else:
+            self.response.close()
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS AsyncWebexClient: WebexClient ('httpengine' = asyncio/aiohttp) of which every request
+#       runs on the AsyncTransport event loop: same rate limiter, retries and responses as WebexClient.
+class AsyncWebexClient(WebexClient):
+    def __init__(self, token, poolsize, timeout, ratelimiter, backend):
+        self.token = token
+        self.timeout = timeout
+        self.ratelimiter = ratelimiter
+        self.transport = AsyncTransport(backend, poolsize)
+
+    def send(self, method, url, headers, params=None, stream=False, timeout=None, allow_redirects=None):
+        if params:
+            url += ("&" if "?" in url else "?") + urllib.parse.urlencode(params)
+        if not isinstance(timeout, tuple):
+            timeout = (timeout, timeout)
+        if headers.get('Accept-Encoding') == "":  # attachments: no compression
+            headers['Accept-Encoding'] = "identity"
+        headers.setdefault('content-type', 'application/json; charset=utf-8')
+        if allow_redirects is None:
+            allow_redirects = method != "HEAD"  # like requests
+        return self.transport.run(self.transport.request(method, url, headers, timeout, allow_redirects, stream))
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS ThreadOutput: replaces sys.stdout in batch mode. The output of a thread that called capture()
+#       is collected until release() (spaces that are archived at the same time would mix their
+#       progress output), the output of all other threads goes to the original stream.
+class ThreadOutput:
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def capture(self):
+        self.local.buffer = list()
+
+    def release(self):
+        output = "".join(self.local.buffer)
+        self.local.buffer = None
+        return output
+
+    def write(self, data):
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            return self.stream.write(data)
+        buffer.append(data)
+        return len(data)
+
+    def flush(self):
+        if getattr(self.local, 'buffer', None) is None:
+            self.stream.flush()
+
+    def follow(self, function):  # function runs in another thread: its output goes where the output of this thread goes
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            return function
+        def run(*args, **kwargs):
+            self.local.buffer = buffer
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.local.buffer = None
+        return run
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS ThreadPool: a ThreadPoolExecutor of which the tasks print like the thread that submitted them:
+#       in batch mode the output of the download (and other) threads of a space is captured with that space.
+class ThreadPool(concurrent.futures.ThreadPoolExecutor):
+    def submit(self, function, *args, **kwargs):
+        if isinstance(sys.stdout, ThreadOutput):
+            function = sys.stdout.follow(function)
+        return super().submit(function, *args, **kwargs)
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS Message: one message in a compact form, created for every page of messages that is retrieved.
+#       An API message is a dict with the room id/type and the long person id repeated in every message.
+#       A Message has fixed slots, the room and person strings are shared (interned) and the dates are
+#       integers (milliseconds since 1970, UTC). A field the API did not return is None, 'keys' has
+#       the fields of the API message in the API order (one tuple for all messages with the same
+#       fields), other fields (cards, group mentions) are in 'extra'. The HTML is generated with the
+#       attributes, msg['text'], msg.get() and 'html' in msg work like the API message: the dates are
+#       date strings again. to_dict(): the API message (JSON output, archive state file).
+messageKeys = dict()    # tuple of API fields --> (the same tuple: shared by all messages, the fields in 'extra')
+class Message:
+    __slots__ = ('id', 'roomId', 'roomType', 'personId', 'personEmail', 'created', 'updated', 'parentId',
+                 'text', 'html', 'files', 'mentionedPeople', 'keys', 'extra')
+    fields = frozenset(__slots__[0:12])
+    dates = frozenset(['created', 'updated'])
+
+    def __init__(self, message):
+        keys = tuple(message)
+        layout = messageKeys.get(keys)
+        if layout is None:  # a new combination of fields
+            layout = messageKeys.setdefault(keys, (keys, tuple(key for key in keys if key not in self.fields)))
+        self.keys = layout[0]
+        self.extra = {key: message[key] for key in layout[1]} if layout[1] else None
+        get = message.get
+        self.id = get('id')
+        self.roomId = intern_string(get('roomId'))
+        self.roomType = intern_string(get('roomType'))
+        self.personId = intern_string(get('personId'))
+        self.personEmail = intern_string(get('personEmail'))
+        self.parentId = get('parentId')
+        self.text = get('text')
+        self.html = get('html')
+        self.files = get('files')
+        mentioned = get('mentionedPeople')
+        self.mentionedPeople = [intern_string(personid) for personid in mentioned] if mentioned else mentioned
+        created = get('created')
+        self.created = None if created is None else self.read_date('created', created)
+        updated = get('updated')
+        self.updated = None if updated is None else self.read_date('updated', updated)
+
+    def read_date(self, key, date):
+        if not is_date_string(date):  # not the Webex format: keep the string for the API message
+            self.extra = self.extra or dict()
+            self.extra[key] = date
+        return date_ms(date)
+
+    def __getitem__(self, key):
+        if key not in self.keys:
+            raise KeyError(key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        value = getattr(self, key)
+        if key in self.dates and value is not None:
+            return date_string(value)
+        return value
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, key, default=None):
+        return self[key] if key in self.keys else default
+
+    def to_dict(self):
+        message = {key: getattr(self, key) for key in self.keys if key in self.fields}
+        for key in self.dates.intersection(message):
+            if message[key] is not None:
+                message[key] = date_string(message[key])
+        if self.extra:  # in the API order
+            message = {key: self.extra[key] if key in self.extra else message[key] for key in self.keys}
+        return message
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION returns the shared (interned) copy of a string: strings like person ids that are in many messages
+def intern_string(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS MessageStore: all messages, indexed ONCE after they were retrieved.
+#       byId: id --> message, byPersonId: personId --> [messages] (in the order they were added).
+class MessageStore:
+    def __init__(self, messages):
+        self.messages = messages
+        self.byId = dict()
+        self.byPersonId = dict()
+        for msg in messages:
+            self.add(msg, append=False)
+
+    def add(self, msg, append=True):
+        if append:
+            self.messages.append(msg)
+        # the first message with an id wins (a placeholder parent never replaces the real message)
+        self.byId.setdefault(msg.id, msg)
+        self.byPersonId.setdefault(msg.personId, []).append(msg)
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS CacheDatabase: ONE SQLite connection to the cache database (webexspacearchive-cache.db) for the
+#       FileCache, PeopleCache and RoomIndex, used by all threads (one at a time: lock). Another script
+#       that uses the database: wait up to busyTimeout seconds. The database is opened when it is used.
+#       A cache that can't be read or written is not an error that stops the script: after the first error
+#       (added to the error list) the database is not used anymore, query() returns no rows, write() False.
+class CacheDatabase:
+    busyTimeout = 30
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.db = None
+        self.failed = False
+
+    def error(self, e):
+        self.failed = True
+        myErrorList.append(f"class CacheDatabase can't use {self.filename}: {e}")
+
+    def query(self, sql, parameters=()):  # returns all rows
+        with self.lock:
+            if self.failed:
+                return []
+            try:
+                if self.db is None:
+                    self.db = sqlite3.connect(self.filename, timeout=self.busyTimeout, check_same_thread=False)
+                return self.db.execute(sql, parameters).fetchall()
+            except sqlite3.Error as e:
+                self.error(e)
+                return []
+
+    def write(self, *statements):  # (sql, parameters) or (sql, list of parameters), in ONE transaction
+        with self.lock:
+            if self.failed:
+                return False
+            try:
+                if self.db is None:
+                    self.db = sqlite3.connect(self.filename, timeout=self.busyTimeout, check_same_thread=False)
+                for sql, parameters in statements:
+                    if isinstance(parameters, list):
+                        self.db.executemany(sql, parameters)
+                    else:
+                        self.db.execute(sql, parameters)
+                self.db.commit()
+                return True
+            except sqlite3.Error as e:
+                if self.db is not None and self.db.in_transaction:
+                    self.db.rollback()
+                self.error(e)
+                return False
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS FileCache: attachment info that never changes (file URL --> filename, size, content type),
+#       saved in the cache database. Attachments in the cache don't need a HEAD request.
+#       New info is written to the database by save() (once per space, not for every file).
+#       refresh: get() finds nothing, all attachments are checked again and the cache is updated.
+class FileCache:
+    def __init__(self, database, refresh=False):
+        self.database = database
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.new = dict()
+        database.write(("CREATE TABLE IF NOT EXISTS files (url TEXT PRIMARY KEY, filename TEXT, size INTEGER, contenttype TEXT)", ()))
+
+    def get(self, url):  # returns (filename, size, contenttype) or None
+        if self.refresh:
+            return None
+        with self.lock:
+            if url in self.new:
+                return self.new[url]
+        rows = self.database.query("SELECT filename, size, contenttype FROM files WHERE url = ?", (url,))
+        return rows[0] if rows else None
+
+    def put(self, url, filename, size, contenttype):
+        with self.lock:
+            self.new[url] = (filename, size, contenttype)
+
+    def save(self):
+        with self.lock:
+            self.database.write(("INSERT OR REPLACE INTO files (url, filename, size, contenttype) VALUES (?, ?, ?, ?)",
+                                 [(url,) + info for url, info in self.new.items()]))
+            self.new = dict()
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS PeopleCache: person details (id --> displayName, email, avatar URL, fetched at) in the same
+#       SQLite database as the attachment info. People change their name and avatar: details older
+#       than 'peoplecache' days are fetched again. Counts how many people were found in the cache.
+class PeopleCache:
+    def __init__(self, database, days):
+        self.database = database
+        self.maxAge = days * 86400
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        database.write(("CREATE TABLE IF NOT EXISTS people (id TEXT PRIMARY KEY, displayname TEXT, email TEXT, avatar TEXT, fetched REAL)", ()))
+
+    def get(self, personids):  # returns a dictionary: person id --> person details (like the API: displayName, emails, avatar)
+        found = dict()
+        for personid in personids:
+            for row in self.database.query("SELECT displayname, email, avatar FROM people WHERE id = ? AND fetched > ?",
+                                           (personid, time.time() - self.maxAge)):
+                found[personid] = {"id": personid, "displayName": row[0], "emails": [row[1]]}
+                if row[2]:
+                    found[personid]['avatar'] = row[2]
+        with self.lock:
+            self.hits += len(found)
+            self.misses += len(personids) - len(found)
+        return found
+
+    def put(self, people):  # people: list of person details (API result)
+        now = time.time()
+        self.database.write(("INSERT OR REPLACE INTO people (id, displayname, email, avatar, fetched) VALUES (?, ?, ?, ?, ?)",
+                             [(person['id'], person.get('displayName', ""), (person.get('emails') or [""])[0], person.get('avatar', ""), now)
+                              for person in people if 'id' in person]))
+
+    def report(self):
+        total = self.hits + self.misses
+        return f"people cache: {self.hits} of {total} people found ({self.hits * 100 / total if total else 0:.0f}%)"
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS RoomIndex: all your spaces (id, title, type, lastActivity) in the same SQLite database as
+#       the attachment info, for the space search. The index is used for 'roomindex' minutes without
+#       any API call, then only spaces with new activity and spaces you joined since the previous check
+#       (your memberships) are requested. Every 'fullRefreshDays' the index is rebuilt: spaces you left
+#       are removed, titles without new activity are updated.
+class RoomIndex:
+    fullRefreshDays = 7
+
+    def __init__(self, database, minutes):
+        self.database = database
+        self.maxAge = minutes * 60
+        self.fetched = None  # the spaces to search when the index can't be used
+        database.write(("CREATE TABLE IF NOT EXISTS roomindex (id TEXT PRIMARY KEY, title TEXT, type TEXT, lastactivity TEXT, words TEXT)", ()),
+                       ("CREATE TABLE IF NOT EXISTS roomindex_state (name TEXT PRIMARY KEY, value REAL)", ()))
+
+    def state(self, name):
+        rows = self.database.query("SELECT value FROM roomindex_state WHERE name = ?", (name,))
+        return rows[0][0] if rows else 0
+
+    def refresh(self):
+        now = time.time()
+        statements = list()
+        allRooms = now - self.state('full') > self.fullRefreshDays * 86400
+        if allRooms:
+            print("    Room index: get all spaces", end='', flush=True)
+            rooms = get_rooms()
+            if rooms is None:
+                return
+            statements.append(("DELETE FROM roomindex", ()))
+            statements.append(("INSERT OR REPLACE INTO roomindex_state (name, value) VALUES ('full', ?)", (now,)))
+        elif now - self.state('checked') > self.maxAge:
+            newest = self.database.query("SELECT max(lastactivity) FROM roomindex")
+            print("    Room index: get spaces with new activity", end='', flush=True)
+            rooms = get_rooms((newest[0][0] or "") if newest else "")
+            if rooms is None:
+                return
+            # joined since the previous check (5 minutes earlier: clock difference), maybe without new activity
+            joined = get_joined_rooms(date_string(int((self.state('checked') - 300) * 1000)), {room['id'] for room in rooms})
+            if joined is None:
+                return
+            rooms += joined
+        else:
+            return
+        statements.append(("INSERT OR REPLACE INTO roomindex (id, title, type, lastactivity, words) VALUES (?, ?, ?, ?, ?)",
+                           [(room['id'], room.get('title', ""), room.get('type', ""), room.get('lastActivity', ""),
+                             room_search_words(room.get('title', ""))) for room in rooms]))
+        statements.append(("INSERT OR REPLACE INTO roomindex_state (name, value) VALUES ('checked', ?)", (now,)))
+        if not self.database.write(*statements):  # the index can't be saved: search without the index
+            self.no_index(rooms if allRooms else None)
+
+    def no_index(self, rooms=None):  # search these spaces (None: get all spaces), not the spaces in the index
+        if rooms is None:
+            print("    Room index: can't be used, get all spaces", end='', flush=True)
+            rooms = get_rooms() or list()
+        self.fetched = [dict(room, words=room_search_words(room.get('title', ""))) for room in rooms]
+
+    def rooms(self):
+        if self.fetched is None:
+            rows = self.database.query("SELECT id, title, type, lastactivity, words FROM roomindex")
+            if not self.database.failed:
+                return [{"id": row[0], "title": row[1], "type": row[2], "lastActivity": row[3], "words": row[4]} for row in rows]
+            self.no_index()
+        return self.fetched
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS ArchiveDatabase: all archived spaces in ONE SQLite database ('archivedb' in the .ini):
+#       rooms, messages, persons, files and memberships, and a full text index (FTS5) on the
+#       message text. Every page of messages is saved in one transaction while the messages are
+#       retrieved. Running the script again updates rows (upsert), nothing is added twice.
+#       An SQLite error (no FTS5, database locked by another program) turns the archive database off
+#       for the rest of the run (failed), the error is in the error list.
+class ArchiveDatabase:
+    busyTimeout = 30
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.db = None
+        self.failed = False
+        try:  # FTS5 (full text index) is not in every SQLite library
+            sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE fts5test USING fts5(text)")
+        except sqlite3.Error as e:
+            print(f" **ERROR** archive database '{filename}' needs the SQLite FTS5 extension, your Python SQLite library "
+                  f"(version {sqlite3.sqlite_version}) doesn't have it.\n           Install a newer Python version or remove 'archivedb' from the .ini file.")
+            self.error(e)
+            return
+        try:
+            self.db = sqlite3.connect(filename, timeout=self.busyTimeout, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode = WAL")  # readers (queries) don't block the archive script
+            self.db.execute("PRAGMA synchronous = NORMAL")
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS rooms (id TEXT PRIMARY KEY, title TEXT, type TEXT, created TEXT, lastactivity TEXT, archived TEXT);
+                CREATE TABLE IF NOT EXISTS persons (id TEXT PRIMARY KEY, email TEXT, displayname TEXT);
+                CREATE TABLE IF NOT EXISTS memberships (roomid TEXT, personid TEXT, email TEXT, displayname TEXT, PRIMARY KEY (roomid, email));
+                CREATE TABLE IF NOT EXISTS messages (nr INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, roomid TEXT, parentid TEXT,
+                    personid TEXT, personemail TEXT, created TEXT, updated TEXT, text TEXT, html TEXT, files INTEGER);
+                CREATE INDEX IF NOT EXISTS messages_room ON messages (roomid, created);
+                CREATE INDEX IF NOT EXISTS messages_person ON messages (personid, created);
+                CREATE INDEX IF NOT EXISTS messages_email ON messages (personemail, created);
+                CREATE INDEX IF NOT EXISTS messages_parent ON messages (parentid);
+                CREATE TABLE IF NOT EXISTS files (url TEXT PRIMARY KEY, messageid TEXT, roomid TEXT, filename TEXT, size INTEGER);
+                CREATE INDEX IF NOT EXISTS files_message ON files (messageid);
+                CREATE INDEX IF NOT EXISTS files_room ON files (roomid, filename);
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(text, content='messages', content_rowid='nr', tokenize='unicode61 remove_diacritics 2');
+                CREATE TRIGGER IF NOT EXISTS messages_insert AFTER INSERT ON messages BEGIN
+                    INSERT INTO messages_fts (rowid, text) VALUES (new.nr, new.text);
+                END;
+                CREATE TRIGGER IF NOT EXISTS messages_delete AFTER DELETE ON messages BEGIN
+                    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.nr, old.text);
+                END;
+                CREATE TRIGGER IF NOT EXISTS messages_update AFTER UPDATE OF text ON messages BEGIN
+                    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.nr, old.text);
+                    INSERT INTO messages_fts (rowid, text) VALUES (new.nr, new.text);
+                END;
+            """)
+            self.db.commit()
+        except sqlite3.Error as e:
+            print(f" **ERROR** can't use the archive database '{filename}': {e}")
+            self.error(e)
+
+    def error(self, e):
+        self.failed = True
+        myErrorList.append(f"class ArchiveDatabase can't use {self.filename}: {e}")
+
+    def write(self, *statements):  # (sql, parameters) or (sql, list of parameters), in ONE transaction
+        with self.lock:
+            if self.failed:
+                return False
+            try:
+                for sql, parameters in statements:
+                    if isinstance(parameters, list):
+                        self.db.executemany(sql, parameters)
+                    else:
+                        self.db.execute(sql, parameters)
+                self.db.commit()
+                return True
+            except sqlite3.Error as e:
+                if self.db.in_transaction:
+                    self.db.rollback()
+                self.error(e)
+                return False
+
+    def add_room(self, room):  # room details (API result)
+        self.write(("""INSERT INTO rooms (id, title, type, created, lastactivity, archived) VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (id) DO UPDATE SET title = excluded.title, type = excluded.type,
+                        lastactivity = excluded.lastactivity, archived = excluded.archived""",
+                    (room['id'], room.get('title', ""), room.get('type', ""), room.get('created', ""),
+                     room.get('lastActivity', ""), datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"))))
+
+    def add_messages(self, roomid, messages):  # one page of messages (API result): one transaction
+        self.write(("""INSERT INTO messages (id, roomid, parentid, personid, personemail, created, updated, text, html, files)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (id) DO UPDATE SET updated = excluded.updated, text = excluded.text,
+                        html = excluded.html, files = excluded.files
+                        WHERE messages.updated IS NOT excluded.updated OR messages.text IS NOT excluded.text""",
+                    [(msg['id'], roomid, msg.get('parentId'), msg.get('personId'), msg.get('personEmail'), msg['created'],
+                      msg.get('updated'), msg.get('text', ""), msg.get('html'), len(msg.get('files', [])))
+                     for msg in messages]))
+
+    def add_persons(self, persons):  # persons: list of (id, email, displayName)
+        self.write(("""INSERT INTO persons (id, email, displayname) VALUES (?, ?, ?)
+                        ON CONFLICT (id) DO UPDATE SET email = excluded.email, displayname = excluded.displayname""",
+                    [person for person in persons if person[0]]))
+
+    def add_memberships(self, roomid, memberships):  # the current members of the space (API result)
+        self.write(("DELETE FROM memberships WHERE roomid = ?", (roomid,)),
+                   ("INSERT OR REPLACE INTO memberships (roomid, personid, email, displayname) VALUES (?, ?, ?, ?)",
+                    [(roomid, member.get('personId'), member.get('personEmail'), member.get('personDisplayName'))
+                     for member in memberships]))
+
+    def add_files(self, roomid, messages, fileinfo):  # attachment URL --> message, filename and size (if known)
+        self.write(("""INSERT INTO files (url, messageid, roomid, filename, size) VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (url) DO UPDATE SET filename = excluded.filename, size = excluded.size
+                        WHERE excluded.filename IS NOT NULL""",
+                    [(url, msg['id'], roomid) + (tuple(fileinfo[url]) if url in fileinfo else (None, None))
+                     for msg in messages for url in msg.get('files', [])]))
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS FileStore: content-addressed store for downloaded attachments ('filestore' in the .ini).
+#       Every file is stored ONCE as <folder>/<hash[0:2]>/<sha256 hash>.<extension>, archive folders
+#       get a hardlink, (relative) symlink or copy of the stored file.
+#       The index (<folder>/filestore-index.json) finds stored files BEFORE they are downloaded:
+#       by file URL, or by filename + size (the same file posted again, or in another space): a file
+#       found by name + size is only used when the start of its download has the same content.
+class FileStore:
+    def __init__(self, folder, linkmode):
+        self.folder = folder
+        self.linkmode = linkmode
+        self.indexFile = os.path.join(folder, "filestore-index.json")
+        self.lock = threading.Lock()
+        self.urls = dict()   # file URL --> stored file (relative to folder)
+        self.names = dict()  # "filename|size" --> stored file
+        self.nameLocks = dict()  # "filename|size" --> lock: one download of the same file at the same time
+        os.makedirs(os.path.join(folder, "tmp"), exist_ok=True)
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.indexFile, encoding='utf-8') as f:
+                index = json.load(f)
+            self.urls.update(index.get('urls', {}))
+            self.names.update(index.get('names', {}))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            myErrorList.append(f"class FileStore can't read {self.indexFile}: {e}")
+
+    def save(self):  # merge with the index on disk: another script may use the same store
+        with self.lock:
+            self.load()
+            with open(self.indexFile + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump({"urls": self.urls, "names": self.names}, f)
+            os.replace(self.indexFile + ".tmp", self.indexFile)
+
+    def name_lock(self, filename, size):
+        with self.lock:
+            return self.nameLocks.setdefault(f"{filename}|{size}", threading.Lock())
+
+    def find(self, url):  # the stored file of this URL: returns the path or None
+        with self.lock:
+            stored = self.urls.get(url)
+        if stored and os.path.isfile(os.path.join(self.folder, stored)):
+            return os.path.join(self.folder, stored)
+        return None
+
+    def find_name(self, filename, size):  # a stored file with the same name + size (maybe another file!): path or None
+        with self.lock:
+            stored = self.names.get(f"{filename}|{size}")
+        if stored and os.path.isfile(os.path.join(self.folder, stored)):
+            return os.path.join(self.folder, stored)
+        return None
+
+    def temp_path(self):  # downloads go to a temporary file in the store, add() moves them
+        handle, path = tempfile.mkstemp(dir=os.path.join(self.folder, "tmp"))
+        os.close(handle)
+        return path
+
+    def add(self, temppath, filehash, url, filename, size):  # returns (path of the stored file, was it stored already?)
+        extension = os.path.splitext(filename)[1].lower()
+        stored = filehash[0:2] + "/" + filehash + extension
+        storedpath = os.path.join(self.folder, stored)
+        with self.lock:
+            duplicate = os.path.isfile(storedpath)
+            if duplicate:
+                os.remove(temppath)
+            else:
+                os.makedirs(os.path.dirname(storedpath), exist_ok=True)
+                os.replace(temppath, storedpath)
+            self.urls[url] = stored
+            self.names[f"{filename}|{size}"] = stored
+        return storedpath, duplicate
+
+    def link(self, storedpath, target):  # put the stored file in the archive folder
+        link_file(storedpath, target, self.linkmode)
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION put a stored file (file store, avatar cache) in an archive folder.
+#          linkmode: hardlink (if that fails: symlink), symlink (if that fails: copy) or copy
+def link_file(storedpath, target, linkmode):
+    if linkmode == "hardlink":
+        try:
+            os.link(storedpath, target)
+            return
+        except OSError:  # other filesystem (or not supported): try a symlink
+            pass
+    if linkmode in ['hardlink', 'symlink']:
+        try:
+            os.symlink(os.path.relpath(storedpath, os.path.dirname(target)), target)
+            return
+        except OSError:  # symlinks not allowed (Windows without developer mode): copy
+            pass
+    shutil.copy2(storedpath, target)
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS AvatarCache: shared folder with the avatar image of every person ('avatarcache' in the .ini),
+#       <folder>/<person id>.jpg. Archive folders get a link to (or copy of) the cached image.
+#       The index (<folder>/avatars.json) has the avatar URL, ETag and Last-Modified of every image:
+#       a cached avatar is checked with a conditional request, Webex only sends it when it changed.
+#       Every person is checked once per run (batch mode: all spaces share this cache).
+class AvatarCache:
+    def __init__(self, folder, linkmode):
+        self.folder = folder
+        self.linkmode = linkmode
+        self.indexFile = os.path.join(folder, "avatars.json")
+        self.lock = threading.Lock()
+        self.people = dict()        # person id --> {"url": avatar URL, "etag": ETag, "modified": Last-Modified}
+        self.checked = set()        # person ids checked (or downloaded) during this run
+        self.personLocks = dict()   # person id --> lock: one thread checks a person, others wait for it
+        os.makedirs(folder, exist_ok=True)
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.indexFile, encoding='utf-8') as f:
+                self.people.update(json.load(f).get('people', {}))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            myErrorList.append(f"class AvatarCache can't read {self.indexFile}: {e}")
+
+    def save(self):  # merge with the index on disk: another script may use the same cache
+        with self.lock:
+            newPeople = self.people
+            self.people = dict()
+            self.load()
+            self.people.update(newPeople)
+            with open(self.indexFile + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump({"people": self.people}, f)
+            os.replace(self.indexFile + ".tmp", self.indexFile)
+
+    def person_lock(self, personid):
+        with self.lock:
+            return self.personLocks.setdefault(personid, threading.Lock())
+
+    def get(self, personid, url):  # returns the cached avatar info, None if not cached (or the URL changed)
+        with self.lock:
+            cached = self.people.get(personid)
+        if cached and cached.get('url') == url and os.path.isfile(self.path(personid)):
+            return cached
+        return None
+
+    def put(self, personid, url, etag, modified):
+        with self.lock:
+            self.people[personid] = {"url": url, "etag": etag, "modified": modified}
+            self.checked.add(personid)
+
+    def path(self, personid):
+        return os.path.join(self.folder, "".join(re.findall(r'[A-Za-z0-9]+', personid)) + ".jpg")
+
+    def link(self, personid, target):  # put the cached avatar in the archive folder
+        if os.path.lexists(target):  # incremental archive: replace the previous avatar
+            os.remove(target)
+        link_file(self.path(personid), target, self.linkmode)
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION parse a Webex date string ("2021-05-04T13:50:12.345Z", UTC) into a datetime. Every date
+#          string is parsed ONCE, the result is cached: message dates are used for threading,
+#          statistics and display. fromisoformat is much faster than strptime.
+#          Message dates (integers: milliseconds since 1970) are not cached: no dict entry per message.
+parsedDates = dict()    # Webex date string --> datetime (UTC)
+epochDate = datetime.datetime(1970, 1, 1)
+oneMillisecond = datetime.timedelta(milliseconds=1)
+def parse_date(inputdate):
+    if type(inputdate) is int:
+        return epochDate + oneMillisecond * inputdate
+    parsed = parsedDates.get(inputdate)
+    if parsed is None:
+        try:
+            if inputdate[-1:] != "Z":
+                raise ValueError
+            parsed = datetime.datetime.fromisoformat(inputdate[:-1])
+        except ValueError:
+            parsed = datetime.datetime.strptime(inputdate, "%Y-%m-%dT%H:%M:%S.%fZ")
+        parsedDates[inputdate] = parsed
+    return parsed
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION Webex date string --> milliseconds since 1970 (UTC), the dates of a Message. Not cached.
+def date_ms(inputdate):
+    try:
+        if inputdate[-1:] != "Z":
+            raise ValueError
+        parsed = datetime.datetime.fromisoformat(inputdate[:-1])
+    except ValueError:
+        parsed = datetime.datetime.strptime(inputdate, "%Y-%m-%dT%H:%M:%S.%fZ")
+    return (parsed - epochDate) // oneMillisecond
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION milliseconds since 1970 (UTC) --> Webex date string ("2021-05-04T13:50:12.345Z")
+def date_string(inputdate):
+    return (epochDate + oneMillisecond * inputdate).isoformat(timespec='milliseconds') + "Z"
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION True when the date string is in the Webex format: date_string(date_ms(x)) returns the same string
+def is_date_string(inputdate):
+    return len(inputdate) == 24 and inputdate[10] == "T" and inputdate[19] == "." and inputdate[-1] == "Z"
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION returns the message date in your local time (cached). This function checks the timezone
+#          difference between you and UTC and updates the message date/time so the actual times
+#          for your timezone are displayed. It also checks for DST.
+#          No DST configured: the summer/winter time check is cached per 15 minutes (DST changes
+#          at a whole quarter), so the system time functions are not called for every message.
+#          Message dates (integers) are not cached: no dict entry per message.
+localDates = dict()     # Webex date string --> datetime (local time)
+dstBuckets = dict()     # date (15 minute block, milliseconds since 1970) --> True: summer time, False: winter time
+def local_date(inputdate):
+    localdate = localDates.get(inputdate)
+    if localdate is not None:
+        return localdate
+    utcdate = parse_date(inputdate)
     # ---------- NO DST CONFIGURED --------------------
     if dst_start == "":
-        dateMSGnew = inputdate + datetime.timedelta(hours=offset, minutes=0)
+        if type(inputdate) is int:
+            bucket = inputdate - inputdate % 900000     # milliseconds: 15 minutes
+        else:
+            bucket = (utcdate - epochDate) // oneMillisecond // 900000 * 900000
+        date_is_dst = dstBuckets.get(bucket)
+        if date_is_dst is None:
+            date_is_dst = bool(time.localtime(int(parse_date(bucket).timestamp())).tm_isdst)
+            dstBuckets[bucket] = date_is_dst
+        if date_is_dst:
+            offset = utc_offset['summer']
+        else:
+            offset = utc_offset['winter']
     else:  # ---------- DST CONFIGURED --------------------
-        if inputdate > dst_table[inputdate.year][0] and inputdate < dst_table[inputdate.year][1]:  # = SUMMER
-            dateMSGnew = inputdate + datetime.timedelta(hours=utc_offset['summer'], minutes=0)
+        if utcdate > dst_table[utcdate.year][0] and utcdate < dst_table[utcdate.year][1]:  # = SUMMER
+            offset = utc_offset['summer']
         else:
-            dateMSGnew = inputdate + datetime.timedelta(hours=utc_offset['winter'], minutes=0)  # = WINTER
-    return datetime.datetime.strftime(dateMSGnew, returnFormat)
+            offset = utc_offset['winter']  # = WINTER
+    localdate = utcdate + datetime.timedelta(hours=offset, minutes=0)
+    if type(inputdate) is not int:
+        localDates[inputdate] = localdate
+    return localdate
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION convert date to format displayed with each message. Used in HTML generation.
+def convertDate(inputdate, returnFormat):
+    return local_date(inputdate).strftime(returnFormat)
 
 
 # ----------------------------------------------------------------------------------------
 # FUNCTION used in the lay-out and statistics HTML generation.
-#          takes a date and outputs "2018" (year), "Feb" (short month), "2" (month number)
+#          takes a date and outputs "2018" (year), "Feb" (short month), "02" (month number)
+monthNames = dict()     # "2018-02" (message date: (2018, 2)) --> ("2018", "Feb", "02")
 def get_monthday(inputdate):
-    myyear = datetime.datetime.strptime(inputdate, "%Y-%m-%dT%H:%M:%S.%fZ").strftime("%Y")
-    mymonth = datetime.datetime.strptime(inputdate, "%Y-%m-%dT%H:%M:%S.%fZ").strftime("%b")
-    mymonthnr = datetime.datetime.strptime(inputdate, "%Y-%m-%dT%H:%M:%S.%fZ").strftime("%m")
-    return myyear, mymonth, mymonthnr
+    if type(inputdate) is int:
+        utcdate = parse_date(inputdate)
+        monthKey = (utcdate.year, utcdate.month)
+    else:
+        monthKey = inputdate[0:7]
+    month = monthNames.get(monthKey)
+    if month is None:
+        month = tuple(parse_date(inputdate).strftime("%Y|%b|%m").split("|"))
+        monthNames[monthKey] = month
+    return month
 
 
 # ----------------------------------------------------------------------------------------
 # FUNCTION that returns the time difference between 2 dates in seconds
 #           (to check if msgs from 1 author were send within 60 seconds: no new msg header)
 def timedifference(newdate, previousdate):
-    FMT = "%Y-%m-%dT%H:%M:%S.%fZ"
-    tdelta = datetime.datetime.strptime(newdate, FMT) - datetime.datetime.strptime(previousdate, FMT)
+    tdelta = parse_date(newdate) - parse_date(previousdate)
     return tdelta.seconds
 
 
@@ -739,8 +2062,7 @@ def timedifference(newdate, previousdate):
 # FUNCTION that returns the time difference between the msg-date and today (# of days)
 #           (used when setting max messages to XX days instead of number of msgs)
 def timedifferencedays(msgdate):
-    FMT = "%Y-%m-%dT%H:%M:%S.%fZ"
-    tdelta = datetime.datetime.today() - datetime.datetime.strptime(msgdate, FMT)
+    tdelta = datetime.datetime.today() - parse_date(msgdate)
     return tdelta.days
 
 
@@ -779,13 +2101,12 @@ def convertMarkdownURL(msgtext, whichreplace):
 
 # ----------------------------------------------------------------------------------------
 # FUNCTION that retrieves a list of Space members (displayName + email address)
-def get_memberships(mytoken, myroom, maxmembers):
-    headers = {'Authorization': 'Bearer ' + mytoken, 'content-type': 'application/json; charset=utf-8'}
+def get_memberships(myroom, maxmembers):
     payload = {'roomId': myroom, 'max': 400}
     resultjson = list()
     while True:
         try:
-            result = requests.get('https://webexapis.com/v1/memberships', headers=headers, params=payload)
+            result = webex.get('memberships', params=payload)
             if "Link" in result.headers:  # there's MORE members
                 headerLink = result.headers["Link"]
                 myCursor = headerLink[headerLink.find("cursor=") + len("cursor="):headerLink.rfind(">")]
@@ -794,92 +2115,254 @@ def get_memberships(mytoken, myroom, maxmembers):
                 continue
             else:
                 resultjson += result.json()["items"]
-                print(f"          Number of space members: {len(resultjson)}")
                 break
         except requests.exceptions.RequestException as e:  # For problems like SSLError/InvalidURL
-            if e.status_code == 429:
-                print("          Code 429, waiting for : " + str(sleepTime) + " seconds: ", end='', flush=True)
-                for x in range(0, sleepTime):
-                    time.sleep(1)
-                    print(".", end='', flush=True)  # Progress indicator
-            else:
-                print(f" *** ERROR *** getting space members. Error message: {result.status_code}\n {e}")
-                break
+            print(f" *** ERROR *** getting space members. Error message: {e}")
+            break
         except Exception as e:
             print(f" *** ERROR *** getting space members. Error message: {e}")
+            break
     return resultjson
 
 
 # ----------------------------------------------------------------------------------------
-# FUNCTION that retrieves all space messages - testing error 429 catching
-def get_messages(mytoken, myroom, myMaxMessages):
-    global maxTotalMessages
-    headers = {'Authorization': 'Bearer ' + mytoken, 'content-type': 'application/json; charset=utf-8'}
+# FUNCTION generator: the pages of messages of a space, newest first (one API call per page).
+#          Yields (messages, more): messages are Message records (converted per page), more = True when there
+#          are older messages. Stops at an API error (raiseErrors: the error is raised instead).
+#          before: only messages created before this date (the first page starts there)
+def get_message_pages(myroom, myMaxMessages, before="", raiseErrors=False):
     payload = {'roomId': myroom, 'max': myMaxMessages}
-    resultjsonmessages = list()
-    messageCount = 0
-    progress_counter = 0
+    if before:
+        payload['before'] = before
     while True:
         try:
-            result = requests.get('https://webexapis.com/v1/messages', headers=headers, params=payload)
-
-            if result.status_code != 200 and result.status_code != 429:
+            result = webex.get('messages', params=payload)
+            if result.status_code != 200:
                 print(f" ** ERROR ** Problem retrieving specific messages. Try to lower\n                the max_messages variable in the .py and .ini file until it works\nERROR msg: {result.text}\nERROR code: {result.status_code}")
                 exit()
-
-            messages = result.json()["items"]
-            # Abort if no messages were retrieved
-            if not messages:
-                break
-            messageCount += len(messages)
-            progress_counter += 1
-            sys.stdout.write('\r')
-            sys.stdout.write("          %d %s " % (messageCount, '*' * progress_counter))
-            sys.stdout.flush()
-            if "Link" in result.headers and messageCount < maxTotalMessages:  # there's MORE messages
-                resultjsonmessages = resultjsonmessages + messages
-                # When retrieving multiple batches _check_ if the last message retrieved
-                #      is _OLDER_ than the configured max msg age (in the .ini). If yes: trim results to the max age.
-                if msgMaxAge != 0:
-                    msgAge = timedifferencedays(messages[-1]["created"])
-                    if msgAge > msgMaxAge:
-                        print("          max messages reached (>" + str(msgMaxAge) + " days old)")
-                        # NOW I set maxTotalMessages to the last msg index that should be included, based on msg age in days.
-                        maxTotalMessages = next((index for (index, d) in enumerate(resultjsonmessages) if timedifferencedays(d["created"]) > msgMaxAge), 99999)
-                        break
-                myBeforeMessage = result.headers.get('Link').split("beforeMessage=")[1].split(">")[0]
-                payload = {'roomId': myroom, 'max': myMaxMessages, 'beforeMessage': myBeforeMessage}
-                continue
-            else:
-                resultjsonmessages = resultjsonmessages + messages
-                if msgMaxAge != 0:
-                    msgAge = timedifferencedays(messages[-1]["created"])
-                    lastMsgLocation = next((index for (index, d) in enumerate(resultjsonmessages) if timedifferencedays(d["created"]) > msgMaxAge), 99999)
-                    maxTotalMessages = lastMsgLocation
-                print(f" FINISHED total messages: {messageCount}")
-                if "Link" in result.headers:   # There ARE more messages but the maxTotalMessages has been reached
-                    print(f"          Reached configured maximum # messages ({maxTotalMessages})")
-                break
+            messages = list(map(Message, result.json()["items"]))
         except requests.exceptions.RequestException as e:  # A serious problem, like an SSLError or
+            if raiseErrors:
+                raise
             r = e.response
             if r is not None:
-                if r.status_code == 429:
-                    print("          Code 429, waiting for : " + str(sleepTime) + " seconds: ", end='', flush=True)
-                    for x in range(0, sleepTime):
-                        time.sleep(1)
-                        print(".", end='', flush=True)  # Progress indicator
-                    continue
                 print(f"          EXCEPT status_code: {r.status_code}")
                 print(f"          EXCEPT text: {r.text}")
                 print(f"          EXCEPT headers: {r.headers}")
             else:
                 print(f"          EXCEPT ELSE: {e}")
-            break
+            return
+        # Abort if no messages were retrieved
+        if not messages:
+            return
+        yield messages, "Link" in result.headers
+        if "Link" not in result.headers:
+            return
+        myBeforeMessage = result.headers.get('Link').split("beforeMessage=")[1].split(">")[0]
+        payload = {'roomId': myroom, 'max': myMaxMessages, 'beforeMessage': myBeforeMessage}
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION index of the first message of a page (newest first) that is too old: older(msg) is True.
+#          Returns len(messages) when no message is too old. Binary search: messages are sorted by date.
+def first_older_message(messages, older):
+    low, high = 0, len(messages)
+    while low < high:
+        middle = (low + high) // 2
+        if older(messages[middle]):
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION put an item in a (bounded) queue: waits while the queue is full. Returns False when 'stop' is set first.
+def put_until_stopped(items, item, stop):
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION the messages of one time window, newest first: created before 'before' (empty: the newest message)
+#          and not before 'after'. Every page is put in the queue 'pages' as (messages, more): more = True when
+#          there are older messages. The last item is None (window complete) or the error that stopped the window.
+#          The oldest window (after = "") stops at the first page with a message that is too old: older(msg)
+#          is True. That page is kept complete, get_messages() checks it. stop: the window is not needed anymore.
+def get_message_window(myroom, myMaxMessages, before, after, older, stop, pages):
+    try:
+        for messages, more in get_message_pages(myroom, myMaxMessages, before, raiseErrors=True):
+            if after and messages[-1]["created"] < after:  # the end of this window
+                put_until_stopped(pages, (messages[0:first_older_message(messages, lambda msg: msg["created"] < after)], True), stop)
+                break
+            if not put_until_stopped(pages, (messages, more), stop) or (older and older(messages[-1])):
+                break
+    except BaseException as e:  # API error or exit(): get_messages() handles it
+        put_until_stopped(pages, e, stop)
+        return
+    put_until_stopped(pages, None, stop)
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION generator: the pages of messages of a space, like get_message_pages(), but the time span between
+#          spanStart and spanEnd is split in windows that are retrieved at the same time (one thread per window).
+#          The newest window starts at 'before' (empty: the newest message), the oldest window has no end: older,
+#          see get_message_window(). The pages are yielded newest first (window by window), a message that is
+#          in two windows is only yielded once. Every window has a queue of max. 16 pages: a window waits when
+#          get_messages() did not take its pages yet (memory). An API error in a window stops the messages
+#          there (like get_message_pages()), the error is added to the error list.
+def get_message_pages_windows(myroom, myMaxMessages, windows, before, spanStart, spanEnd, older):
+    endDate = parse_date(spanEnd)
+    step = (endDate - parse_date(spanStart)) / windows
+    dates = [(endDate - step * i).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z" for i in range(1, windows)]
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=16) for i in range(windows)]
+    executor = ThreadPool(max_workers=windows)
+    for windowEnd, windowStart, pages in zip([before] + dates, dates + [""], queues):
+        executor.submit(get_message_window, myroom, myMaxMessages, windowEnd, windowStart, older, stop, pages)
+    seen = set()
+    previous = None
+    try:
+        for window, pages in enumerate(queues):
+            more = False
+            while True:
+                item = pages.get()
+                if item is None:  # window complete
+                    break
+                if isinstance(item, requests.exceptions.RequestException):
+                    print(f"          EXCEPT message window {window + 1}: {item}")
+                    myErrorList.append(f"def get_messages: message window {window + 1} failed, no older messages: {item}")
+                    if previous:
+                        yield previous, True
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                messages, more = item
+                if not seen.isdisjoint(msg.id for msg in messages):
+                    messages = [msg for msg in messages if msg.id not in seen]
+                if not messages:
+                    continue
+                seen.update(msg.id for msg in messages)
+                if previous:  # not the last page: there are more messages
+                    yield previous, True
+                previous = messages
+        if previous:
+            yield previous, more
+    finally:  # all pages retrieved, or get_messages() stopped early
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
 
-    if maxTotalMessages == 0:
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION the time span of the messages that get_messages() can archive: (start, end), "" when it is not known.
+#          start: the previous run (incremental), the max msg age or the date the space was created.
+#          end: the end of the date range or the last activity in the space.
+def get_messages_span(myroom, stopAtCreated, rangeEnd):
+    starts = list()
+    if stopAtCreated != "":
+        starts.append(stopAtCreated)
+    if msgMaxAge != 0:  # 2 days extra: timedifferencedays() counts whole days in local time
+        starts.append((datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=msgMaxAge + 2)).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z")
+    end = rangeEnd
+    if not starts or end == "":
+        try:
+            result = webex.get('rooms/' + myroom)
+            if result.status_code == 200:
+                if not starts and result.json().get('created'):
+                    starts.append(result.json()['created'])
+                if end == "":
+                    end = result.json().get('lastActivity', "")
+        except requests.exceptions.RequestException as e:
+            print(f"          space details unknown: {e}")
+    return max(starts, default=""), end
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION that retrieves all space messages
+#          Returns (messages, maxMessages): maxMessages is lower than maxTotalMessages when the max msg age was reached
+#          The messages are Message records: every page is converted when it is retrieved.
+#          pagehandler: called with the archived messages of every page (while the next page is retrieved)
+#          Only the current page is checked for the max msg age and the previous run (incremental): the
+#          pages before it are all newer.
+#          Date range (maxtotalmessages = ddmmyyyy-ddmmyyyy): the first page starts at the end of the
+#          range ('before'), newer messages are not retrieved. Paging stops at the start of the range.
+#          messagewindows > 1: the pages are retrieved in time windows at the same time. The result is the same.
+def get_messages(myroom, myMaxMessages, stopAtCreated="", pagehandler=None):
+    maxMessages = maxTotalMessages  # lowered when the max msg age (days) is reached
+    resultjsonmessages = list()
+    messageCount = 0
+    progress_counter = 0
+    rangeEnd = ""
+    if msgMinAge != 0:  # the newest message that is archived: msg age (timedifferencedays) is msgMinAge
+        rangeEnd = (datetime.datetime.today() - datetime.timedelta(days=msgMinAge, milliseconds=-1)).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+        print(f"          messages before: {rangeEnd}")
+    messagePages = None
+    if messageWindows > 1 and (msgMaxAge != 0 or maxTotalMessages > myMaxMessages * messageWindows):  # not for a few pages
+        spanStart, spanEnd = get_messages_span(myroom, stopAtCreated, rangeEnd)
+        if spanStart != "" and spanStart < spanEnd:
+            print(f"          {messageWindows} time windows at the same time: {spanStart} - {spanEnd}")
+            messagePages = get_message_pages_windows(myroom, myMaxMessages, messageWindows, rangeEnd, spanStart, spanEnd,
+                                                     lambda msg: (stopAtCreated != "" and msg["created"] < stopAtCreated)
+                                                     or (msgMaxAge != 0 and timedifferencedays(msg["created"]) > msgMaxAge))
+    if messagePages is None:
+        messagePages = get_message_pages(myroom, myMaxMessages, rangeEnd)
+    for messages, moreMessages in messagePages:
+        # Incremental archive: messages older than the previous run (the end of the page)
+        newEnd = len(messages)
+        if stopAtCreated != "" and messages[-1]["created"] < stopAtCreated:
+            newEnd = first_older_message(messages, lambda msg: msg["created"] < stopAtCreated)
+        # Max msg age: messages older than the configured number of days (the end of the page)
+        ageEnd = len(messages)
+        if msgMaxAge != 0 and timedifferencedays(messages[-1]["created"]) > msgMaxAge:
+            ageEnd = first_older_message(messages, lambda msg: timedifferencedays(msg["created"]) > msgMaxAge)
+        if archiveDb or pagehandler:  # the messages of this page that are archived (max count, max age, previous run)
+            pageMessages = messages[0:min(max(0, maxMessages - messageCount), newEnd, ageEnd)]
+            # Archive database: save this page in one transaction
+            if archiveDb:
+                archiveDb.add_messages(myroom, pageMessages)
+            if pagehandler:
+                pagehandler(pageMessages)
+        # Incremental archive: stop at the first message that is older than the previous run
+        #      (the max count and max msg age are still the limit: the same messages as the page handler)
+        if newEnd < len(messages):
+            newEnd = min(newEnd, ageEnd, max(0, maxMessages - messageCount))
+            resultjsonmessages.extend(messages[0:newEnd])
+            messageCount += newEnd
+            print(f" FINISHED new messages: {messageCount}")
+            break
+        messageCount += len(messages)
+        progress_counter += 1
+        sys.stdout.write('\r')
+        sys.stdout.write("          %d %s " % (messageCount, '*' * progress_counter))
+        sys.stdout.flush()
+        resultjsonmessages.extend(messages)
+        if moreMessages and messageCount < maxMessages:  # there's MORE messages
+            # When retrieving multiple batches _check_ if the last message retrieved
+            #      is _OLDER_ than the configured max msg age (in the .ini). If yes: trim results to the max age.
+            if ageEnd < len(messages):
+                print("          max messages reached (>" + str(msgMaxAge) + " days old)")
+                # NOW I set maxMessages to the last msg index that should be included, based on msg age in days.
+                maxMessages = len(resultjsonmessages) - len(messages) + ageEnd
+                break
+            continue
+        if msgMaxAge != 0:
+            maxMessages = len(resultjsonmessages) - len(messages) + ageEnd if ageEnd < len(messages) else 99999
+        print(f" FINISHED total messages: {messageCount}")
+        if moreMessages:   # There ARE more messages but the maxTotalMessages has been reached
+            print(f"          Reached configured maximum # messages ({maxMessages})")
+        break
+    messagePages.close()  # message windows: stop the windows that are still retrieved
+
+    if maxMessages == 0:
         print(" **ERROR** there are no messages. Please check your maxMessages setting and try again.\n\n")
         exit()
-    return resultjsonmessages[0:maxTotalMessages]
+    del resultjsonmessages[maxMessages:]
+    return resultjsonmessages, maxMessages
 
 
 # ----------------------------------------------------------------------------------------
@@ -892,11 +2375,10 @@ def format_filename(s):
 
 # ----------------------------------------------------------------------------------------
 # FUNCTION get the Space-name (Used in the header + optionally for the filename)
-def get_roomname(mytoken, myroom):
-    headers = {'Authorization': 'Bearer ' + mytoken, 'content-type': 'application/json; charset=utf-8'}
+def get_roomname(myroom):
     returndata = "webex-space-archive"
     try:
-        result = requests.get('https://webexapis.com/v1/rooms/' + myroom, headers=headers)
+        result = webex.get('rooms/' + myroom)
         if result.status_code == 401:   # WRONG ACCESS TOKEN
             print("__________________________ ERROR ________________________")
             print("   Please check your Access Token in the .ini file.")
@@ -914,6 +2396,8 @@ def get_roomname(mytoken, myroom):
             exit()
         elif result.status_code == 200:
             returndata = result.json()['title']
+            if archiveDb:
+                archiveDb.add_room(result.json())
     except Exception as e:
         print(f"       **ERROR** #1 get_roomname API call status_code: {result.status_code}\n status_text: {result.text}\n Exception {e}\n\n")
         exit()
@@ -923,10 +2407,9 @@ def get_roomname(mytoken, myroom):
 # ----------------------------------------------------------------------------------------
 # FUNCTION get your own details. Name: displayed in the header.
 #          Also used to get your email domain: mark _other_ domains as 'external' messages
-def get_me(mytoken):
+def get_me():
     try:
-        header = {'Authorization': "Bearer " + mytoken, 'content-type': 'application/json; charset=utf-8'}
-        result = requests.get(url='https://webexapis.com/v1/people/me', headers=header)
+        result = webex.get('people/me')
     except Exception as e:
         print(f"       **ERROR** get_me API call status_code: {result.status_code}\n status_text: {result.text}\n Exception {e}\n\n")
         exit()
@@ -952,193 +2435,472 @@ def convert_size(size_bytes):
 
 
 # ----------------------------------------------------------------------------------------
-# FUNCTION to download message images & files (if enabled)
-def process_Files(fileData, fileDate):
-    global myErrorList
-    filelist = list()
-    for url in fileData:
-        headers = {"Authorization": f"Bearer {myToken}", "Accept-Encoding": ""}
+# FUNCTION returns True if an attachment with this filename is downloaded ('download' setting)
+def file_is_downloaded(filename):
+    if downloadFiles not in ['images', 'files', 'image', 'file']:
+        return False
+    fileextension = os.path.splitext(filename)[1][1:].replace("\"", "")
+    if "image" in downloadFiles and fileextension.lower() not in ['jpg', 'png', 'jpeg', 'gif', 'bmp', 'tif', "heic", "avif", "webp"]:
+        return False
+    return True
 
-        #----- GET File INFO
-        r =  requests.head(url, headers=headers, allow_redirects=True)
 
-        #----- GET File NAME
-        if r.status_code == 404:  # Item must have been deleted since url was retrieved
-            continue
-        try:
-            filename = str(r.headers['Content-Disposition']).split("\"")[1]
-            # Files with no name or just spaces: fix so they can still be downloaded:
-            if len(filename) < 1 or filename.isspace():
-                filename = "unknown-filename"
-        except Exception as e:
-            filename = "error-getting-filename"
-            myErrorList.append("def process_Files Header 'content-disposition' error for url: " + url)
-
-        filename = format_filename(filename)
-        fileextension = os.path.splitext(filename)[1][1:].replace("\"", "")
-        filenamepart = os.path.splitext(filename)[0]
-        if downloadFiles not in ['images', 'files', 'image', 'file']:
-            # No file downloading --> just get the filename + size
-            filelist.append(filename + "###0")
-            continue
-        if "image" in downloadFiles and fileextension.lower() not in ['jpg', 'png', 'jpeg', 'gif', 'bmp', 'tif', "heic", "avif", "webp"]:
-            # File is not an image --> just get the filename + size
-            filelist.append(filename + "###0")
-            continue
-        if fileextension.lower() in ['jpg', 'png', 'jpeg', 'gif', 'bmp', 'tif', "heic", "avif", "webp"]:
-            # File is an image
-            subfolder = "/images/"
+# ----------------------------------------------------------------------------------------
+# FUNCTION to download ONE message image or file (if enabled) or only get its name & size.
+#          download = images/files: ONE GET request, the file info comes from its headers before the
+#          file itself is read (not downloaded? e.g. not an image: the GET is closed right away).
+#          download = info: a HEAD request. Both are skipped when the file info cache has the file.
+#          Returns (filename, filesize, savedbytes) or None if the file no longer exists.
+#          savedbytes: file store only, the file was stored already (not stored again).
+#          Called from multiple threads by download_all_files(). folder: the archive output folder
+def process_File(url, fileDate, folder):
+    global myErrorList
+    headers = {"Accept-Encoding": ""}
+    # **DJ** 2026 enhancement to deal with filedownloads that for whatever reason get stuck: time-out
+    CONNECT_TIMEOUT = 10   # seconds to establish TCP/SSL
+    READ_TIMEOUT    = 30   # seconds with no incoming data before failing
+
+    #----- GET File INFO: from the attachment info cache, the GET (download) or a HEAD request (info)
+    response = None  # GET request of which the file (body) is not read yet
+    try:
+        cached = fileCache.get(url) if fileCache else None
+        if cached:
+            filename, filelength = cached[0], cached[1]
         else:
-            # File is a non-image file
-            subfolder = "/files/"
-        #----- CHECK if filename exists. YES? add "-x" (counter)
-        if downloadFiles in ['images', 'files', 'image', 'file']:
-            if os.path.isfile(myOutputFolder + subfolder + filename):  # File exist? add '-<number>' to the filename.
-                filepartName = filenamepart
-                filepartExtension = "." + fileextension
-                filepartCounter = 1
-                while os.path.isfile(myOutputFolder + subfolder + filepartName + "-" + str(filepartCounter) + filepartExtension):
-                    filepartCounter += 1
-                filename = filepartName + "-" + str(filepartCounter) + filepartExtension
-
-        #----- DOWNLOAD FILE
-        # **DJ** 2026 enhancement to deal with filedownloads that for whatever reason get stuck: time-out
-        CONNECT_TIMEOUT = 10   # seconds to establish TCP/SSL
-        READ_TIMEOUT    = 30   # seconds with no incoming data before failing
-        CHUNK_SIZE      = 1024 * 1024        # 1 MB
-        file_path = os.path.join(myOutputFolder, subfolder.strip("/\\"), filename)  # "/images/" -> "images"
-        # CREATE folder where it will be saved
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-        #_____________ NEW _________________________________
-        filesize = 0
-        got_any = False
-        try:
-            with requests.get(url, headers=headers, stream=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)) as r:
-                r.raise_for_status()
-                with open(file_path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
-                        if not chunk:
-                            continue
-                        got_any = True
-                        filesize += len(chunk)
-                        f.write(chunk)
-            # 0-byte / no-data check (works even when chunked)
-            if not got_any or filesize == 0:
-                filelist.append(filename + "###0")
-                continue
+            if downloadFiles in ['images', 'files', 'image', 'file']:
+                r = response = webex.get(url, headers=headers, stream=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
             else:
-                filelist.append(filename + "###" + str(filesize))
-            # Change file modified date
+                r = webex.head(url, headers=headers, allow_redirects=True)
+
+            #----- GET File NAME
+            if r.status_code == 404:  # Item must have been deleted since url was retrieved
+                r.close()
+                return None
             try:
-                dateMSG = datetime.datetime.strptime(fileDate, "%Y-%m-%dT%H:%M:%S.%fZ")
-                modTime = time.mktime(dateMSG.timetuple())
-                os.utime(file_path, (modTime, modTime))
-            except Exception:
-                myErrorList.append("def process_Files can't change date modified for file: " + filename)
-                print("def process_Files can't change date modified for file: " + filename)
-
-        except requests.exceptions.Timeout as e:
-            myErrorList.append(f"TIMEOUT downloading {filename} (connect/read): {e}")
-            print(f"TIMEOUT downloading {filename} (connect/read): {e}")
-            # optional: remove partial file
-            if os.path.exists(file_path):
-                try: os.remove(file_path)
-                except: pass
+                filename = str(r.headers['Content-Disposition']).split("\"")[1]
+                # Files with no name or just spaces: fix so they can still be downloaded:
+                if len(filename) < 1 or filename.isspace():
+                    filename = "unknown-filename"
+                if fileCache and r.status_code == 200:
+                    filelength = r.headers.get('Content-Length', "")
+                    fileCache.put(url, format_filename(filename), int(filelength) if filelength.isdigit() else 0, r.headers.get('Content-Type', ""))
+            except Exception as e:
+                filename = "error-getting-filename"
+                myErrorList.append("def process_Files Header 'content-disposition' error for url: " + url)
+            filename = format_filename(filename)
+            filelength = r.headers.get('Content-Length', "")
+
+        if not file_is_downloaded(filename):
+            # No file downloading (or not an image) --> just get the filename + size
+            return filename, 0, 0
+        if fileStore:  # one thread per filename + size: the same file posted again (at the same time) is downloaded once
+            with fileStore.name_lock(filename, filelength):
+                return save_File(url, fileDate, folder, filename, filelength, response)
+        return save_File(url, fileDate, folder, filename, filelength, response)
+    finally:
+        # the file (body) is not read (or an error occurred): close the GET request, this frees its
+        # connection (and, with httpengine asyncio/aiohttp, its place in the 'maxconnections' limit)
+        if response is not None:
+            response.close()
 
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION save ONE attachment in the archive folder (images or files subfolder): download it, or link
+#          the file store copy (same url, or same filename + size and the start of the download is the
+#          same). A file with the same name that is in the folder already gets a new name ("name-1.ext"),
+#          unless it is that same stored file.
+#          response: the GET request of which the file is not read yet (None: file info from the cache).
+#          Returns (filename, filesize, savedbytes) or None if the download failed.
+def save_File(url, fileDate, folder, filename, filelength, response):
+    CONNECT_TIMEOUT = 10   # seconds to establish TCP/SSL
+    READ_TIMEOUT    = 30   # seconds with no incoming data before failing
+    CHUNK_SIZE      = 1024 * 1024        # 1 MB
+    headers = {"Accept-Encoding": ""}
+    fileextension = os.path.splitext(filename)[1][1:].replace("\"", "")
+    filenamepart = os.path.splitext(filename)[0]
+    if fileextension.lower() in ['jpg', 'png', 'jpeg', 'gif', 'bmp', 'tif', "heic", "avif", "webp"]:
+        # File is an image
+        subfolder = "/images/"
+    else:
+        # File is a non-image file
+        subfolder = "/files/"
+    #----- FILE STORE: file stored already (same url)? link it, no download
+    storename = filename
+    storedpath = fileStore.find(url) if fileStore else None
+    chunks = None  # the download of which the first chunk was read already (compared with a stored file)
+    samename = fileStore.find_name(filename, filelength) if fileStore and not storedpath else None
+    if samename:  # stored file with the same name + size: the same file if the first chunk (small file: all) is the same
+        try:
+            if response is None:  # file info came from the cache
+                response = webex.get(url, headers=headers, stream=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            if response.status_code == 200:
+                chunks = response.iter_content(chunk_size=CHUNK_SIZE)
+                firstchunk = next(chunks, b"")
+                chunks = itertools.chain([firstchunk], chunks)
+                with open(samename, 'rb') as f:
+                    if firstchunk and f.read(len(firstchunk)) == firstchunk:
+                        storedpath = samename
         except requests.exceptions.RequestException as e:
-            # includes HTTP errors via raise_for_status, connection errors, etc.
             myErrorList.append(f"DOWNLOAD failed for {filename}: {e}")
             print(f"DOWNLOAD failed for {filename}: {e}")
-            if os.path.exists(file_path):
-                try: os.remove(file_path)
-                except: pass
+            if response is not None:
+                response.close()
+            return None
+    if storedpath and response is not None:
+        response.close()  # don't read (the rest of) the file
+    #----- CHECK if filename exists (or is being downloaded by another thread). YES? add "-x" (counter)
+    with fileNameLock:
+        existing = list()  # names in the folder that can be the stored file
+        candidate = filename
+        filepartCounter = 0
+        while os.path.isfile(folder + subfolder + candidate) or (folder + subfolder + candidate) in reservedFileNames:
+            if storedpath and os.path.isfile(folder + subfolder + candidate):
+                existing.append(candidate)
+            filepartCounter += 1
+            candidate = filenamepart + "-" + str(filepartCounter) + "." + fileextension
+        filename = candidate
+        reservedFileNames.add(folder + subfolder + filename)
+    try:
+        #----- The stored file is in the folder already (the same file posted again)? use it, no new file.
+        #      Compared without the lock: other downloads don't wait for it.
+        for candidate in existing:
+            if os.path.getsize(folder + subfolder + candidate) == os.path.getsize(storedpath) \
+                    and filecmp.cmp(folder + subfolder + candidate, storedpath, shallow=False):
+                filesize = os.path.getsize(storedpath)
+                return candidate, filesize, filesize
+        file_path = os.path.join(folder, subfolder.strip("/\\"), filename)  # "/images/" -> "images"
+        return write_File(url, fileDate, file_path, filename, storename, storedpath, response, chunks)
+    finally:  # the file exists now (or the download failed): the name is not reserved anymore
+        with fileNameLock:
+            reservedFileNames.discard(folder + subfolder + filename)
 
-        except Exception as e:
-            myErrorList.append(f"Unexpected error for {filename}: {e}")
-            print(f"Unexpected error for {filename}: {e}")
-            if os.path.exists(file_path):
-                try: os.remove(file_path)
-                except: pass
-        print(".", end="", flush=True)  # Progress Bar  # **DJ** 2026
 
-    return filelist
+# ----------------------------------------------------------------------------------------
+# FUNCTION write ONE attachment (file_path) in the archive folder: link the stored file (storedpath) or
+#          download it. With a file store the download goes to the store first (storename: the original
+#          filename) and is linked. chunks: the download, read already by save_File() (or None).
+#          Returns (filename, filesize, savedbytes) or None if the download failed.
+def write_File(url, fileDate, file_path, filename, storename, storedpath, response, chunks):
+    CONNECT_TIMEOUT = 10   # seconds to establish TCP/SSL
+    READ_TIMEOUT    = 30   # seconds with no incoming data before failing
+    CHUNK_SIZE      = 1024 * 1024        # 1 MB
+    headers = {"Accept-Encoding": ""}
+    # CREATE folder where it will be saved
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    download_path = file_path
+    if storedpath:
+        fileStore.link(storedpath, file_path)
+        filesize = os.path.getsize(storedpath)
+        return filename, filesize, filesize
+    if fileStore:
+        download_path = fileStore.temp_path()
+        filehash = hashlib.sha256()
+
+    #_____________ NEW _________________________________
+    filesize = 0
+    got_any = False
+    result = None
+    try:
+        if response is None:  # file info came from the cache
+            response = webex.get(url, headers=headers, stream=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        with response as r:
+            r.raise_for_status()
+            if chunks is None:
+                chunks = r.iter_content(chunk_size=CHUNK_SIZE)
+            with open(download_path, "wb") as f:
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    got_any = True
+                    filesize += len(chunk)
+                    f.write(chunk)
+                    if fileStore:
+                        filehash.update(chunk)
+        # 0-byte / no-data check (works even when chunked)
+        if not got_any or filesize == 0:
+            if download_path != file_path:
+                os.replace(download_path, file_path)
+            return filename, 0, 0
+        savedbytes = 0
+        if fileStore:  # move the file into the store (or remove it: stored already) and link it
+            storedpath, duplicate = fileStore.add(download_path, filehash.hexdigest(), url, storename, filesize)
+            fileStore.link(storedpath, file_path)
+            if duplicate:
+                savedbytes = filesize
+        result = (filename, filesize, savedbytes)
+        # Change file modified date
+        try:
+            dateMSG = parse_date(fileDate)
+            modTime = time.mktime(dateMSG.timetuple())
+            os.utime(file_path, (modTime, modTime))
+        except Exception:
+            myErrorList.append("def process_Files can't change date modified for file: " + filename)
+            print("def process_Files can't change date modified for file: " + filename)
+
+    except requests.exceptions.Timeout as e:
+        myErrorList.append(f"TIMEOUT downloading {filename} (connect/read): {e}")
+        print(f"TIMEOUT downloading {filename} (connect/read): {e}")
+        # optional: remove partial file
+        if os.path.exists(download_path):
+            try: os.remove(download_path)
+            except: pass
+
+    except requests.exceptions.RequestException as e:
+        # includes HTTP errors via raise_for_status, connection errors, etc.
+        myErrorList.append(f"DOWNLOAD failed for {filename}: {e}")
+        print(f"DOWNLOAD failed for {filename}: {e}")
+        if os.path.exists(download_path):
+            try: os.remove(download_path)
+            except: pass
+
+    except Exception as e:
+        myErrorList.append(f"Unexpected error for {filename}: {e}")
+        print(f"Unexpected error for {filename}: {e}")
+        if os.path.exists(download_path):
+            try: os.remove(download_path)
+            except: pass
+    return result
 
 
 # ----------------------------------------------------------------------------------------
-# FUNCTION download member avatars (user images). Will retry failed downloads max. 3 times.
-def download_avatars(avatardictionary):  # dictionary:  userId, avatarUrl
-    global downloadAvatarCount
-    global myErrorList
-    # Remove previous avatar error messages
-    myErrorList = [elem for elem in myErrorList if "def download_avatars download failed" not in elem]
-    retryDictionary = dict()
-    for key, value in avatardictionary.items():
-        filename = "".join(re.findall(r'[A-Za-z0-9]+', key)) + ".jpg"
+# FUNCTION download stage: collects the file URLs of all messages (in display order) and
+#          downloads them (or gets their info) with 'downloadthreads' parallel threads.
+#          Returns a dictionary: fileUrl --> (filename, filesize) (failed downloads are left out)
+#          and the number of bytes that were not stored again (file store: stored already).
+#          knownFiles (incremental archive): fileUrl --> (filename, filesize) that are not downloaded again.
+#          Attachments in the info cache that are not downloaded don't need a thread: only cache misses
+#          (and downloads) are done in parallel.
+def download_all_files(messagelist, threads, folder, knownFiles=None):
+    fileJobs = dict()  # fileUrl --> message date (used for the file modified date)
+    fileInfo = dict()
+    if knownFiles is None:
+        knownFiles = dict()
+    savedBytes = 0
+    for msg in messagelist:
+        for url in msg.files or ():
+            if url in knownFiles:  # incremental archive: downloaded in a previous run
+                fileInfo[url] = knownFiles[url]
+                continue
+            cached = fileCache.get(url) if fileCache and url not in fileInfo else None
+            if cached and not file_is_downloaded(cached[0]):  # attachment info cache: no HEAD request, no thread
+                fileInfo[url] = (cached[0], 0)
+                continue
+            fileJobs.setdefault(url, msg.created)
+    with ThreadPool(max_workers=threads) as executor:
+        futures = {executor.submit(process_File, url, fileDate, folder): url for url, fileDate in fileJobs.items()}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                myErrorList.append(f"def download_all_files error for url: {futures[future]} Error: {e}")
+                continue
+            if result is not None:
+                fileInfo[futures[future]] = result[0:2]
+                savedBytes += result[2]
+            print(".", end="", flush=True)  # Progress Bar  # **DJ** 2026
+    if fileStore:
+        fileStore.save()
+    if fileCache:
+        fileCache.save()
+    return fileInfo, savedBytes
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION download ONE member avatar (user image) to folder/avatars.
+#          Avatar cache: a cached avatar is only downloaded again when it changed (ETag/If-Modified-Since,
+#          Webex answers "304 Not Modified"), the archive gets a link to the cached image.
+#          Failed downloads are retried max. 3 times, waiting 1, 2 seconds (backoff).
+#          Returns "downloaded", "cached" (not downloaded) or "failed".
+#          Called from multiple threads by download_avatars()
+def download_avatar(personid, url, folder):
+    target = folder + "/avatars/" + "".join(re.findall(r'[A-Za-z0-9]+', personid)) + ".jpg"
+    if not avatarCache:
+        return download_avatar_file(personid, url, target, dict())
+    with avatarCache.person_lock(personid):  # other spaces (batch mode) wait: one request per person
+        cached = avatarCache.get(personid, url)
+        if cached and personid in avatarCache.checked:  # checked during this run
+            avatarCache.link(personid, target)
+            return "cached"
+        headers = dict()
+        if cached and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached.get('modified'):
+            headers['If-Modified-Since'] = cached['modified']
+        result = download_avatar_file(personid, url, avatarCache.path(personid), headers)
+        if result == "failed":
+            if not cached:
+                return result
+            result = "cached"  # use the previous image
+        avatarCache.link(personid, target)
+        return result
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION download an avatar image to filename (a temporary file is renamed: no half images).
+#          304 (headers: conditional request) --> "cached", the file is not changed.
+def download_avatar_file(personid, url, filename, headers):
+    for attempt in range(1, 4):  # Try failed avatar downloads max 3 times
         try:
-            r = requests.get(value, stream=True)
+            with webex.get(url, headers=headers, stream=True, auth=False) as r:  # avatar server: do not send the token
+                if r.status_code == 304:
+                    r.content  # read the (empty) body: the connection can be used again
+                    avatarCache.put(personid, url, r.headers.get('ETag', headers.get('If-None-Match', "")),
+                                    r.headers.get('Last-Modified', headers.get('If-Modified-Since', "")))
+                    return "cached"
+                if r.status_code == 200:
+                    with open(filename + ".tmp", 'wb') as f:
+                        for chunk in r.iter_content(chunk_size=65536):
+                            f.write(chunk)
+                    os.replace(filename + ".tmp", filename)
+                    if avatarCache:
+                        avatarCache.put(personid, url, r.headers.get('ETag', ""), r.headers.get('Last-Modified', ""))
+                    return "downloaded"
+                error = f"result: {r.status_code}"
+                if r.status_code < 500 and r.status_code != 429:  # no use trying again
+                    break
         except Exception as e:
-            myErrorList.append("def download_avatars download failed (attempt #" + str(downloadAvatarCount) + ") for user: " + key + " with URL: " + value + " Error: " + str(e))
-            retryDictionary[key] = value  # Create temp dictionary for failed avatar downloads - retry later
-            print("X", end='', flush=True)  # Progress indicator
-            continue
-        if r.status_code == 200:
-            r.raw.decode_content = True
-            with open(myOutputFolder + "/avatars/" + filename, 'wb') as f:
-                shutil.copyfileobj(r.raw, f)
-        else:
-            print(f"\n**ERROR** download_avatars RESULT: {r.status_code}\n")
-    if len(retryDictionary) > 0 and downloadAvatarCount < 4:  # Try failed avatar downloads max 3 times
-        myErrorList.append("             Avatar download attempt nr. " + str(downloadAvatarCount))
-        time.sleep(1)
-        downloadAvatarCount += 1
-        download_avatars(retryDictionary)
+            error = str(e)
+            if os.path.exists(filename + ".tmp"):
+                try: os.remove(filename + ".tmp")
+                except: pass
+        if attempt < 3:
+            time.sleep(attempt)
+    myErrorList.append("def download_avatars download failed (" + str(attempt) + " attempts) for user: " + personid + " with URL: " + url + " Error: " + error)
+    print("X", end='', flush=True)  # Progress indicator
+    return "failed"
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION download member avatars (user images) to folder/avatars with 'downloadthreads' parallel threads.
+#          Returns a dictionary: "downloaded"/"cached"/"failed" --> number of avatars
+def download_avatars(avatardictionary, folder):  # dictionary:  userId, avatarUrl
+    results = {"downloaded": 0, "cached": 0, "failed": 0}
+    with ThreadPool(max_workers=downloadThreads) as executor:
+        futures = {executor.submit(download_avatar, key, value, folder): key for key, value in avatardictionary.items()}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results[future.result()] += 1
+            except Exception as e:
+                myErrorList.append(f"def download_avatars error for user: {futures[future]} Error: {e}")
+                results["failed"] += 1
+    if avatarCache:
+        avatarCache.save()
+    return results
 
 
 # ----------------------------------------------------------------------------------------
 # FUNCTION download member details (that include the member avatar URL)
 #          only called when userAvatar = 'download' or 'link'
-def get_persondetails(mytoken, personlist):
-    headers = {'Authorization': 'Bearer ' + mytoken, 'content-type': 'application/json; charset=utf-8'}
+def get_persondetails(personlist):
     personlist = str(personlist)[2:-2].replace("', '", ",")
     payload = {'id': personlist}
     resultjsonmessages = list()
     while True:
         try:
-            result = requests.get('https://webexapis.com/v1/people', headers=headers, params=payload)
-            if result.status_code != 200 and result.status_code != 429:
-                print(f"     ** ERROR ** def get_persondetails. result.status_code: {result.status_code}\n        headers: {headers}\n        personlist: >>{personlist.strip()}<<\n        result.text: {result.text}")
+            result = webex.get('people', params=payload)
+            if result.status_code != 200:
+                print(f"     ** ERROR ** def get_persondetails. result.status_code: {result.status_code}\n        personlist: >>{personlist.strip()}<<\n        result.text: {result.text}")
             else:
                 resultjsonmessages = resultjsonmessages + result.json()["items"]
             break
         except requests.exceptions.RequestException as e:
-            print(e)
             print(f"\n\n get_persondetails Exception e: {e}\n\n")
-            if "e.status_code" == "429":
-                print("          Code 429, waiting for : " + str(sleepTime) + " seconds: ", end='', flush=True)
-                for x in range(0, sleepTime):
-                    time.sleep(1)
-                    print(".", end='', flush=True)  # Progress indicator
-            else:
-                break
+            break
     return resultjsonmessages
 
 
 # ----------------------------------------------------------------------------------------
-# FUNCTION download ALL SPACES - when you call this script with a parameter, it will
-#          search all of your spaces and return spaces that match your search string
-def get_searchspaces(mytoken, searchstring):
+# FUNCTION get the details of people (name, email, avatar URL): from the people cache, people that are
+#          not in the cache are requested in blocks of 50 (at the same time, 'downloadthreads').
+#          Returns a dictionary: person id --> person details. Used for avatars and member names.
+def get_people(personids, progress=True):
+    people = peopleCache.get(personids) if peopleCache else dict()
+    missing = [personid for personid in personids if personid not in people]
+    chunks = [missing[i:i + 50] for i in range(0, len(missing), 50)]
+    fetched = list()
+    with ThreadPool(max_workers=downloadThreads) as executor:
+        for person_list in executor.map(get_persondetails, chunks):
+            if progress:
+                print(".", end='', flush=True)  # Progress indicator
+            fetched += person_list
+    if peopleCache and fetched:
+        peopleCache.put(fetched)
+    for persondetails in fetched:
+        people[persondetails['id']] = persondetails
+    return people
+
+
+# ----------------------------------------------------------------------------------------
+# CLASS PeopleLookup: the details (avatars, names) of message authors are requested WHILE the messages
+#       are retrieved. get_messages() hands over every page, new authors are requested on the startup
+#       thread pool: when no request is running, or when 50 new authors are waiting.
+#       avatarfolder: the avatars of every block of people are downloaded right away.
+#       memberstask (no avatars): only authors who are not a space member are requested (names of
+#       people who left the space), as soon as the member list is received.
+class PeopleLookup:
+    def __init__(self, pool, avatarfolder="", memberstask=None):
+        self.pool = pool
+        self.avatarFolder = avatarfolder
+        self.membersTask = memberstask
+        self.memberEmails = None
+        self.seen = set()
+        self.waiting = dict()  # person id --> email: authors that are not requested yet
+        self.tasks = list()
+
+    def add_messages(self, messages):
+        for msg in messages:
+            personid = msg.get('personId', "")
+            if personid not in self.seen and "xxXXxx" not in personid:
+                self.seen.add(personid)
+                self.waiting[personid] = msg.get('personEmail', "")
+        self.request(False)
+
+    def request(self, final):
+        if self.membersTask:
+            if self.memberEmails is None:
+                if not final and not self.membersTask.done():
+                    return
+                self.memberEmails = {str(member.get('personEmail')) for member in self.membersTask.result()}
+            self.waiting = {personid: email for personid, email in self.waiting.items() if email not in self.memberEmails}
+        if not self.waiting or (not final and len(self.waiting) < 50 and not all(task.done() for task in self.tasks)):
+            return
+        self.tasks.append(self.pool.submit(self.lookup, list(self.waiting)))
+        self.waiting = dict()
+
+    def lookup(self, personids):
+        people = get_people(personids, progress=False)
+        avatars = {personid: persondetails['avatar'].replace("~1600", "~80") for personid, persondetails in people.items() if 'avatar' in persondetails}
+        results = download_avatars(avatars, self.avatarFolder) if self.avatarFolder and avatars else dict()
+        return people, results
+
+    def result(self):  # waits for all requests. Returns (person id --> person details, avatar download results)
+        self.request(True)
+        people = dict()
+        results = {"downloaded": 0, "cached": 0, "failed": 0}
+        for task in self.tasks:
+            taskPeople, taskResults = task.result()
+            people.update(taskPeople)
+            for result, count in taskResults.items():
+                results[result] += count
+        return people, results
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION get ALL SPACES you are a member of (id, title, type, lastActivity).
+#          newerthan: only spaces with activity at/after this date (spaces sorted by lastActivity,
+#          stops at the first older space). Returns None when the list could not be retrieved.
+def get_rooms(newerthan=""):
     max_spaces_to_retrieve = 500  # PER API call
-    headers = {'Authorization': 'Bearer ' + mytoken, 'content-type': 'application/json; charset=utf-8'}
     payload = {'max': max_spaces_to_retrieve}
-    search_result_group = dict()
-    search_result_direct = dict()
+    if newerthan:
+        payload['sortBy'] = "lastactivity"
     resultjson = list()
     print(" ", end='', flush=True)  # Progress indicator
     while True:
         try:
             print(".", end='', flush=True)  # Progress indicator
-            result = requests.get('https://webexapis.com/v1/rooms', headers=headers, params=payload)
+            result = webex.get('rooms', params=payload)
             if result.status_code == 401:  # WRONG ACCESS TOKEN
                 print("    -------------------------- ERROR ------------------------")
                 print("       Please check your Access Token in the .ini file.")
@@ -1147,102 +2909,300 @@ def get_searchspaces(mytoken, searchstring):
                 print("           https://developer.webex.com/docs/api/getting-started")
                 print("    ------------------------- STOPPED ----------------------- \n\n\n")
                 exit()
-            if "Link" in result.headers:  # there's MORE members
-                headerLink = result.headers["Link"]
-                myCursor = headerLink[headerLink.find("cursor=") + len("cursor="):headerLink.rfind(">")]
-                payload = {'max': max_spaces_to_retrieve, 'cursor': myCursor}
-                if "items" in result.json():
-                    try:
-                        resultjson += result.json()["items"]
-                    except Exception as e:
-                        print(" **ERROR** get_searchspaces Link: " + str(e))
-                continue
-            else:
-                try:
-                    resultjson += result.json()["items"]
-                except Exception as e:
-                    print(f" **ERROR** get_searchspaces no Link: {e}")
-                print(f" Total number of spaces: {len(resultjson)}")
-                break
+            items = result.json()["items"]
         except requests.exceptions.RequestException as e:  # A serious problem, like an SSLError or InvalidURL
-            if e.status_code == 429:
-                print("          Code 429, waiting for : " + str(sleepTime) + " seconds: ", end='', flush=True)
-                for x in range(0, sleepTime):
-                    time.sleep(1)
-            else:
-                break
-    for spaces in resultjson:
+            print(f" **ERROR** get_rooms: {e}")
+            return None
+        except Exception as e:
+            print(f" **ERROR** get_rooms status code: {result.status_code}: {e}")
+            return None
+        if newerthan:
+            resultjson += [room for room in items if room.get('lastActivity', "") >= newerthan]
+            if len(items) > 0 and items[-1].get('lastActivity', "") < newerthan:
+                break  # the rest of the spaces has no new activity
+        else:
+            resultjson += items
+        if "Link" not in result.headers:  # no more spaces
+            break
+        headerLink = result.headers["Link"]
+        payload['cursor'] = headerLink[headerLink.find("cursor=") + len("cursor="):headerLink.rfind(">")]
+    print(f" {len(resultjson)} spaces")
+    return resultjson
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION get the spaces you JOINED at/after this date (your memberships). A space you were added to
+#          recently can have an old lastActivity: get_rooms(newerthan) doesn't find it.
+#          knownids: spaces that are retrieved already (no extra request). Returns None when your
+#          memberships could not be retrieved.
+def get_joined_rooms(joinedafter, knownids):
+    payload = {'max': 1000}
+    roomids = list()
+    while True:
         try:
-            if searchstring.lower() in spaces['title'].lower():
-                if spaces['type'] == "group":
-                    search_result_group[spaces['id']] = spaces['title']
-                elif spaces['type'] == "direct":
-                    search_result_direct[spaces['id']] = spaces['title']
-        except:
+            result = webex.get('memberships', params=payload)
+            items = result.json()["items"]
+        except Exception as e:
+            print(f" **ERROR** get_joined_rooms: {e}")
+            return None
+        roomids += [membership['roomId'] for membership in items
+                    if membership.get('created', "") >= joinedafter and membership.get('roomId') not in knownids]
+        if "Link" not in result.headers:  # no more memberships
+            break
+        headerLink = result.headers["Link"]
+        payload['cursor'] = headerLink[headerLink.find("cursor=") + len("cursor="):headerLink.rfind(">")]
+    rooms = list()
+    for roomid in roomids:
+        try:
+            result = webex.get('rooms/' + roomid)
+            if result.status_code == 200:
+                rooms.append(result.json())
+        except Exception as e:
+            print(f" **ERROR** get_joined_rooms: {e}")
+            return None
+    return rooms
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION words of a space title for the space search: lowercase (casefold), accents removed,
+#          separated by one space
+def room_search_words(text):
+    text = text.casefold()
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return " ".join(re.findall(r'\w+', text))
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION search spaces by title. A space matches when the title contains the search string,
+#          when every search word is the start of a title word (any order), or when every search
+#          word is ALMOST a title word (typo's: 'projetc apolo' finds 'Project Apollo').
+#          Best matches first, then the most recent activity.
+def search_rooms(rooms, searchstring):
+    searchtext = room_search_words(searchstring)
+    searchwords = searchtext.split()
+    search_result_group = dict()
+    search_result_direct = dict()
+    if len(searchwords) == 0:
+        return search_result_group, search_result_direct
+    roomwords = {room['id']: room['words'] if 'words' in room else room_search_words(room.get('title', "")) for room in rooms}
+    similar = dict()  # search word --> {title word: score} for all (unique) title words
+    allwords = {word for words in roomwords.values() for word in words.split()}
+    for searchword in searchwords:
+        similar[searchword] = dict()
+        matcher = difflib.SequenceMatcher(None, "", searchword)
+        for word in allwords:
+            if word.startswith(searchword):
+                similar[searchword][word] = 2
+            elif len(searchword) > 2 and searchword.isalpha() and word.isalpha() and abs(len(word) - len(searchword)) <= 2:
+                matcher.set_seq1(word)
+                if matcher.real_quick_ratio() >= 0.75 and matcher.quick_ratio() >= 0.75 and matcher.ratio() >= 0.75:
+                    similar[searchword][word] = matcher.ratio()
+    similarwords = set().union(*similar.values())
+    found = list()
+    for room in rooms:
+        words = roomwords[room['id']]
+        if searchtext in words:
+            score = 4 if searchtext == words else 3
+        elif similarwords.isdisjoint(words.split()):
             continue
+        else:
+            scores = [max([similar[searchword].get(word, 0) for word in words.split()]) for searchword in searchwords]
+            score = min(scores)  # 2: start of a title word, 0.75-1: similar word, 0: no match
+            if score == 0:
+                continue
+        found.append((score, room.get('lastActivity', ""), room))
+    found.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    for score, lastactivity, room in found:
+        if room.get('type') == "group":
+            search_result_group[room['id']] = room.get('title', "")
+        elif room.get('type') == "direct":
+            search_result_direct[room['id']] = room.get('title', "")
     return search_result_group, search_result_direct
 
 
 # ----------------------------------------------------------------------------------------
-# FUNCTION that creates a table with the message order (needed for threaded messages)
-#
-def create_threading_order_table(WebexMessages):
-    msgOrderTable = dict()
-    msgOrderIndex = 1.000
-    missing_parent_msg = {}
+# FUNCTION download ALL SPACES - when you call this script with a parameter, it will
+#          search all of your spaces and return spaces that match your search string.
+#          With the room index (default): the spaces are searched in the local index.
+def get_searchspaces(searchstring):
+    if roomIndex:
+        roomIndex.refresh()
+        rooms = roomIndex.rooms()
+    else:
+        rooms = get_rooms() or list()
+    return search_rooms(rooms, searchstring)
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION that creates the thread tree (needed for threaded messages) in one pass over the
+#          date-sorted messages. Returns:
+#          threadRoots:   top-level messages (oldest first)
+#          threadReplies: root message id --> list of replies (oldest first)
+#          missing_parent_msglist: placeholder messages for parents that were not retrieved
+def create_thread_tree(sortedMessages):
+    threadRoots = list()
+    threadReplies = dict()
+    rootIdOf = dict()  # reply id --> root id (a reply to a reply ends up in the same thread)
     missing_parent_msglist = list()
-    count_hasparent = 0
-    count_hasnoparent = 0
-    for msg in WebexMessages:
-        if 'parentId' not in msg:
+    skippedParentIds = set()
+    for msg in sortedMessages:
+        if msg.parentId is None:
             # NOT a threaded message
-            count_hasnoparent += 1
-            msgAge = timedifferencedays(msg["created"])
+            msgAge = timedifferencedays(msg.created)
             if (msgAge < msgMinAge or msgAge > msgMaxAge) and msgMaxAge != 0:  # check if msg is between min/max msg date
                 continue
-            else:
-                msgOrderTable[(str(float("%.3f" % msgOrderIndex)))] = msg['id']
-                msgOrderIndex = msgOrderIndex + 1.000
-        else:
-            count_hasparent += 1
-            # THREADED MESSAGE!
-            # If parentId does not exist in msgOrderTable: CREATE PARENT!
-            #    note: this also happens when you retrieve 500 msg and the parent happens to be the 501th msg.
-            if msg['parentId'] not in msgOrderTable.values():
-                missing_parent_msg = {}
-                FMT = "%Y-%m-%dT%H:%M:%S.%fZ"
-                missing_parent_msg["id"]          = msg['parentId']
-                missing_parent_msg["roomId"]      = msg['roomId']
-                missing_parent_msg["roomType"]    = msg["roomType"]
-                missing_parent_msg["html"]        = "<span style='color: gray;'>User deleted their own message, or msg outside maxtotalmessages scope.</span>"
-                missing_parent_msg["personId"]    = "Y2lzY29xxXXxxXXxx00xxXXxx11xxXXxx22xxXXxx33xxXXxx44xxXXxx55xxXXxx66xxXXxx77xxX"
-                missing_parent_msg["personEmail"] = "placeholder@user_removed_their_msg.com"
-                missing_parent_msg["created"]     = (datetime.datetime.strptime(msg["created"], FMT) - datetime.timedelta(hours=0, minutes=20)).strftime(FMT)
-                missing_parent_msglist.append(missing_parent_msg)
-                # because the parent is NOT a threaded message, do the same as for a non threaded message (like a parent)
-                msgAge = timedifferencedays(missing_parent_msg["created"])
-                if (msgAge < msgMinAge or msgAge > msgMaxAge) and msgMaxAge != 0:  # check if msg is between min/max msg date
-                    continue
-                else:
-                    msgOrderTable[(str(float("%.3f" % msgOrderIndex)))] = missing_parent_msg['id']
-                    msgOrderIndex = msgOrderIndex + 1.000
-                # NOW the ordertables are available and ready for the "threaded message" (there is a parent for the message)
-            # 1 get msgOrderIndex for parent ID in msgOrderTable.
-            try:
-                newOrderIndex = float(list(msgOrderTable.keys())[list(msgOrderTable.values()).index(msg['parentId'])])
-            except Exception as e:
-                print(f"\n **ERROR** create_threading_order_table - newOrderIndex. Error message:\n{e}")
-                continue  # message belongs to thread outside of the current message scope
-            # 2 check if nr from parentid + 0.001 exists
-            while True:
-                if str(float(("%.3f" % newOrderIndex))) in msgOrderTable:
-                    # the above str(float(etc)) fixes issue where max 9 msgs per thread were shown in html and txt 0.22 ojchase!
-                    newOrderIndex = float("%.3f" % (newOrderIndex + 0.001))
-                    continue
-                else:
-                    msgOrderTable[str(newOrderIndex)] = msg['id']
-                    break
-    return msgOrderTable, missing_parent_msglist
+            threadRoots.append(msg)
+            threadReplies[msg.id] = list()
+            continue
+        # THREADED MESSAGE!
+        parentId = rootIdOf.get(msg.parentId, msg.parentId)
+        if parentId in skippedParentIds:
+            continue  # message belongs to thread outside of the current message scope
+        # If parentId does not exist in the tree: CREATE PARENT!
+        #    note: this also happens when you retrieve 500 msg and the parent happens to be the 501th msg.
+        if parentId not in threadReplies:
+            FMT = "%Y-%m-%dT%H:%M:%S.%fZ"
+            missing_parent_msg = {}
+            missing_parent_msg["id"]          = parentId
+            missing_parent_msg["roomId"]      = msg.roomId
+            missing_parent_msg["roomType"]    = msg.roomType
+            missing_parent_msg["html"]        = "<span style='color: gray;'>User deleted their own message, or msg outside maxtotalmessages scope.</span>"
+            missing_parent_msg["personId"]    = "Y2lzY29xxXXxxXXxx00xxXXxx11xxXXxx22xxXXxx33xxXXxx44xxXXxx55xxXXxx66xxXXxx77xxX"
+            missing_parent_msg["personEmail"] = "placeholder@user_removed_their_msg.com"
+            missing_parent_msg["created"]     = (parse_date(msg.created) - datetime.timedelta(hours=0, minutes=20)).strftime(FMT)
+            missing_parent_msg = Message(missing_parent_msg)
+            missing_parent_msglist.append(missing_parent_msg)
+            # because the parent is NOT a threaded message, do the same as for a non threaded message (like a parent)
+            msgAge = timedifferencedays(missing_parent_msg.created)
+            if (msgAge < msgMinAge or msgAge > msgMaxAge) and msgMaxAge != 0:  # check if msg is between min/max msg date
+                skippedParentIds.add(parentId)
+                continue
+            threadRoots.append(missing_parent_msg)
+            threadReplies[parentId] = list()
+        threadReplies[parentId].append(msg)
+        rootIdOf[msg.id] = parentId
+    return threadRoots, threadReplies, missing_parent_msglist
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION that walks the thread tree in display order. Yields: (message, threaded_message)
+#          sortOldNew: oldest thread first, otherwise newest thread first. Replies: always oldest first.
+def iterate_thread_tree(msgstore, threadRoots, threadReplies, sortOldNew):
+    for root in (threadRoots if sortOldNew else reversed(threadRoots)):
+        yield msgstore.byId[root.id], False
+        for reply in threadReplies[root.id]:
+            yield reply, True
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION incremental archive: find the most recent archive folder ("name", "name-01", ..) that
+#          has a state file for this space. Returns (folder, state) or ("", None) if there is none.
+def load_archive_state(basefolder, myroom):
+    foundFolder, foundState = "", None
+    folder = basefolder
+    folderCounter = 0
+    while os.path.exists(folder):
+        try:
+            with open(os.path.join(folder, archiveStateFile), encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get("roomId") == myroom:
+                foundFolder, foundState = folder, state
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            myErrorList.append(f"def load_archive_state can't read {os.path.join(folder, archiveStateFile)}: {e}")
+        folderCounter += 1
+        folder = basefolder + "-" + "{:02d}".format(folderCounter)
+    return foundFolder, foundState
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION save the state file in the archive folder: everything needed to update the archive
+#          (incremental) or to generate the HTML again without API calls (render-only):
+#          the newest message, space name, your details, members, avatar URLs, names of former members,
+#          the attachment info (fileUrl --> filename, size) and all messages (without placeholders)
+def save_archive_state(folder, myroom, messages, fileinfo, roomname, owndetails, members, avatars, names):
+    messages = [msg for msg in messages if "xxXXxx" not in msg.personId]
+    newest = max(messages, key=lambda msg: msg.created)
+    state = {"roomId": myroom,
+             "roomName": roomname,
+             "download": downloadFiles,
+             "userAvatar": userAvatar,
+             "lastMessageId": newest['id'],
+             "lastCreated": newest['created'],
+             "me": {"displayName": owndetails.get('displayName', ""), "emails": owndetails.get('emails', [])},
+             "memberships": members,
+             "avatars": avatars,
+             "names": names,
+             "files": fileinfo,
+             "messages": messages}
+    statefile = os.path.join(folder, archiveStateFile)
+    with open(statefile + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(state, f, default=Message.to_dict)
+    os.replace(statefile + ".tmp", statefile)  # never leave a half written state file
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION searchindex: the words of a message text for the search index: lower case, at least
+#          2 characters (max. 30: longer words are cut), every word once
+def search_words(text):
+    return {word[0:30] for word in re.findall(r'\w+', text.lower()) if len(word) > 1}
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION searchindex: write the search data (javascript, loaded by the search box): the message
+#          numbers of every word are delta-encoded (difference with the previous number, base 36).
+#          The words are sorted: the same archive always gives the same file.
+def write_search_index(filename, searchtokens, searchmessages, searchauthors, pages):
+    tokens = dict()
+    for word, numbers in sorted(searchtokens.items()):
+        deltas = list()
+        previous = 0
+        for number in numbers:
+            deltas.append(base36(number - previous))
+            previous = number
+        tokens[word] = ",".join(deltas)
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write("var searchData = ")
+        json.dump({"pages": pages, "authors": searchauthors, "messages": searchmessages, "tokens": tokens}, f, ensure_ascii=False, separators=(',', ':'))
+        f.write(";\n")
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION searchindex: number in base 36 (0-9, a-z): short message numbers in the search data
+def base36(number):
+    digits = ""
+    while True:
+        number, digit = divmod(number, 36)
+        digits = "0123456789abcdefghijklmnopqrstuvwxyz"[digit] + digits
+        if number == 0:
+            return digits
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION htmlpages: write one page of the archive: header + navigation, the message HTML
+#          (copied from the temporary file, which is emptied for the next page), navigation + footer
+def write_html_page(filename, header, navigation, bodyfile):
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(header + navigation)
+        bodyfile.seek(0)
+        shutil.copyfileobj(bodyfile, f)
+        f.write(navigation + htmlfooter + imagepopupdiv + "</body></html>\n")
+    bodyfile.seek(0)
+    bodyfile.truncate()
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION htmlpages: navigation on every page: index page, previous and next page.
+#          pages: (filename, title) of the previous / next page or None
+def page_navigation(indexfile, previouspage, nextpage):
+    navigation = f"<div class='css_pagenav'><a href='{urllib.parse.quote(indexfile)}'>Index</a>"
+    if previouspage:
+        navigation += f" &nbsp;&nbsp; <a href='{urllib.parse.quote(previouspage[0])}'>&#9664; {previouspage[1]}</a>"
+    if nextpage:
+        navigation += f" &nbsp;&nbsp; <a href='{urllib.parse.quote(nextpage[0])}'>{nextpage[1]} &#9654;</a>"
+    return navigation + "</div>"
 
 
 # ----------------------------------------------------------------------------------------
@@ -1310,30 +3270,23 @@ def get_utc_offset(my_date):
 
 
 # ----------------------------------------------------------------------------------------
-# FUNCTIONs to analyze what takes the most time. Enable by setting printPerformanceReport (top) to true
-performanceReport = " ______________________________________________________\n"
-performanceReport += "   Performance Report - space archive script \n"
-performanceReport += " ______________________________________________________"
-start_time = time.time()
-def startTimer():
-    global start_time
-    start_time = time.time()
-def stopTimer(description, dl_timer):
-    t_sec = round(time.time() - start_time, 2)
-    if dl_timer > 0:
-        t_sec = t_sec - dl_timer
-    global performanceReport
-    performanceReport += f"\n {t_sec:7.1f} " + description
-# Performance counters for downloading files
-dl_timer = time.time()
-dl_duration_total = 0
-def startTimerFiledownload():
-    global dl_timer
-    dl_timer = time.time()
-def stopTimerFiledownload():
-    t_sec = round(time.time() - dl_timer, 2)
-    global dl_duration_total
-    dl_duration_total += t_sec
+# CLASS PerformanceReport: to analyze what takes the most time. Enable by setting printPerformanceReport (top)
+#       to true. One report per archived space (batch mode: spaces are archived at the same time).
+class PerformanceReport:
+    def __init__(self):
+        self.text = " ______________________________________________________\n"
+        self.text += "   Performance Report - space archive script \n"
+        self.text += " ______________________________________________________"
+        self.startTime = time.time()
+
+    def start(self):
+        self.startTime = time.time()
+
+    def stop(self, description, dl_timer):
+        t_sec = round(time.time() - self.startTime, 2)
+        if dl_timer > 0:
+            t_sec = t_sec - dl_timer
+        self.text += f"\n {t_sec:7.1f} " + description
 
 
 # ------------------------------------------------------------------------
@@ -1341,10 +3294,56 @@ def stopTimerFiledownload():
 #
 # ------------------------------------------------------------------------
 
+# ===== WEBEX CLIENT: shared connection pool for all API calls & downloads
+# ===== CACHE DATABASE: one SQLite connection for the attachment info cache, people cache and room index
+cacheDatabase = CacheDatabase(fileCacheFile)
+
+# ===== ATTACHMENT INFO CACHE: no HEAD request for attachments that were checked before
+fileCache = None
+if fileCacheMode != "no" and downloadFiles != "no" and not renderArchive:
+    fileCache = FileCache(cacheDatabase, fileCacheMode == "refresh")
+
+# ===== FILE STORE: every downloaded attachment is stored once (optional)
+fileStore = None
+if fileStoreFolder != "" and downloadFiles in ['images', 'files', 'image', 'file'] and not renderArchive:
+    fileStore = FileStore(fileStoreFolder, fileStoreLink)
+
+# ===== PEOPLE CACHE: person details (avatars, names) are requested once every 'peoplecache' days
+peopleCache = None
+if peopleCacheDays != 0 and not renderArchive:
+    peopleCache = PeopleCache(cacheDatabase, peopleCacheDays)
+
+# ===== ROOM INDEX: the space search uses a local index of your spaces
+roomIndex = None
+if roomIndexMinutes != 0 and mySearch != "":
+    roomIndex = RoomIndex(cacheDatabase, roomIndexMinutes)
+
+# ===== ARCHIVE DATABASE: all archived spaces in one SQLite database (optional)
+archiveDb = None
+if archiveDbFile != "" and not renderArchive:
+    archiveDb = ArchiveDatabase(archiveDbFile)
+    if archiveDb.failed:  # no FTS5, or the database can't be used: archive without it
+        archiveDb = None
+
+# ===== AVATAR CACHE: every avatar image is downloaded once, and again only when it changed
+avatarCache = None
+if avatarCacheFolder != "" and userAvatar == "download" and not renderArchive:
+    avatarCache = AvatarCache(avatarCacheFolder, fileStoreLink)
+
+#   batch mode: all spaces share this pool, every space can download 'downloadthreads' files at the same time
+#   asyncio engine: the pool size is the max. number of requests in flight (one semaphore)
+httpPoolSize = max(httpPoolSize, max(downloadThreads, messageWindows) * (batchThreads if batchFile else 1))
+if httpEngine == "requests":
+    webex = WebexClient(myToken, httpPoolSize, httpTimeout, RateLimiter(rateLimit))
+else:
+    webex = AsyncWebexClient(myToken, httpPoolSize, httpTimeout, RateLimiter(rateLimit),
+                             AiohttpBackend(httpPoolSize) if httpEngine == "aiohttp" else RequestsBackend(httpPoolSize))
+
+
 # ----------------------------------------------------------------------------------------
 # ===== SEARCH SPACES: If parameter provided, use it to search in your spaces, display result and exit
 if mySearch != "":
-    spaceSearchResult_group, spaceSearchResult_direct = get_searchspaces(myToken, mySearch)
+    spaceSearchResult_group, spaceSearchResult_direct = get_searchspaces(mySearch)
     if len(spaceSearchResult_group.items()) > 0:
         print("___________________________ group _______________________\n")
         for key, value in spaceSearchResult_group.items():
@@ -1375,554 +3374,14 @@ if dst_start != "":
         utc_offset['summer'], utc_offset['winter'] = utc_offset['winter'], utc_offset['summer']
 
 
-# =====  GET SPACE NAME ========================================================
-#   used for the space name in the header and optionally the output foldername
-startTimer()
-try:
-    roomName = get_roomname(myToken, myRoom)
-    print(f" #1 --- Get SPACE NAME: '{roomName}'")
-except Exception as e:
-    print(" #1 --- get SPACE NAME: **ERROR** getting space name")
-    print(f"             Error message: {e}\n\n")
-    exit()
-stopTimer("get space name", 0)
-# If no outputFileName has been configured: use the space name
-if outputFileName == "":
-    outputFileName = format_filename(roomName)
-myOutputFolder = outputFileName
-
-
-# =====  GET MESSAGES ==========================================================
-startTimer()
-print(" #2 --- Get MESSAGES")
-try:
-    WebexMessages = get_messages(myToken, myRoom, max_messages)
-except Exception as e:
-    print(" **ERROR** STEP #2: getting Messages")
-    print(f"             Error message: {e}\n\n")
-    exit()
-if len(WebexMessages) == 0:  # for spaces that have no messages (anymore)
-    print(" **ERROR** STEP #2: getting Messages")
-    print(f"             No messages found\n\n")
-    exit()
-stopTimer("get messages", 0)
-
-
-# ===== CREATE USERLIST ========================================================
-#   Collect only userId's of users who wrote a message. For those users we will
-#   retrieve details & download/link avatars
-startTimer()
-uniqueUserIds = list()
-for myUser in WebexMessages:
-    if myUser['personId'] not in uniqueUserIds and "xxXXxx" not in myUser['personId']:
-        uniqueUserIds.append(myUser['personId'])
-stopTimer("get unique user ids", 0)
-
-
-# =====  GET MEMBER NAMES ======================================================
-# myMembers used # of space members (stats).
-# myMemberList is used to get the displayName of users (msg only show email address - personEmail)
-startTimer()
-print(" #3 --- Get MEMBER List")  # Put ALL members in a dictionary that contains: "email + fullname"
-try:
-    myMembers = get_memberships(myToken, myRoom, 800)
-    for members in myMembers:
-        try:
-            myMemberList[str(members['personEmail'])] = str(members['personDisplayName'])
-        except Exception as e:  # IF there's no personDisplayName, use email
-            myMemberList[str(members['personEmail'])] = str(members['personEmail'])
-except Exception as e:
-    print(" **ERROR** STEP #3: getting Memberlist (email address)")
-    print(f"             Error message: {e}")
-stopTimer("get memberlist", 0)
-
-
-# =====  CREATE FOLDERS FOR ATTACHMENTS & AVATARS ==============================
-startTimer()
-print(f" #4a--- Create FOLDER for HTML. Download files? {downloadFiles}")
-if not os.path.exists(myOutputFolder):
-    print(f"          folder does NOT exist: {myOutputFolder}")
-else:   # check if folder-01 exists, if yes, check if folder-02 exists, etc.
-    folderCounter = 1
-    print(f"          folder EXISTS  : {myOutputFolder}")
-    while os.path.exists(myOutputFolder + "-" + "{:02d}".format(folderCounter)):
-        folderCounter += 1
-    myOutputFolder += "-" + "{:02d}".format(folderCounter)
-print(f"          Output folder  : {myOutputFolder}")
-os.makedirs(myOutputFolder)
-if userAvatar == "download":
-    os.makedirs(myOutputFolder + "/avatars/")
-if "file" in downloadFiles:
-    os.makedirs(myOutputFolder + "/files/")
-    os.makedirs(myOutputFolder + "/images/")
-if "image" in downloadFiles:
-    os.makedirs(myOutputFolder + "/images/")
-stopTimer("create folders", 0)
-
-
-# =====  GET MEMBER AVATARS ====================================================
-startTimer()
-if userAvatar == "link" or userAvatar == "download":
-    print(" #4b--- MEMBER Avatars: collect avatar Data (" + str(len(uniqueUserIds)) + ")  ", end='', flush=True)
-    userAvatarDict = dict()  # --> userAvatarDict[your@email.com] = "https://webex_message_avatarurl"
-    x = 0
-    y = len(uniqueUserIds)
-    if 50 > y:
-        chunksize = y
-    else:
-        chunksize = 50
-    if y < 50:
-        chunksize = y
-    for i in range(x, y, chunksize):  # - LOOPING OVER MemberDataList in chunks of xx
-        x = i
-        person_list = get_persondetails(myToken, uniqueUserIds[x:x + chunksize])
-        print(".", end='', flush=True)  # Progress indicator
-        for persondetails in person_list:
-            try:
-                userAvatarDict[persondetails['id']] = persondetails['avatar'].replace("~1600", "~80")
-            except:
-                print('', end='')
-    print(".", flush=False)  # Progress Indicator
-stopTimer("get avatars", 0)
-
-startTimer()
-if userAvatar == "link" or userAvatar == "download":
-    print(" #4c--- MEMBER Avatars: downloading avatar files for " + str(len(userAvatarDict)) + " members  ")  #, end='', flush=True)
-    if userAvatar == "download":
-        download_avatars(userAvatarDict)
-stopTimer("download avatars", 0)
-
-
-# =====  GET MY DETAILS ========================================================
-startTimer()
-try:
-    myOwnDetails = get_me(myToken)
-    myEmail = "".join(myOwnDetails['emails'])
-    myName = myOwnDetails['displayName']
-    myDomain = myEmail.split("@")[1]
-    print(f" #5 --- Get my details: {myEmail}")
-except Exception as e:
-    print(f"\n #5 --- Get my details: **ERROR** : {e}\n\n myOwnDetails data retrieved: \n{myOwnDetails}")
-stopTimer("get my details", 0)
-
-
-# =====  SET/CREATE VARIABLES ==================================================
-tocList = ""
-statTotalFiles = 0
-statTotalImages = 0
-statTotalFilesSize = 0
-statTotalImagesSize = 0
-statTotalMessages = len(WebexMessages)
-statTotalMentions = 0
-myDomainStats = dict()
-statMessageMonth = dict()
-previousEmail = ""
-previousMonth = ""
-previousMsgCreated = ""
-TimezoneName = str(time.tzname[time.localtime().tm_isdst])
-
-
-# ======  GENERATE HTML HEADER =================================================
-#
-print(f" #6 --- Generate HTML header")
-configFileInfo = ""
-if configFile != originalConfigFile:
-    configFileInfo = f"Config file: <span style='color:yellow'>{configFile}</span>"
-dst_msg = "NO"
-if dst_start != "":
-    # below: changing dst_start/stop to string
-    dst_msg = (str(dst_start) + "/" + str(dst_stop)).replace(" ", "").replace("[", "").replace("]", "").replace("'", "")
-blur_msg = "YES"
-if blurring == "":
-    blur_msg = "NO"
-outputjson_msg = outputToJson.replace("yes", "json/txt").replace("both", "json/txt")
-htmlheader += f"<div class='cssRoomName'>   {roomName}&nbsp;&nbsp;&nbsp;<br><span style='float:left;margin-top:8px;padding-bottom:11px;"
-htmlheader += f"font-size:10px;color:#fff'> CREATED: <span style='color:yellow'>{currentDate}</span>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;  Generated by: <span "
-htmlheader += f"style='color:yellow'>{myName}</span> &nbsp;&nbsp;&nbsp;&nbsp;&nbsp;  {configFileInfo}"
-htmlheader += f"&nbsp;&nbsp;&nbsp; version:  {version}&nbsp;&nbsp;&nbsp;<br>Sort old-new: <span style='color:yellow'>"
-htmlheader += str(sortOldNew).replace("True", "yes (default)").replace("False", "no") + f"</span> &nbsp;&nbsp; Max messages:"
-htmlheader += f"<span style='color:yellow'> {maxMessageString} </span>&nbsp;&nbsp; File Download: <span style='color:yellow'>{downloadFiles.upper()}</span>"
-htmlheader += f"&nbsp;&nbsp; Avatar: <span style='color:yellow'>{userAvatar.upper()}</span>&nbsp;&nbsp; Message timezone: <span style='color:yellow'>{TimezoneName}</span>"
-htmlheader += f"&nbsp;&nbsp; DST configured: <span style='color:yellow'>{dst_msg}</span>"
-htmlheader += f"&nbsp;&nbsp; Output: <span style='color:yellow'>{outputjson_msg}</span>"
-htmlheader += f"&nbsp;&nbsp; Blurring: <span style='color:yellow'>{blur_msg}</span></span></div><br>"
-
-
-# ====== GENERATE FINAL HTML ===================================================
-#  for all messages (and optionally a .txt file with all messages)
-#
-startTimer()  # for generating the full HTML file
-
-# ___ first create msg order table
-startTimer()
-sortedMessages = sorted(WebexMessages, key=lambda i: i['created'], reverse=False)
-stopTimer("sort WebexMessages", 0)
-
-startTimer()
-# --- Message order table: create
-msgOrderTable, missing_parent_msglist = create_threading_order_table(sortedMessages)
-if len(missing_parent_msglist) > 0:
-    WebexMessages += missing_parent_msglist
-    sortedMessages = sorted(WebexMessages, key=lambda i: i['created'], reverse=False)
-
-# --- Sort Messages: process all msgs defined by the "threading index"-table order
-if sortOldNew:
-    sortedMsgOrderTable = sorted(msgOrderTable, key=lambda x: (float(x), -int(float(x))))
-else:
-    sortedMsgOrderTable = sorted(msgOrderTable, key=lambda x: (-int(float(x)), float(x)))
-stopTimer("create threading order table", 0)
-
-print(f" #7 --- Generate HTML code for {len(sortedMsgOrderTable)} messages" + (" AND downloading all " + downloadFiles if downloadFiles in ['images', 'files', 'image', 'file'] else ""))
-htmldata = ""
-textOutput = ""
-if outputToText:
-    textOutput += f"------------------------------------------------------------\n {roomName}\n------------------------------------------------------------\n"
-    textOutput += f"CREATED:        {currentDate}\nFile Download:  {downloadFiles.upper()}\nGenerated by:   {myName}\nSort old-new:   "
-    textOutput += str(sortOldNew).replace("True", "yes (default)").replace("False", "no") + f"\nMax messages:   {maxMessageString}\nAvatar:"
-    textOutput += f"         {userAvatar} \nversion:        {version} \nTimezone:       {TimezoneName}\nDST configured:     "
-    if dst_start == "":
-        textOutput += "No\n"
-    else:
-        textOutput += "Yes\n"
-
-
-# ====== WRITE JSON data to a FILE =============================================
-#   (optional) Write JSON to a FILE to be used as input (not using the Webex Message APIs)
-startTimer()
-if outputToJson == "yes" or outputToJson == "both" or outputToJson == "json":
-    with open(myOutputFolder + "/" + outputFileName + ".json", 'w', encoding='utf-8') as f:
-        json.dump(WebexMessages, f)
-stopTimer("output to json", 0)
-
-
-# Progress bar:
-mycounter = 0
-download_stats = ""
-progress_steps = int(len(sortedMsgOrderTable) / 20)
-if progress_steps < 1:
-    progress_steps = 1  # Fix issue with low number of maxtotalmessages v0.22
-# --- PROCESS EVERY MESSAGE ----------------------------------------------------
-for index, key in enumerate(sortedMsgOrderTable):
-    mycounter += 1
-    current_step = mycounter / progress_steps
-    if (current_step - int(current_step)) == 0:
-        current_step = int(current_step)
-        sys.stdout.write('\r')
-        # the exact output you're looking for:
-        sys.stdout.write("          [%-20s] %d%%  |  count: %d" % ('=' * current_step, 5 * current_step, mycounter))
-        sys.stdout.flush()
-    # find matching message ID in message list
-    msg = next(item for item in WebexMessages if item["id"] == msgOrderTable[key])
-    try:
-        previousitem = float(sortedMsgOrderTable[index - 1])
-        currentitem = float(sortedMsgOrderTable[index])
-        if previousitem - round(previousitem) == 0 and currentitem - round(currentitem) > 0:
-            # START of threaded message!
-            threadstart = True
-        else:
-            threadstart = False
-        if currentitem - round(currentitem) > 0:
-            threaded_message = True
-        else:
-            threaded_message = False
-    except:
-        threadstart = False
-        threaded_message = False
-
-    # --- continue processing messages
-    if len(msg) < 5:
-        print("_EMPTYmessage_")
-        continue        # message empty
-
-    data_text = ""
-    # --- if msg was updated: add 'Edited' in date
-    if "updated" in msg:
-        data_msg_was_edited = True
-        data_created = convertDate(str(msg['created']), "%A %H:%M      (%b %d, %Y)") + "   -  edited at " + convertDate(str(msg['updated']), "%H:%M  %b %d")
-    else:
-        data_msg_was_edited = False
-        data_created = convertDate(str(msg['created']), "%A %H:%M      (%b %d, %Y)")
-    # --- HTML in message? Deal with markdown
-    if "html" in msg:
-        # --- Check if there are Markdown hyperlinks [linktext](www.cisco.com) as these look very different
-        if "sparkBase.clickEventHandler(event)" in str(msg['html']):
-            data_text = convertMarkdownURL(str(msg['html']), 1)
-            data_text = convertMarkdownURL(data_text, 2)
-        else:
-            data_text = convertURL(str(msg['html']))
-    elif "text" in msg:
-        data_text = convertURL(msg['text'])
-        data_text = data_text.replace("<script", "<pre>&lt;")  # --- Replace script in 'text' msg (stopping HTML generation) - 0.20b
-        if "<code>" in data_text:
-            if "</code>" not in data_text:
-                data_text += "</code>"
-        data_text = data_text.replace("<", "&lt;").replace(">", "&gt;")  # make sure html in 'text' is not interpreted (v25) except for hyperlinks
-        data_text = data_text.replace("&lt;a href", "<a href").replace("&lt;/a&gt;", "</a>").replace("blank'&gt;", "blank'>")
-        data_text = str(data_text).replace("\n", "<br>")  # replace \n with <br> - 0.22d3
-    if data_text == "" and 'files' not in msg and 'mentionedPeople' not in msg:
-        # empty text without mentions or attached images/files: SKIP
-        print("_EMPTYmessage_")
-        continue
-    try:  # Put email & name in variable
-        data_email = str(msg['personEmail'])
-        data_userid = str(msg['personId'])
-        data_name = myMemberList[msg['personEmail']]
-    except:
-        data_name = data_email
-    if '@' in data_email and "error.com" not in data_email:
-        domain = str(data_email.split('@')[1])
-        myDomainStats[domain] = myDomainStats.get(domain, 0) + 1
-    messageYear, messageMonth, messageMonthNr = get_monthday(msg['created'])
-    # ====== GENERATE MONTH STATISTICS
-    statMessageMonthKey = messageYear + " - " + messageMonthNr + "-" + messageMonth
-    #  IF message is THREADED _AND_ the key doesn't exist: skip
-    # >>> below: if/print/else statement are added
-    if threaded_message and statMessageMonthKey not in statMessageMonth:
-        pass
-    else:
-        statMessageMonth[statMessageMonthKey] = statMessageMonth.get(statMessageMonthKey, 0) + 1
-    if messageMonth != previousMonth and not threaded_message:
-        htmldata += f"<div class='cssNewMonth' id='{statMessageMonthKey}'>   {messageYear}    <span style='color:#C3C4C7'>" + messageMonth + "</span><span style='float:right; font-size:56px; color:lightgrey;margin-right:15px; padding-top:0px;'><a href='#top' style='text-decoration:none;color:inherit;'>▲</a></span></div>"
-        if outputToText:  # for .txt output
-            textOutput += f"\n\n---------- {messageYear}    {messageMonth} ------------------------------\n\n"
-    # ====== if PREVIOUS email equals current email, then skip header
-    if threaded_message:  # ___________________________________ start thread ______________________________
-        htmldata += "<div class='css_message_thread'>"
-    else:
-        htmldata += "<div class='css_message'>"
-
-    # ====== AVATAR: + msg header: display or not
-    if (data_email != previousEmail) or (data_email == previousEmail and timedifference(msg["created"], previousMsgCreated) > 60) or (data_msg_was_edited):
-        if userAvatar == "link" and data_userid in userAvatarDict:
-            htmldata += f"<img src='{userAvatarDict[data_userid]}' class='avatarCircle'  width='36px' height='36px'/>"
-        elif userAvatar == "download" and data_userid in userAvatarDict:
-            htmldata += f"<img src='avatars/" + data_userid + ".jpg' class='avatarCircle'  width='36px' height='36px'/>"
-        else:  # User that may not exist anymore --> use email as name
-            if data_name == data_email:
-                htmldata += f"<div id='avatarCircle'>{data_name[0:2].upper()}</div>"
-            else:
-                # show circle with initials instead of avatar
-                try:
-                    htmldata += "<div id='avatarCircle'>" + data_name.split(" ")[0][0].upper() + data_name.split(" ")[1][0].upper() + "</div><div class='css_message'>"
-                except:  # Sometimes there's no "first/last" name. If one word, take the first 2 characters.
-                    htmldata += "<div id='avatarCircle'>" + data_name[0:2].upper() + "</div>"
-
-        msgDomain = data_email.split("@")[1]    # Get message sender domain
-        if myDomain == msgDomain:               # If domain <> own domain, use different color
-            htmldata += f"<span class='css_email{blurring}' title='{data_email}'>{data_name}</span>"
-        else:
-            htmldata += "<span class='css_email" + blurring + "' title='" + data_email + "'>" + data_name + "</span>   <span class='css_email_external" + blurring + "'>(@" + data_email.split("@")[1] + ")</span>"
-        htmldata += f"<span class='css_created'>{data_created}</span>"
-    else:
-        htmldata += "<div class='css_message'>"
-
-    if outputToText:  # for .txt output
-        if blurring != "":
-            data_email = "_____@_____.__"
-        if threaded_message:  # add ">>" to text output to indicate a thread v0.23
-            textOutput += convertDate(str(msg['created']), "%A %H:%M      (%b %d, %Y)") + "  >> " + data_email + ": "
-        else:
-            textOutput += convertDate(str(msg['created']), "%A %H:%M      (%b %d, %Y)") + "  " + data_email + ": "
-
-    # ====== DEAL WITH MENTIONS IN A MESSAGE
-    if 'mentionedPeople' in msg:
-        try:
-            statTotalMentions += 1
-            for item in msg['mentionedPeople']:
-                texttoreplace = "<spark-mention data-object-type=\"person\" data-object-id=\"" + item + "\">"
-                data_text = data_text.replace(texttoreplace, "<span class='atmention" + blurring + "'>@")
-            data_text = data_text.replace("</spark-mention>", "</span>")
-        except:
-            print(" **ERROR** processing mentions, don't worry, I will continue")
-    if 'mentionedGroups' in msg:
-        try:
-            statTotalMentions += 1
-            for item in msg['mentionedGroups']:
-                texttoreplace = "<spark-mention data-object-type=\"groupMention\" data-group-type=\"" + item + "\">"
-                data_text = data_text.replace(texttoreplace, "<span style='color:red;display:inline;'>@")
-            data_text = data_text.replace("</spark-mention>", "</span>")
-        except:
-            print(" **ERROR** processing mentions, don't worry, I will continue")
-    # check if msg is a card. If yes: add "cannot display" message
-    try:
-        if "contentType" in msg["attachments"][0]:
-            is_card = True
-    except:
-        is_card = False
-    if is_card:
-        data_text = "<span class='card_class'>&nbsp;<span style='color:red'>Card</span>&nbsp; content cannot be displayed in this archive&nbsp;</span>&nbsp;  " + data_text
-    htmldata += "<div class='css_messagetext'>" + data_text
-    if outputToText and 'text' in msg:  # for .txt output
-        if msg['text'] == "":
-            myErrorList.append("processing msgs: msg WITH html WITHOUT text? html: " + msg['html'] + " -- msg id: " + msg['id'])
-        p = re.compile(r'<.*?>')
-        textOutput += p.sub('', msg['text']).replace("\"", "'").replace("\n", " ").replace("\r", " ")
-        textOutput += "\n\r"
-    if outputToText and 'text' not in msg and 'files' not in msg:
-        textOutput += "\n\r"
-
-    # ====== DEAL WITH FILE ATTACHMENTS IN A MESSAGE
-    if 'files' in msg:
-        startTimerFiledownload()
-        if data_text != "":
-            htmldata += "<br>"
-        if downloadFiles == "no":   # download=no  - only show "file attachment", no details whatsoever
-            for i in range(len(msg['files'])):
-                htmldata += f"<br><div id='fileicon'></div><span style='line-height:32px;'> attached_file</span>"
-                statTotalFiles += 1
-            if outputToText:
-                textOutput += f" <File Attachment> \n\n"  # v26
-        else:  # download=info/images/files
-            myFiles = process_Files(msg['files'], msg['created'])
-            # SORT attached files by <files> _then_ <images>
-            myFiles.sort(key=lambda x: x.split("###")[0].split(".")[-1] in ['jpg', 'png', 'jpeg', 'gif', 'bmp', 'tif', 'heic', 'avif', 'webp'])
-            splitFilesImages = ""
-            for filename in myFiles:
-                # IMAGE POPUP
-                filename, filesize = filename.split("###")
-                if int(filesize) == 0:
-                    filesize_fancy = "0 B"
-                else:
-                    filesize_fancy = convert_size(filesize)
-                fileextension = os.path.splitext(filename)[1][1:].lower()
-                if fileextension in ['jpg', 'png', 'jpeg', 'gif', 'bmp', 'tif', 'heic', 'avif', 'webp'] and (downloadFiles in ["images", "files", "image", "file"]):
-                    if splitFilesImages == "":
-                        # extra return after all attached files are listed
-                        htmldata += "<br>"
-                        splitFilesImages = "done"
-                    htmldata += f"<div class='css_created'><img src='images/{filename}' title='click to zoom' onclick='onClick(this)' class='image-hover-opacity' /><br>{filename}<br><div class='filesize'>{filesize_fancy}</div> </div>"
-                elif "file" in downloadFiles:
-                    htmldata += f"<br><div id='fileicon'></div><span style='line-height:32px;'><a href='files/{filename}'>{filename}</a>  ({filesize_fancy})</span>"
-                else:
-                    htmldata += f"<br><div id='fileicon'></div><span style='line-height:32px;'> {filename}   ({filesize_fancy})</span>"
-                if fileextension in ['jpg', 'png', 'jpeg', 'gif', 'bmp', 'tif', 'heic', 'avif', 'webp']:
-                    statTotalImages += 1
-                    statTotalImagesSize += int(filesize)
-                else:
-                    statTotalFiles += 1
-                    statTotalFilesSize += int(filesize)
-                if outputToText:  # for .txt output
-                    textOutput += f"                           Attachment: {filename} ({filesize_fancy})\n"
-        stopTimerFiledownload()
-    htmldata += "</div>"    # css_messagetext
-    htmldata += "</div>"    # css_message or css_message_thread
-    htmldata += "</div>"    # other div - needed!
-    previousEmail = data_email
-    if not threaded_message:
-        previousMonth = messageMonth
-    previousMsgCreated = msg['created']
-    if downloadFiles in ['images', 'files', 'image', 'file'] and (statTotalFiles + statTotalImages) > 0 and dl_duration_total > 0:
-        download_stats = f"\n {dl_duration_total:7.1f} download of {downloadFiles.replace('files', 'images and files')} ({statTotalFiles + statTotalImages} files,  {round((statTotalFiles + statTotalImages) / dl_duration_total, 2)} files/sec)"
-    elif downloadFiles == "info" and dl_duration_total > 0:
-        download_stats = f"\n {dl_duration_total:7.1f} process filenames ({statTotalFiles + statTotalImages} files, {round((statTotalFiles + statTotalImages) / dl_duration_total, 1)} files/sec)"
-    else:
-        download_stats = ""
-stopTimer("generate HTML messages (" + str(round(len(sortedMsgOrderTable), 1)) + ")" + download_stats, dl_duration_total)
-
-
-# ======  *SORT* DOMAIN USER STATISTICS
-startTimer()
-myDomainStatsSorted = sorted(
-    [(v, k) for k, v in myDomainStats.items()], reverse=True)
-myDomainStatsSorted = myDomainStatsSorted[0:10]  # only want the top 10
-returntextDomain = ""
-returntextMsgMonth = ""
-stopTimer("sorting messages", 0)
-
-
-# ======  TABLE OF CONTENTS
-startTimer()
-# If message sorting is old-to-new, also sort the TOC
-if sortOldNew:  # Default
-    mytest = sorted(statMessageMonth.items(), reverse=False)
-else:
-    mytest = sorted(statMessageMonth.items(), reverse=True)
-my_yearcounter = 0
-prev_year = 0
-tocList = "<table style='width: 290px;'>"
-for k, v in mytest:
-    pr_year = int(k.split("-")[0])
-    pr_monthname = k.split("-")[2]
-    if prev_year != pr_year:
-        tocList += f"</table><a href='javascript:;' onclick=show('{pr_year}') style='text-decoration: none;font-weight:bolder;font-size'> <div id='yeararrow{pr_year}' style='display:inline;'>▼</div>  {pr_year}</span></a><br>"
-        tocList += f"<table id='expand year-{pr_year}' style='width: 290px;'>"
-        tocList += "<tr><td>"
-        my_yearcounter += 1
-    else:
-        tocList += "<tr><td>"
-    tocList += f"<a href='#{k}' style='text-decoration:none;'>&nbsp;&nbsp;{pr_year} - {pr_monthname}</a></td>"
-    tocList += f"<td><span class='month_msg_count'>{v:,}</span></td></tr>"
-    prev_year = pr_year
-
-messageType = "newest"
-if not sortOldNew:
-    messageType = "oldest"
-tocList += "</table>"
-tocList += "<table><tr><td colspan='2'>&nbsp;&nbsp;&nbsp;<span style='font-size:11px;'><a href='#endoffile' style='text-decoration:none;'>" + messageType + " message</a></span></td></tr></table>"
-
-
-# ======  DOMAIN MESSAGE STATISTICS
-total_stat_users = 0
-returntextDomain += "<table id='mytoc' style='width: 220px;'>"
-for domain in myDomainStatsSorted:
-    if domain[1] == "user_removed_their_msg.com":
-        continue
-    if blurring != "":
-        blurring = "class='myblur'"
-    returntextDomain += f"<tr><td {blurring}>{domain[1]}</td><td style='text-align:right;'>{domain[0]:,}</td>"
-    total_stat_users += int(domain[0])
-if (statTotalMessages - total_stat_users) > 0 and len(myDomainStatsSorted) > 9:
-    returntextDomain += f"<tr><td>...other domains</td><td style='text-align:right;'>{(statTotalMessages-total_stat_users):,}</td>"
-returntextDomain += "</table>"
-
-
-# ======  MESSAGE & FILE STATISTICS
-tocStats = "<table id='mytoc' style='width: 250px;'>"
-tocStats += f"<tr><td># of messages: </td><td style='text-align:right;'> {len(sortedMsgOrderTable):,} </td></tr>"
-#  ^^^^ 0.26d don't show total msg downloaded but the actual number of msg
-if statTotalImages > 0:
-    tocStats += f"<tr><td> # images: "
-    if downloadFiles in ['no', 'info']:
-        tocStats += f"<span style='color:grey;font-size:10px;'>not downloaded</span> "
-    tocStats += f"</td><td style='text-align:right;'> {statTotalImages:,} </td></tr>"
-if statTotalImages > 0 and statTotalImagesSize > 0:
-    tocStats += f"<tr><td>&nbsp;&nbsp;&nbsp;size: </td><td style='text-align:right;'> {convert_size(statTotalImagesSize)} </td></tr>"
-    tocStats += f"<tr><td>&nbsp;&nbsp;&nbsp;average size: </td><td style='text-align:right;'> {convert_size(statTotalImagesSize / statTotalImages)} </td></tr>"
-tocStats += f"<tr><td> # files: "
-if downloadFiles in ['no', 'info', 'images', 'image']:
-    tocStats += f"<span style='color:grey;font-size:10px;'>not downloaded</span> "
-tocStats += f"</td><td style='text-align:right;'> {statTotalFiles:,} </td></tr>"
-if statTotalFiles > 0 and statTotalFilesSize > 0:
-    tocStats += f"<tr><td>&nbsp;&nbsp;&nbsp;size: </td><td style='text-align:right;'> {convert_size(statTotalFilesSize)} </td></tr>"
-    tocStats += f"<tr><td>&nbsp;&nbsp;&nbsp;average size: </td><td style='text-align:right;'> {convert_size(statTotalFilesSize / statTotalFiles)} </td></tr>"
-tocStats += f"<tr><td># @mentions: </td><td style='text-align:right;'> {statTotalMentions:,} </td></tr>"
-tocStats += f"<tr><td># total members: </td><td style='text-align:right;'> {len(myMembers):,} </td></tr>"
-tocStats += f"<tr><td># active members: <br>&nbsp;&nbsp;&nbsp;<span style='font-size:11px;'>(in this archive)</span> </td><td style='text-align:right;'> {len(uniqueUserIds):,} </td></tr>"
-if statTotalMessages > maxTotalMessages - 10:
-    tocStats += f"<tr><td colspan='2'><br><span style='color:grey;font-size:10px;'>space contains more than  {statTotalMessages:,} messages</span></td></tr>"
-tocStats += "</table>"
-if outputToText:  # for .txt output
-    textOutput += f"\n\n\n STATISTICS \n--------------------------\n # of messages : {len(sortedMsgOrderTable):,}\n # of images   : {statTotalImages:,}\n # of files    : {statTotalFiles:,}\n # of mentions : {statTotalMentions:,}\n\n\n"
-    #  ^^^^ 0.26d don't show total msg downloaded but the actual number of msg
-
-
-# ======  HEADER
-newtocList = "<table class='myheader' id='myheader'> <tr>"
-newtocList += "<td style='width:300px;'> <strong>Index </strong>"
-newtocList += "<span style='text-decoration:none; font-size:10px;'><a href='javascript:;' onclick='show_showall()'>expand</a> / <a href='javascript:;' onclick='show_hideall()'>collapse</a></span>"
-newtocList += "<br>" + tocList + " </td>"
-newtocList += "<td> <strong>Numbers</strong><br>" + tocStats + " </td>"
-newtocList += "<td> <table id='mytoc' style='width: 220px;'><tr><td style='text-align:left;font-weight:bold;'>Top-10 domains</td><td style='text-align:right;font-weight:bold;'># messages</td></tr></tbody></table>" + returntextDomain + " </td>"
-newtocList += "</tr> </table></div><br><br>"
-
 # ====== IMAGE POPUP
-imagepopuphtml = """      <div id="modal01" class="image-modal" onclick="this.style.display='none'">
+imagepopupdiv = """      <div id="modal01" class="image-modal" onclick="this.style.display='none'">
          <div class="image-modal-content image-animate-zoom">
             <img id="img01" class="imagepopup">
          </div>
       </div>
-         <script>
-            function onClick(element) {
+"""
+imagepopupscript = """            function onClick(element) {
                document.getElementById("img01").src = element.src;
                document.getElementById("modal01").style.display = "block";
             }
@@ -1947,32 +3406,888 @@ imagepopuphtml = """      <div id="modal01" class="image-modal" onclick="this.st
               document.body.scrollTop = 0;
               document.documentElement.scrollTop = 0;
             }
-         </script>
-
+"""
+imagepopuphtml = imagepopupdiv + "         <script>\n" + imagepopupscript + "         </script>\n\n"
+
+# ====== SEARCH BOX (searchindex): searchData (searchIndexFile) has the words of all messages:
+#   tokens: word --> message numbers (delta-encoded, base 36), messages: [date, author] of message number,
+#   pages: [first message number, filename] (htmlpages). The last word matches every word that starts with it.
+htmlsearchbox = "<div style='padding:0px 30px 20px 30px;'><input type='search' id='searchbox' placeholder='Search messages' "
+htmlsearchbox += "oninput='search_messages(this.value)' style='width:400px;font-size:14px;padding:4px;'>"
+htmlsearchbox += "<div id='searchresults' style='font-size:13px;line-height:20px;padding-top:6px;'></div></div>"
+htmlsearchscript = """<script>
+var searchCache = {};
+function search_postings(word) {
+    if (!(word in searchCache)) {
+        var numbers = [];
+        if (searchData.tokens.hasOwnProperty(word)) {
+            var n = 0;
+            searchData.tokens[word].split(',').forEach(function (delta) { n += parseInt(delta, 36); numbers.push(n); });
+        }
+        searchCache[word] = numbers;
+    }
+    return searchCache[word];
+}
+var searchWords = null;
+function search_prefix(prefix) {
+    if (searchWords == null) {
+        searchWords = Object.keys(searchData.tokens).sort();
+    }
+    var low = 0, high = searchWords.length;
+    while (low < high) {
+        var middle = (low + high) >> 1;
+        if (searchWords[middle] < prefix) { low = middle + 1; } else { high = middle; }
+    }
+    var numbers = new Set();
+    for (var i = low; i < searchWords.length && searchWords[i].startsWith(prefix); i++) {
+        search_postings(searchWords[i]).forEach(function (n) { numbers.add(n); });
+    }
+    return Array.from(numbers);
+}
+function search_link(n) {
+    var page = '';
+    for (var i = 0; i < searchData.pages.length && searchData.pages[i][0] <= n; i++) {
+        page = searchData.pages[i][1];
+    }
+    return encodeURI(page) + '#m' + n;
+}
+function search_messages(query) {
+    var results = document.getElementById('searchresults');
+    results.innerHTML = '';
+    var words = (query.toLowerCase().match(/[\\p{L}\\p{N}_]+/gu) || []).filter(function (word) { return word.length > 1; });
+    words = words.map(function (word) { return word.slice(0, 30); });
+    if (words.length == 0) {
+        return;
+    }
+    var found = search_prefix(words[words.length - 1]);
+    for (var i = 0; i < words.length - 1; i++) {
+        var postings = new Set(search_postings(words[i]));
+        found = found.filter(function (n) { return postings.has(n); });
+    }
+    found.sort(function (a, b) { return a - b; });
+    results.appendChild(document.createTextNode(found.length + ' messages' + (found.length > 100 ? ' (first 100)' : '')));
+    found.slice(0, 100).forEach(function (n) {
+        var link = document.createElement('a');
+        link.href = search_link(n);
+        link.textContent = searchData.messages[n][0];
+        results.appendChild(document.createElement('br'));
+        results.appendChild(link);
+        results.appendChild(document.createTextNode('  ' + searchData.authors[searchData.messages[n][1]]));
+    });
+}
+</script>
 """
 
 # ======  FOOTER
 htmlfooter = "<br><br><div class='cssNewMonth' id='endoffile'> end of file &nbsp;&nbsp;<span style='float:right; font-size:16px; margin-right:15px; padding-top:24px;'><a href='#top' style='text-decoration:none;'>back to top</a></span></div><br><br>"
 
-# ======  PUT EVERYTHING TOGETHER
-print("\n #8 --- Finalizing HTML")
-htmldata = htmlheader + newtocList + htmldata + htmlfooter + imagepopuphtml + "</body></html>"
-stopTimer("generate ToC, statistics, header and footer", 0)
 
+# ----------------------------------------------------------------------------------------
+# FUNCTION archive_space: archive ONE space: messages, members, avatars, attachments and the
+#          HTML (+ optional txt/json) output. myOwnDetails: your details, batch mode gets them once.
+#          Returns the space statistics: roomName, folder, messages, files, seconds, performance report.
+def archive_space(myRoom, myOwnDetails=None):
+    global downloadFiles, userAvatar  # render-only: changed to show the archive like it was saved
+    spaceStartTime = time.time()
+    performanceReport = PerformanceReport()
+
+    # =====  GET SPACE NAME ========================================================
+    #   used for the space name in the header and optionally the output foldername.
+    #   The first API call: a wrong token or space ID stops the script before other calls are started.
+    performanceReport.start()
+    try:
+        if renderArchive:  # RENDER-ONLY: all data comes from the saved archive state file
+            with open(renderArchive, encoding='utf-8') as f:
+                archiveBundle = json.load(f)
+            myRoom = archiveBundle['roomId']
+            roomName = archiveBundle.get('roomName', "webex-space-archive")
+            downloadFiles = archiveBundle.get('download', "no")  # show attachments like they were archived
+            if userAvatar == "download" and archiveBundle.get('userAvatar') != "download":
+                userAvatar = "link"  # there are no downloaded avatar images
+            print(f" #1 --- Render SAVED ARCHIVE: '{roomName}'  (no API calls)")
+        else:
+            roomName = get_roomname(myRoom)
+            print(f" #1 --- Get SPACE NAME: '{roomName}'")
+    except Exception as e:
+        print(" #1 --- get SPACE NAME: **ERROR** getting space name")
+        print(f"             Error message: {e}\n\n")
+        exit()
+    performanceReport.stop("get space name", 0)
+    # If no outputFileName has been configured (or in batch mode): use the space name
+    spaceFileName = outputFileName
+    if spaceFileName == "" or batchFile:
+        spaceFileName = format_filename(roomName)
+    myOutputFolder = spaceFileName
+
+
+    # =====  STARTUP TASKS: API calls that don't need the messages =================
+    #   The member list and my details are requested while the messages are retrieved (thread pool),
+    #   the details (avatars, names) of authors while the next page of messages is retrieved
+    #   (PeopleLookup). Every step below only waits for the result it needs.
+    startupPool = None
+    if not renderArchive:
+        startupPool = ThreadPool(max_workers=4)
+        membersTask = startupPool.submit(get_memberships, myRoom, 800)
+        meTask = startupPool.submit(get_me) if myOwnDetails is None else None
+
+
+    # =====  INCREMENTAL ARCHIVE: load the state of the previous run (if any) ======
+    archiveState = None
+    if incremental and not renderArchive:
+        stateFolder, archiveState = load_archive_state(myOutputFolder, myRoom)
+        if archiveState:
+            print(f"          Incremental: previous archive '{stateFolder}' ({len(archiveState['messages'])} messages, last: {archiveState['lastCreated']})")
+        else:
+            print(f"          Incremental: no previous archive found, creating a new archive")
+
+
+    # =====  CREATE FOLDERS FOR ATTACHMENTS & AVATARS ==============================
+    #   before the messages are retrieved: avatars are downloaded while the messages are retrieved
+    performanceReport.start()
+    print(f" #1b--- Create FOLDER for HTML. Download files? {downloadFiles}")
+    with folderLock:  # batch mode: two spaces must never get the same folder
+        if archiveState:  # incremental archive: update the previous archive folder
+            myOutputFolder = stateFolder
+            print(f"          folder UPDATE  : {myOutputFolder}")
+        elif renderArchive:  # render-only: generate the HTML in the folder of the saved archive
+            myOutputFolder = os.path.dirname(renderArchive) or "."
+            print(f"          folder UPDATE  : {myOutputFolder}")
+        elif not os.path.exists(myOutputFolder):
+            print(f"          folder does NOT exist: {myOutputFolder}")
+        else:   # check if folder-01 exists, if yes, check if folder-02 exists, etc.
+            folderCounter = 1
+            print(f"          folder EXISTS  : {myOutputFolder}")
+            while os.path.exists(myOutputFolder + "-" + "{:02d}".format(folderCounter)):
+                folderCounter += 1
+            myOutputFolder += "-" + "{:02d}".format(folderCounter)
+        print(f"          Output folder  : {myOutputFolder}")
+        os.makedirs(myOutputFolder, exist_ok=True)
+    if userAvatar == "download":
+        os.makedirs(myOutputFolder + "/avatars/", exist_ok=True)
+    if "file" in downloadFiles:
+        os.makedirs(myOutputFolder + "/files/", exist_ok=True)
+        os.makedirs(myOutputFolder + "/images/", exist_ok=True)
+    if "image" in downloadFiles:
+        os.makedirs(myOutputFolder + "/images/", exist_ok=True)
+    performanceReport.stop("create folders", 0)
+
+
+    # =====  GET MESSAGES ==========================================================
+    performanceReport.start()
+    print(" #2 --- Get MESSAGES")
+    spaceMaxMessages = maxTotalMessages
+    peopleLookup = None
+    if not renderArchive:
+        if userAvatar == "link" or userAvatar == "download":
+            peopleLookup = PeopleLookup(startupPool, myOutputFolder if userAvatar == "download" else "")
+        else:  # only the names of people who left the space
+            peopleLookup = PeopleLookup(startupPool, memberstask=membersTask)
+    try:
+        if renderArchive:
+            WebexMessages = list(map(Message, archiveBundle.pop('messages')))
+            print(f"          saved messages: {len(WebexMessages)}")
+        else:
+            WebexMessages, spaceMaxMessages = get_messages(myRoom, max_messages, archiveState['lastCreated'] if archiveState else "", peopleLookup.add_messages)
+    except Exception as e:
+        print(" **ERROR** STEP #2: getting Messages")
+        print(f"             Error message: {e}\n\n")
+        exit()
+    if archiveState:  # incremental archive: add the messages of the previous run(s)
+        newMessageIds = {msg.id for msg in WebexMessages}
+        WebexMessages += [Message(msg) for msg in archiveState.pop('messages') if msg['id'] not in newMessageIds]
+        peopleLookup.add_messages(WebexMessages)  # authors of previous messages: avatars
+    if len(WebexMessages) == 0:  # for spaces that have no messages (anymore)
+        print(" **ERROR** STEP #2: getting Messages")
+        print(f"             No messages found\n\n")
+        exit()
+    performanceReport.stop("get messages", 0)
+
+
+    # ===== MESSAGE STORE: index messages by id and personId =======================
+    performanceReport.start()
+    msgStore = MessageStore(WebexMessages)
+    performanceReport.stop("create message store", 0)
 
-# ======  WRITE to HTML FILE
-startTimer()
-with open(myOutputFolder + "/" + outputFileName + ".html", 'w', encoding='utf-8') as f:
-    print(htmldata, file=f)
-stopTimer("write html to file", 0)
 
-# ======  WRITE to TEXT FILE
-if outputToText:
-    with open(myOutputFolder + "/" + outputFileName + ".txt", 'w', encoding='utf-8') as f:
-        print(textOutput, file=f)
+    # ===== CREATE USERLIST ========================================================
+    #   Collect only userId's of users who wrote a message. For those users we will
+    #   retrieve details & download/link avatars
+    performanceReport.start()
+    uniqueUserIds = [personId for personId in msgStore.byPersonId if "xxXXxx" not in personId]
+    performanceReport.stop("get unique user ids", 0)
 
 
-if printPerformanceReport:
+    # =====  GET MEMBER NAMES ======================================================
+    # myMembers used # of space members (stats).
+    # myMemberList is used to get the displayName of users (msg only show email address - personEmail)
+    performanceReport.start()
+    myMemberList = dict()  # --> myMemberList[your@email.com] = "displayName"
+    print(" #3 --- Get MEMBER List")  # Put ALL members in a dictionary that contains: "email + fullname"
+    try:
+        if renderArchive:
+            myMembers = archiveBundle.get('memberships', [])
+        else:
+            myMembers = membersTask.result()
+            print(f"          Number of space members: {len(myMembers)}")
+        for members in myMembers:
+            try:
+                myMemberList[str(members['personEmail'])] = str(members['personDisplayName'])
+            except Exception as e:  # IF there's no personDisplayName, use email
+                myMemberList[str(members['personEmail'])] = str(members['personEmail'])
+        if archiveDb:
+            archiveDb.add_memberships(myRoom, myMembers)
+            archiveDb.add_persons([(member.get('personId'), member.get('personEmail'), member.get('personDisplayName')) for member in myMembers])
+    except Exception as e:
+        print(" **ERROR** STEP #3: getting Memberlist (email address)")
+        print(f"             Error message: {e}")
+    performanceReport.stop("get memberlist", 0)
+
+
+    # =====  GET MEMBER AVATARS & NAMES ============================================
+    #   Person details (people cache) of everyone who wrote a message: avatar URLs, and the names of
+    #   people who are not a space member (anymore): the member list doesn't have them.
+    #   Requested (and avatars downloaded) by the PeopleLookup while the messages were retrieved.
+    performanceReport.start()
+    userAvatarDict = dict()  # --> userAvatarDict[personId] = "https://webex_message_avatarurl"
+    formerMemberNames = dict()  # --> formerMemberNames[your@email.com] = "displayName"
+    if userAvatar == "link" or userAvatar == "download":
+        print(" #4 --- MEMBER Avatars: collect avatar Data (" + str(len(uniqueUserIds)) + ")  ", end='', flush=True)
+    if renderArchive:
+        userAvatarDict = archiveBundle.get('avatars', {})
+        formerMemberNames = archiveBundle.get('names', {})
+        if userAvatar == "link" or userAvatar == "download":
+            print(".", flush=False)  # Progress Indicator
+    else:
+        authorEmails = {personId: msgStore.byPersonId[personId][0].get('personEmail', "") for personId in uniqueUserIds}
+        people, avatarResults = peopleLookup.result()
+        people = {personId: persondetails for personId, persondetails in people.items() if personId in authorEmails}
+        if people and userAvatar != "link" and userAvatar != "download":
+            print(" #4 --- MEMBER Names: names of people who left the space (" + str(len(people)) + ")  ", end='', flush=True)
+        if archiveDb:
+            archiveDb.add_persons([(personId, (persondetails.get('emails') or [None])[0], persondetails.get('displayName'))
+                                   for personId, persondetails in people.items()])
+        for personId, persondetails in people.items():
+            if 'avatar' in persondetails:
+                userAvatarDict[personId] = persondetails['avatar'].replace("~1600", "~80")
+            if authorEmails[personId] not in myMemberList and persondetails.get('displayName'):
+                formerMemberNames[authorEmails[personId]] = persondetails['displayName']
+        if people or userAvatar == "link" or userAvatar == "download":
+            print(".", flush=False)  # Progress Indicator
+        if userAvatar == "download":
+            print(f"          {len(userAvatarDict)} avatar files: {avatarResults['downloaded']} downloaded, {avatarResults['cached']} not changed (avatar cache), {avatarResults['failed']} failed")
+    myMemberList.update(formerMemberNames)
+    performanceReport.stop("get member details", 0)
+
+
+    # =====  GET MY DETAILS ========================================================
+    performanceReport.start()
+    try:
+        if renderArchive:
+            myOwnDetails = archiveBundle.get('me', {})
+        elif meTask:
+            myOwnDetails = meTask.result()
+        myEmail = "".join(myOwnDetails['emails'])
+        myName = myOwnDetails['displayName']
+        myDomain = myEmail.split("@")[1]
+        print(f" #5 --- Get my details: {myEmail}")
+    except Exception as e:
+        print(f"\n #5 --- Get my details: **ERROR** : {e}\n\n myOwnDetails data retrieved: \n{myOwnDetails}")
+    if startupPool:
+        startupPool.shutdown()
+    performanceReport.stop("get my details", 0)
+
+
+    # =====  SET/CREATE VARIABLES ==================================================
+    tocList = ""
+    statTotalFiles = 0
+    statTotalImages = 0
+    statTotalFilesSize = 0
+    statTotalImagesSize = 0
+    statTotalMessages = len(WebexMessages)
+    statTotalMentions = 0
+    myDomainStats = dict()
+    statMessageMonth = dict()
+    previousEmail = ""
+    previousMonth = ""
+    previousMsgCreated = ""
+    TimezoneName = str(time.tzname[time.localtime().tm_isdst])
+
+
+    # ======  GENERATE HTML HEADER =================================================
+    #
+    print(f" #6 --- Generate HTML header")
+    configFileInfo = ""
+    if configFile != originalConfigFile:
+        configFileInfo = f"Config file: <span style='color:yellow'>{configFile}</span>"
+    dst_msg = "NO"
+    if dst_start != "":
+        # below: changing dst_start/stop to string
+        dst_msg = (str(dst_start) + "/" + str(dst_stop)).replace(" ", "").replace("[", "").replace("]", "").replace("'", "")
+    blur_msg = "YES"
+    if blurring == "":
+        blur_msg = "NO"
+    outputjson_msg = outputToJson.replace("yes", "json/txt").replace("both", "json/txt")
+    pageInfo = f"<div class='cssRoomName'>   {roomName}&nbsp;&nbsp;&nbsp;<br><span style='float:left;margin-top:8px;padding-bottom:11px;"
+    pageInfo += f"font-size:10px;color:#fff'> CREATED: <span style='color:yellow'>{currentDate}</span>&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;  Generated by: <span "
+    pageInfo += f"style='color:yellow'>{myName}</span> &nbsp;&nbsp;&nbsp;&nbsp;&nbsp;  {configFileInfo}"
+    pageInfo += f"&nbsp;&nbsp;&nbsp; version:  {version}&nbsp;&nbsp;&nbsp;<br>Sort old-new: <span style='color:yellow'>"
+    pageInfo += str(sortOldNew).replace("True", "yes (default)").replace("False", "no") + f"</span> &nbsp;&nbsp; Max messages:"
+    pageInfo += f"<span style='color:yellow'> {maxMessageString} </span>&nbsp;&nbsp; File Download: <span style='color:yellow'>{downloadFiles.upper()}</span>"
+    pageInfo += f"&nbsp;&nbsp; Avatar: <span style='color:yellow'>{userAvatar.upper()}</span>&nbsp;&nbsp; Message timezone: <span style='color:yellow'>{TimezoneName}</span>"
+    pageInfo += f"&nbsp;&nbsp; DST configured: <span style='color:yellow'>{dst_msg}</span>"
+    pageInfo += f"&nbsp;&nbsp; Output: <span style='color:yellow'>{outputjson_msg}</span>"
+    pageInfo += f"&nbsp;&nbsp; Blurring: <span style='color:yellow'>{blur_msg}</span></span></div><br>"
+    if htmlPages:  # all pages use the shared styling and javascript files
+        pageHeader = f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"/>\n<link rel='stylesheet' href='{htmlStyleFile}'>\n"
+        pageHeader += f"<script src='{htmlScriptFile}'></script>\n" + htmlbodystart + pageInfo
+    else:
+        pageHeader = htmlheader + pageInfo
+
+
+    # ====== GENERATE FINAL HTML ===================================================
+    #  for all messages (and optionally a .txt file with all messages)
+    #
+    performanceReport.start()  # for generating the full HTML file
+
+    # ___ first create msg order table
+    performanceReport.start()
+    sortedMessages = sorted(WebexMessages, key=lambda i: i.created, reverse=False)
+    performanceReport.stop("sort WebexMessages", 0)
+
+    performanceReport.start()
+    # --- Thread tree: create
+    threadRoots, threadReplies, missing_parent_msglist = create_thread_tree(sortedMessages)
+    for missing_parent_msg in missing_parent_msglist:
+        msgStore.add(missing_parent_msg)  # also adds it to WebexMessages
+    displayedMessageCount = len(threadRoots) + sum(len(threadReplies[root.id]) for root in threadRoots)
+    performanceReport.stop("create threading order table", 0)
+
+    # ====== DOWNLOAD STAGE: get file info or download all attachments (in parallel) ======
+    #   the HTML generation below gets the filename + size from fileInfo: fileUrl --> (filename, filesize)
+    fileInfo = dict()
+    savedBytes = 0  # file store: size of the files that were stored already
+    download_stats = ""
+    if downloadFiles != "no":
+        dl_timer = time.time()
+        displayedMessages = [msg for msg, threaded_message in iterate_thread_tree(msgStore, threadRoots, threadReplies, sortOldNew)]
+        fileCount = sum(len(msg.files or ()) for msg in displayedMessages)
+        knownFiles = dict()  # incremental archive: attachments of the previous run(s) (same download setting)
+        if archiveState and archiveState.get('download') == downloadFiles:
+            knownFiles = {url: tuple(info) for url, info in archiveState['files'].items()}
+        if renderArchive:  # render-only: only use the saved attachment info
+            fileInfo = {url: tuple(info) for url, info in archiveBundle.get('files', {}).items()}
+            print(f" #7a--- Saved info for {len(fileInfo)} attachments")
+        else:
+            print(f" #7a--- {'Download' if downloadFiles in ['images', 'files', 'image', 'file'] else 'Get info for'} {fileCount} attachments ({downloadThreads} threads)" + (f", {len(knownFiles)} already archived" if knownFiles else ""))
+            print("          ", end="", flush=True)
+            fileInfo, savedBytes = download_all_files(displayedMessages, downloadThreads, myOutputFolder, knownFiles)
+            print("")
+        dl_duration_total = round(time.time() - dl_timer, 2)
+        if downloadFiles in ['images', 'files', 'image', 'file'] and len(fileInfo) > 0 and dl_duration_total > 0:
+            download_stats = f"\n {dl_duration_total:7.1f} download of {downloadFiles.replace('files', 'images and files')} ({len(fileInfo)} files,  {round(len(fileInfo) / dl_duration_total, 2)} files/sec, {downloadThreads} threads)"
+            if savedBytes > 0:
+                download_stats += f"\n         file store: {convert_size(savedBytes)} stored already (not stored again)"
+        elif downloadFiles == "info" and dl_duration_total > 0:
+            download_stats = f"\n {dl_duration_total:7.1f} process filenames ({len(fileInfo)} files, {round(len(fileInfo) / dl_duration_total, 1)} files/sec, {downloadThreads} threads)"
+    if archiveDb:  # attachments of the messages, with filename and size (if known: download setting)
+        archiveDb.add_files(myRoom, [msg for msg in WebexMessages if "xxXXxx" not in msg.personId], fileInfo)
+
+    print(f" #7b--- Generate HTML code for {displayedMessageCount} messages")
+    # ====== HTML/TXT output is STREAMED to disk while the messages are processed (flat memory use)
+    #   The ToC and statistics are only known at the end: the message HTML goes into a temporary
+    #   file and the final HTML file is assembled from: header + ToC + temporary file + footer.
+    #   The .txt file has its statistics at the end and is written directly.
+    #   htmlpages: the temporary file has the messages of ONE page, a page is written when the next
+    #   page starts (a thread start of a new month, or 'htmlpages' messages on the page: threads are never
+    #   split). Pages are named after their month, the HTML file itself is the index page (ToC, statistics).
+    htmlBodyFile = tempfile.TemporaryFile(mode='w+', encoding='utf-8', dir=myOutputFolder)
+    indexFileName = spaceFileName + ".html"
+    pages = list()          # htmlpages: (filename, title) of every page
+    pageTitles = set()
+    monthPages = dict()     # htmlpages: month (statMessageMonthKey) --> filename of the page where it starts
+    pageMonthKey = ""
+    pageMessageCount = 0
+    searchTokens = dict()   # searchindex: word --> message numbers (anchor 'm<number>' of the message)
+    searchMessages = list() # searchindex: [date, author number] of every message
+    searchAuthors = dict()  # searchindex: name --> author number
+    searchPages = list()    # searchindex (+ htmlpages): [first message number, page filename]
+    if outputToText:
+        textFile = open(myOutputFolder + "/" + spaceFileName + ".txt", 'w', encoding='utf-8')
+    htmldata = ""
+    textOutput = ""
+    if outputToText:
+        textOutput += f"------------------------------------------------------------\n {roomName}\n------------------------------------------------------------\n"
+        textOutput += f"CREATED:        {currentDate}\nFile Download:  {downloadFiles.upper()}\nGenerated by:   {myName}\nSort old-new:   "
+        textOutput += str(sortOldNew).replace("True", "yes (default)").replace("False", "no") + f"\nMax messages:   {maxMessageString}\nAvatar:"
+        textOutput += f"         {userAvatar} \nversion:        {version} \nTimezone:       {TimezoneName}\nDST configured:     "
+        if dst_start == "":
+            textOutput += "No\n"
+        else:
+            textOutput += "Yes\n"
+
+
+    # ====== WRITE JSON data to a FILE =============================================
+    #   (optional) Write JSON to a FILE to be used as input (not using the Webex Message APIs)
+    performanceReport.start()
+    if outputToJson == "yes" or outputToJson == "both" or outputToJson == "json":
+        with open(myOutputFolder + "/" + spaceFileName + ".json", 'w', encoding='utf-8') as f:
+            json.dump(WebexMessages, f, default=Message.to_dict)
+    performanceReport.stop("output to json", 0)
+
+
+    # Progress bar:
+    mycounter = 0
+    progress_steps = int(displayedMessageCount / 20)
+    if progress_steps < 1:
+        progress_steps = 1  # Fix issue with low number of maxtotalmessages v0.22
+    # --- PROCESS EVERY MESSAGE ----------------------------------------------------
+    for msg, threaded_message in iterate_thread_tree(msgStore, threadRoots, threadReplies, sortOldNew):
+        # write the HTML/text of the previous message to disk
+        htmlBodyFile.write(htmldata)
+        htmldata = ""
+        if outputToText:
+            textFile.write(textOutput)
+            textOutput = ""
+        if htmlPages and not threaded_message:  # new page?
+            messageYear, messageMonth, messageMonthNr = get_monthday(msg.created)
+            statMessageMonthKey = messageYear + " - " + messageMonthNr + "-" + messageMonth
+            if not pages or (htmlPages == "month" and statMessageMonthKey != pageMonthKey) or (htmlPages != "month" and pageMessageCount >= htmlPages):
+                pageTitle = statMessageMonthKey
+                pageCounter = 2
+                while pageTitle in pageTitles:  # more pages for one month
+                    pageTitle = f"{statMessageMonthKey} ({pageCounter})"
+                    pageCounter += 1
+                newPage = (f"{spaceFileName} {pageTitle}.html", pageTitle)
+                if pages:  # write the previous page
+                    write_html_page(myOutputFolder + "/" + pages[-1][0], pageHeader,
+                                    page_navigation(indexFileName, pages[-2] if len(pages) > 1 else None, newPage), htmlBodyFile)
+                pages.append(newPage)
+                pageTitles.add(pageTitle)
+                if searchIndex:
+                    searchPages.append([len(searchMessages), newPage[0]])
+                pageMonthKey = statMessageMonthKey
+                pageMessageCount = 0
+                previousMonth = ""  # every page starts with its month and the name of the first writer
+                previousEmail = ""
+            pageMessageCount += 1
+        mycounter += 1
+        current_step = mycounter / progress_steps
+        if (current_step - int(current_step)) == 0:
+            current_step = int(current_step)
+            sys.stdout.write('\r')
+            # the exact output you're looking for:
+            sys.stdout.write("          [%-20s] %d%%  |  count: %d" % ('=' * current_step, 5 * current_step, mycounter))
+            sys.stdout.flush()
+
+        # --- continue processing messages
+        if len(msg) < 5:
+            print("_EMPTYmessage_")
+            continue        # message empty
+
+        data_text = ""
+        data_date = convertDate(msg.created, "%A %H:%M      (%b %d, %Y)")  # also used in the .txt output
+        # --- if msg was updated: add 'Edited' in date
+        if msg.updated is not None:
+            data_msg_was_edited = True
+            data_created = data_date + "   -  edited at " + convertDate(msg.updated, "%H:%M  %b %d")
+        else:
+            data_msg_was_edited = False
+            data_created = data_date
+        # --- HTML in message? Deal with markdown
+        if msg.html is not None:
+            # --- Check if there are Markdown hyperlinks [linktext](www.cisco.com) as these look very different
+            if "sparkBase.clickEventHandler(event)" in str(msg.html):
+                data_text = convertMarkdownURL(str(msg.html), 1)
+                data_text = convertMarkdownURL(data_text, 2)
+            else:
+                data_text = convertURL(str(msg.html))
+        elif msg.text is not None:
+            data_text = convertURL(msg.text)
+            data_text = data_text.replace("<script", "<pre>&lt;")  # --- Replace script in 'text' msg (stopping HTML generation) - 0.20b
+            if "<code>" in data_text:
+                if "</code>" not in data_text:
+                    data_text += "</code>"
+            data_text = data_text.replace("<", "&lt;").replace(">", "&gt;")  # make sure html in 'text' is not interpreted (v25) except for hyperlinks
+            data_text = data_text.replace("&lt;a href", "<a href").replace("&lt;/a&gt;", "</a>").replace("blank'&gt;", "blank'>")
+            data_text = str(data_text).replace("\n", "<br>")  # replace \n with <br> - 0.22d3
+        if data_text == "" and msg.files is None and msg.mentionedPeople is None:
+            # empty text without mentions or attached images/files: SKIP
+            print("_EMPTYmessage_")
+            continue
+        try:  # Put email & name in variable
+            data_email = str(msg.personEmail)
+            data_userid = str(msg.personId)
+            data_name = myMemberList[msg.personEmail]
+        except:
+            data_name = data_email
+        if '@' in data_email and "error.com" not in data_email:
+            domain = str(data_email.split('@')[1])
+            myDomainStats[domain] = myDomainStats.get(domain, 0) + 1
+        messageYear, messageMonth, messageMonthNr = get_monthday(msg.created)
+        # ====== GENERATE MONTH STATISTICS
+        statMessageMonthKey = messageYear + " - " + messageMonthNr + "-" + messageMonth
+        #  IF message is THREADED _AND_ the key doesn't exist: skip
+        # >>> below: if/print/else statement are added
+        if threaded_message and statMessageMonthKey not in statMessageMonth:
+            pass
+        else:
+            statMessageMonth[statMessageMonthKey] = statMessageMonth.get(statMessageMonthKey, 0) + 1
+        if messageMonth != previousMonth and not threaded_message:
+            if htmlPages:
+                monthPages.setdefault(statMessageMonthKey, pages[-1][0])
+            htmldata += f"<div class='cssNewMonth' id='{statMessageMonthKey}'>   {messageYear}    <span style='color:#C3C4C7'>" + messageMonth + "</span><span style='float:right; font-size:56px; color:lightgrey;margin-right:15px; padding-top:0px;'><a href='#top' style='text-decoration:none;color:inherit;'>▲</a></span></div>"
+            if outputToText:  # for .txt output
+                textOutput += f"\n\n---------- {messageYear}    {messageMonth} ------------------------------\n\n"
+        # ====== if PREVIOUS email equals current email, then skip header
+        if searchIndex:  # anchor for the search results + the words of this message in the search index
+            searchNumber = len(searchMessages)
+            htmldata += f"<a id='m{searchNumber}'></a>"
+            for word in search_words(msg.text or ""):
+                searchTokens.setdefault(word, []).append(searchNumber)
+            searchMessages.append([convertDate(msg.created, "%Y-%m-%d %H:%M"),
+                                   searchAuthors.setdefault("" if blurring else data_name, len(searchAuthors))])
+        if threaded_message:  # ___________________________________ start thread ______________________________
+            htmldata += "<div class='css_message_thread'>"
+        else:
+            htmldata += "<div class='css_message'>"
+
+        # ====== AVATAR: + msg header: display or not
+        if (data_email != previousEmail) or (data_email == previousEmail and timedifference(msg.created, previousMsgCreated) > 60) or (data_msg_was_edited):
+            if userAvatar == "link" and data_userid in userAvatarDict:
+                htmldata += f"<img src='{userAvatarDict[data_userid]}' class='avatarCircle'  width='36px' height='36px'/>"
+            elif userAvatar == "download" and data_userid in userAvatarDict:
+                htmldata += f"<img src='avatars/" + data_userid + ".jpg' class='avatarCircle'  width='36px' height='36px'/>"
+            else:  # User that may not exist anymore --> use email as name
+                if data_name == data_email:
+                    htmldata += f"<div id='avatarCircle'>{data_name[0:2].upper()}</div>"
+                else:
+                    # show circle with initials instead of avatar
+                    try:
+                        htmldata += "<div id='avatarCircle'>" + data_name.split(" ")[0][0].upper() + data_name.split(" ")[1][0].upper() + "</div><div class='css_message'>"
+                    except:  # Sometimes there's no "first/last" name. If one word, take the first 2 characters.
+                        htmldata += "<div id='avatarCircle'>" + data_name[0:2].upper() + "</div>"
+
+            msgDomain = data_email.split("@")[1]    # Get message sender domain
+            if myDomain == msgDomain:               # If domain <> own domain, use different color
+                htmldata += f"<span class='css_email{blurring}' title='{data_email}'>{data_name}</span>"
+            else:
+                htmldata += "<span class='css_email" + blurring + "' title='" + data_email + "'>" + data_name + "</span>   <span class='css_email_external" + blurring + "'>(@" + data_email.split("@")[1] + ")</span>"
+            htmldata += f"<span class='css_created'>{data_created}</span>"
+        else:
+            htmldata += "<div class='css_message'>"
+
+        if outputToText:  # for .txt output
+            if blurring != "":
+                data_email = "_____@_____.__"
+            if threaded_message:  # add ">>" to text output to indicate a thread v0.23
+                textOutput += data_date + "  >> " + data_email + ": "
+            else:
+                textOutput += data_date + "  " + data_email + ": "
+
+        # ====== DEAL WITH MENTIONS IN A MESSAGE
+        if msg.mentionedPeople is not None:
+            try:
+                statTotalMentions += 1
+                for item in msg.mentionedPeople:
+                    texttoreplace = "<spark-mention data-object-type=\"person\" data-object-id=\"" + item + "\">"
+                    data_text = data_text.replace(texttoreplace, "<span class='atmention" + blurring + "'>@")
+                data_text = data_text.replace("</spark-mention>", "</span>")
+            except:
+                print(" **ERROR** processing mentions, don't worry, I will continue")
+        if 'mentionedGroups' in msg:
+            try:
+                statTotalMentions += 1
+                for item in msg['mentionedGroups']:
+                    texttoreplace = "<spark-mention data-object-type=\"groupMention\" data-group-type=\"" + item + "\">"
+                    data_text = data_text.replace(texttoreplace, "<span style='color:red;display:inline;'>@")
+                data_text = data_text.replace("</spark-mention>", "</span>")
+            except:
+                print(" **ERROR** processing mentions, don't worry, I will continue")
+        # check if msg is a card. If yes: add "cannot display" message
+        try:
+            if "contentType" in msg["attachments"][0]:
+                is_card = True
+        except:
+            is_card = False
+        if is_card:
+            data_text = "<span class='card_class'>&nbsp;<span style='color:red'>Card</span>&nbsp; content cannot be displayed in this archive&nbsp;</span>&nbsp;  " + data_text
+        htmldata += "<div class='css_messagetext'>" + data_text
+        if outputToText and msg.text is not None:  # for .txt output
+            if msg.text == "":
+                myErrorList.append("processing msgs: msg WITH html WITHOUT text? html: " + msg['html'] + " -- msg id: " + msg['id'])
+            p = re.compile(r'<.*?>')
+            textOutput += p.sub('', msg.text).replace("\"", "'").replace("\n", " ").replace("\r", " ")
+            textOutput += "\n\r"
+        if outputToText and msg.text is None and msg.files is None:
+            textOutput += "\n\r"
+
+        # ====== DEAL WITH FILE ATTACHMENTS IN A MESSAGE
+        if msg.files is not None:
+            if data_text != "":
+                htmldata += "<br>"
+            if downloadFiles == "no":   # download=no  - only show "file attachment", no details whatsoever
+                for i in range(len(msg.files)):
+                    htmldata += f"<br><div id='fileicon'></div><span style='line-height:32px;'> attached_file</span>"
+                    statTotalFiles += 1
+                if outputToText:
+                    textOutput += f" <File Attachment> \n\n"  # v26
+            else:  # download=info/images/files
+                myFiles = [fileInfo[url] for url in msg.files if url in fileInfo]
+                # SORT attached files by <files> _then_ <images>
+                myFiles.sort(key=lambda x: x[0].split(".")[-1] in ['jpg', 'png', 'jpeg', 'gif', 'bmp', 'tif', 'heic', 'avif', 'webp'])
+                splitFilesImages = ""
+                for filename, filesize in myFiles:
+                    # IMAGE POPUP
+                    if int(filesize) == 0:
+                        filesize_fancy = "0 B"
+                    else:
+                        filesize_fancy = convert_size(filesize)
+                    fileextension = os.path.splitext(filename)[1][1:].lower()
+                    if fileextension in ['jpg', 'png', 'jpeg', 'gif', 'bmp', 'tif', 'heic', 'avif', 'webp'] and (downloadFiles in ["images", "files", "image", "file"]):
+                        if splitFilesImages == "":
+                            # extra return after all attached files are listed
+                            htmldata += "<br>"
+                            splitFilesImages = "done"
+                        htmldata += f"<div class='css_created'><img src='images/{filename}' title='click to zoom' onclick='onClick(this)' class='image-hover-opacity' /><br>{filename}<br><div class='filesize'>{filesize_fancy}</div> </div>"
+                    elif "file" in downloadFiles:
+                        htmldata += f"<br><div id='fileicon'></div><span style='line-height:32px;'><a href='files/{filename}'>{filename}</a>  ({filesize_fancy})</span>"
+                    else:
+                        htmldata += f"<br><div id='fileicon'></div><span style='line-height:32px;'> {filename}   ({filesize_fancy})</span>"
+                    if fileextension in ['jpg', 'png', 'jpeg', 'gif', 'bmp', 'tif', 'heic', 'avif', 'webp']:
+                        statTotalImages += 1
+                        statTotalImagesSize += int(filesize)
+                    else:
+                        statTotalFiles += 1
+                        statTotalFilesSize += int(filesize)
+                    if outputToText:  # for .txt output
+                        textOutput += f"                           Attachment: {filename} ({filesize_fancy})\n"
+        htmldata += "</div>"    # css_messagetext
+        htmldata += "</div>"    # css_message or css_message_thread
+        htmldata += "</div>"    # other div - needed!
+        previousEmail = data_email
+        if not threaded_message:
+            previousMonth = messageMonth
+        previousMsgCreated = msg.created
+    htmlBodyFile.write(htmldata)
+    htmldata = ""
+    if pages:  # htmlpages: write the last page
+        write_html_page(myOutputFolder + "/" + pages[-1][0], pageHeader,
+                        page_navigation(indexFileName, pages[-2] if len(pages) > 1 else None, None), htmlBodyFile)
+    performanceReport.stop("generate HTML messages (" + str(displayedMessageCount) + ")" + download_stats, 0)
+
+
+    # ======  *SORT* DOMAIN USER STATISTICS
+    performanceReport.start()
+    myDomainStatsSorted = sorted(
+        [(v, k) for k, v in myDomainStats.items()], reverse=True)
+    myDomainStatsSorted = myDomainStatsSorted[0:10]  # only want the top 10
+    returntextDomain = ""
+    returntextMsgMonth = ""
+    performanceReport.stop("sorting messages", 0)
+
+
+    # ======  TABLE OF CONTENTS
+    performanceReport.start()
+    # If message sorting is old-to-new, also sort the TOC
+    if sortOldNew:  # Default
+        mytest = sorted(statMessageMonth.items(), reverse=False)
+    else:
+        mytest = sorted(statMessageMonth.items(), reverse=True)
+    my_yearcounter = 0
+    prev_year = 0
+    tocList = "<table style='width: 290px;'>"
+    for k, v in mytest:
+        pr_year = int(k.split("-")[0])
+        pr_monthname = k.split("-")[2]
+        if prev_year != pr_year:
+            tocList += f"</table><a href='javascript:;' onclick=show('{pr_year}') style='text-decoration: none;font-weight:bolder;font-size'> <div id='yeararrow{pr_year}' style='display:inline;'>▼</div>  {pr_year}</span></a><br>"
+            tocList += f"<table id='expand year-{pr_year}' style='width: 290px;'>"
+            tocList += "<tr><td>"
+            my_yearcounter += 1
+        else:
+            tocList += "<tr><td>"
+        pageLink = urllib.parse.quote(monthPages.get(k, pages[0][0])) if pages else ""  # htmlpages: month on another page
+        tocList += f"<a href='{pageLink}#{k}' style='text-decoration:none;'>&nbsp;&nbsp;{pr_year} - {pr_monthname}</a></td>"
+        tocList += f"<td><span class='month_msg_count'>{v:,}</span></td></tr>"
+        prev_year = pr_year
+
+    messageType = "newest"
+    if not sortOldNew:
+        messageType = "oldest"
+    tocList += "</table>"
+    pageLink = urllib.parse.quote(pages[-1][0]) if pages else ""
+    tocList += f"<table><tr><td colspan='2'>&nbsp;&nbsp;&nbsp;<span style='font-size:11px;'><a href='{pageLink}#endoffile' style='text-decoration:none;'>" + messageType + " message</a></span></td></tr></table>"
+
+
+    # ======  DOMAIN MESSAGE STATISTICS
+    total_stat_users = 0
+    returntextDomain += "<table id='mytoc' style='width: 220px;'>"
+    for domain in myDomainStatsSorted:
+        if domain[1] == "user_removed_their_msg.com":
+            continue
+        blurClass = ""
+        if blurring != "":
+            blurClass = "class='myblur'"
+        returntextDomain += f"<tr><td {blurClass}>{domain[1]}</td><td style='text-align:right;'>{domain[0]:,}</td>"
+        total_stat_users += int(domain[0])
+    if (statTotalMessages - total_stat_users) > 0 and len(myDomainStatsSorted) > 9:
+        returntextDomain += f"<tr><td>...other domains</td><td style='text-align:right;'>{(statTotalMessages-total_stat_users):,}</td>"
+    returntextDomain += "</table>"
+
+
+    # ======  MESSAGE & FILE STATISTICS
+    tocStats = "<table id='mytoc' style='width: 250px;'>"
+    tocStats += f"<tr><td># of messages: </td><td style='text-align:right;'> {displayedMessageCount:,} </td></tr>"
+    #  ^^^^ 0.26d don't show total msg downloaded but the actual number of msg
+    if statTotalImages > 0:
+        tocStats += f"<tr><td> # images: "
+        if downloadFiles in ['no', 'info']:
+            tocStats += f"<span style='color:grey;font-size:10px;'>not downloaded</span> "
+        tocStats += f"</td><td style='text-align:right;'> {statTotalImages:,} </td></tr>"
+    if statTotalImages > 0 and statTotalImagesSize > 0:
+        tocStats += f"<tr><td>&nbsp;&nbsp;&nbsp;size: </td><td style='text-align:right;'> {convert_size(statTotalImagesSize)} </td></tr>"
+        tocStats += f"<tr><td>&nbsp;&nbsp;&nbsp;average size: </td><td style='text-align:right;'> {convert_size(statTotalImagesSize / statTotalImages)} </td></tr>"
+    tocStats += f"<tr><td> # files: "
+    if downloadFiles in ['no', 'info', 'images', 'image']:
+        tocStats += f"<span style='color:grey;font-size:10px;'>not downloaded</span> "
+    tocStats += f"</td><td style='text-align:right;'> {statTotalFiles:,} </td></tr>"
+    if statTotalFiles > 0 and statTotalFilesSize > 0:
+        tocStats += f"<tr><td>&nbsp;&nbsp;&nbsp;size: </td><td style='text-align:right;'> {convert_size(statTotalFilesSize)} </td></tr>"
+        tocStats += f"<tr><td>&nbsp;&nbsp;&nbsp;average size: </td><td style='text-align:right;'> {convert_size(statTotalFilesSize / statTotalFiles)} </td></tr>"
+    if fileStore and savedBytes > 0:
+        tocStats += f"<tr><td> # saved by file store: </td><td style='text-align:right;'> {convert_size(savedBytes)} </td></tr>"
+    tocStats += f"<tr><td># @mentions: </td><td style='text-align:right;'> {statTotalMentions:,} </td></tr>"
+    tocStats += f"<tr><td># total members: </td><td style='text-align:right;'> {len(myMembers):,} </td></tr>"
+    tocStats += f"<tr><td># active members: <br>&nbsp;&nbsp;&nbsp;<span style='font-size:11px;'>(in this archive)</span> </td><td style='text-align:right;'> {len(uniqueUserIds):,} </td></tr>"
+    if statTotalMessages > spaceMaxMessages - 10:
+        tocStats += f"<tr><td colspan='2'><br><span style='color:grey;font-size:10px;'>space contains more than  {statTotalMessages:,} messages</span></td></tr>"
+    tocStats += "</table>"
+    if outputToText:  # for .txt output
+        textOutput += f"\n\n\n STATISTICS \n--------------------------\n # of messages : {displayedMessageCount:,}\n # of images   : {statTotalImages:,}\n # of files    : {statTotalFiles:,}\n # of mentions : {statTotalMentions:,}\n"
+        if fileStore and savedBytes > 0:
+            textOutput += f" # saved by file store: {convert_size(savedBytes)}\n"
+        textOutput += "\n\n"
+        #  ^^^^ 0.26d don't show total msg downloaded but the actual number of msg
+
+
+    # ======  HEADER
+    newtocList = "<table class='myheader' id='myheader'> <tr>"
+    newtocList += "<td style='width:300px;'> <strong>Index </strong>"
+    newtocList += "<span style='text-decoration:none; font-size:10px;'><a href='javascript:;' onclick='show_showall()'>expand</a> / <a href='javascript:;' onclick='show_hideall()'>collapse</a></span>"
+    newtocList += "<br>" + tocList + " </td>"
+    newtocList += "<td> <strong>Numbers</strong><br>" + tocStats + " </td>"
+    newtocList += "<td> <table id='mytoc' style='width: 220px;'><tr><td style='text-align:left;font-weight:bold;'>Top-10 domains</td><td style='text-align:right;font-weight:bold;'># messages</td></tr></tbody></table>" + returntextDomain + " </td>"
+    newtocList += "</tr> </table></div><br><br>"
+
+    # ======  PUT EVERYTHING TOGETHER
+    print("\n #8 --- Finalizing HTML")
+    performanceReport.stop("generate ToC, statistics, header and footer", 0)
+
+
+    # ======  WRITE to HTML FILE: header + ToC, then copy the message HTML from the temporary file
+    #   htmlpages: the pages are written already, the HTML file is the index page (+ shared styling & javascript)
+    #   searchindex: the search box is on the index page (or at the top of the HTML file)
+    performanceReport.start()
+    if searchIndex:
+        write_search_index(myOutputFolder + "/" + searchIndexFile, searchTokens, searchMessages, list(searchAuthors), searchPages or [[0, ""]])
+        newtocList = f"<script src='{searchIndexFile}'></script>\n" + htmlsearchscript + htmlsearchbox + newtocList
+    if htmlPages:
+        with open(myOutputFolder + "/" + htmlStyleFile, 'w', encoding='utf-8') as f:
+            f.write(htmlstyle + htmlpagestyle)
+        with open(myOutputFolder + "/" + htmlScriptFile, 'w', encoding='utf-8') as f:
+            f.write(htmlscript + imagepopupscript)
+        pageList = " &nbsp;|&nbsp; ".join(f"<a href='{urllib.parse.quote(filename)}'>{title}</a>" for filename, title in pages)
+        with open(myOutputFolder + "/" + indexFileName, 'w', encoding='utf-8') as f:
+            f.write(pageHeader + newtocList + f"<div class='css_pagelist'><strong>Pages ({len(pages)})</strong>&nbsp;&nbsp; {pageList}</div>")
+            f.write(htmlfooter + imagepopupdiv + "</body></html>\n")
+    else:
+        with open(myOutputFolder + "/" + indexFileName, 'w', encoding='utf-8') as f:
+            f.write(pageHeader + newtocList)
+            htmlBodyFile.seek(0)
+            shutil.copyfileobj(htmlBodyFile, f)
+            f.write(htmlfooter + imagepopuphtml + "</body></html>\n")
+    htmlBodyFile.close()  # temporary file is deleted
+    performanceReport.stop("write html to file", 0)
+
+    # ======  WRITE to TEXT FILE
+    if outputToText:
+        textFile.write(textOutput + "\n")
+        textFile.close()
+
+    # ======  SAVE ARCHIVE STATE: for the next (incremental) run or to render again without API calls
+    if saveState and renderArchive == "":
+        performanceReport.start()
+        save_archive_state(myOutputFolder, myRoom, WebexMessages, fileInfo, roomName, myOwnDetails, myMembers,
+                           userAvatarDict if userAvatar in ['link', 'download'] else {}, formerMemberNames)
+        performanceReport.stop("save archive state", 0)
+
+    # ======  SPACE STATISTICS: used for the batch throughput report
+    return {"roomName": roomName, "folder": myOutputFolder, "messages": displayedMessageCount,
+            "files": len(fileInfo), "seconds": time.time() - spaceStartTime, "report": performanceReport.text}
+
+
+
+# ----------------------------------------------------------------------------------------
+# FUNCTION archive_batch: archive all spaces of the batch file, 'batchthreads' spaces at the same time.
+#          All spaces share one HTTP connection pool and your details are retrieved once.
+#          Prints one line per space and the total throughput. The output of a space is only
+#          printed when archiving that space failed.
+def archive_batch(rooms):
+    print(f" #B --- Batch: {len(rooms)} spaces, {batchThreads} at the same time ({downloadThreads} download threads per space)")
+    myOwnDetails = get_me()
+    threadOutput = ThreadOutput(sys.stdout)
+    sys.stdout = threadOutput
+    batchStartTime = time.time()
+    spaceStats = list()
+    failedRooms = list()
+
+    def archive_one(room):
+        threadOutput.capture()
+        try:
+            stats, error = archive_space(room, myOwnDetails), ""
+        except SystemExit:  # exit() after an error message: only stop archiving THIS space
+            stats, error = None, "stopped"
+        except Exception as e:
+            stats, error = None, f"{type(e).__name__}: {e}"
+        return stats, error, threadOutput.release()
+
+    try:
+        with ThreadPool(max_workers=batchThreads) as executor:
+            futures = {executor.submit(archive_one, room): room for room in rooms}
+            for count, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                stats, error, output = future.result()
+                if stats is None:
+                    failedRooms.append(futures[future])
+                    print(f"    [{count}/{len(rooms)}] **ERROR** archiving space {futures[future]}: {error}\n{output}")
+                    continue
+                spaceStats.append(stats)
+                msgPerSec = stats['messages'] / max(stats['seconds'], 0.01)
+                print(f"    [{count}/{len(rooms)}] {stats['seconds']:7.1f} sec {stats['messages']:8,} msg {stats['files']:6,} files {msgPerSec:7.0f} msg/sec  {stats['folder']}")
+    finally:
+        sys.stdout = threadOutput.stream
+    batchSeconds = max(time.time() - batchStartTime, 0.01)
+    totalMessages = sum(stats['messages'] for stats in spaceStats)
+    totalFiles = sum(stats['files'] for stats in spaceStats)
+    totalSpaceSeconds = sum(stats['seconds'] for stats in spaceStats)
+    print(" ______________________________________________________")
+    print(f"   Batch: {len(spaceStats)} spaces archived, {len(failedRooms)} failed, {batchSeconds:.1f} sec")
+    print(f"   {totalMessages:,} msg ({totalMessages / batchSeconds:.0f} msg/sec), {totalFiles:,} files ({totalFiles / batchSeconds:.1f} files/sec)")
+    print(f"   space time {totalSpaceSeconds:.1f} sec: {totalSpaceSeconds / batchSeconds:.1f}x faster than one space at a time")
+    print(f"   {webex.ratelimiter.report()}")
+    if peopleCache:
+        print(f"   {peopleCache.report()}")
+    for room in failedRooms:
+        print(f"   FAILED: {room}")
+
+
+# ======  ARCHIVE: one space, or all spaces of the batch file (in parallel)
+if batchFile:
+    archive_batch(batchRooms)
+else:
+    performanceReport = archive_space(myRoom)['report']
+
+
+if printPerformanceReport and not batchFile:
     msg_time = int(performanceReport.split("order table")[1].split(" generate HTML")[0].lstrip().split(".")[0])
     if msg_time == 0:
         msg_time = 1
@@ -1981,9 +4296,16 @@ if printPerformanceReport:
     msg_per_sec = msg_nr / msg_time
     msg_statsline_new = msg_statsline.replace(")", f" msg, {msg_per_sec:.0f} msg/sec)")
     performanceReport = performanceReport.replace(msg_statsline, msg_statsline_new)
+    performanceReport += f"\n ______________________________________________________\n   {webex.ratelimiter.report()}"
+    if peopleCache:
+        performanceReport += f"\n   {peopleCache.report()}"
     print(f"{performanceReport}\n\n")  # ______________________________________________________\n")
 
 
+# ======  RATE LIMITED? (the performance report and batch mode always show the API call counters)
+if webex.ratelimiter.throttledCount > 0 and not printPerformanceReport and not batchFile:
+    print(f"    {webex.ratelimiter.report()}")
+
 # ======  PRINT ERROR LIST
 if len(myErrorList) > 0 and printErrorList:
     print("\n    -------------------- Error Messages ---------------------")